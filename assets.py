@@ -0,0 +1,151 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from dataclasses import dataclass, field, replace
+from typing import Optional
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, without it only gzip is served
+    brotli = None
+
+
+# long enough that a file has to change to get a new url, short enough to read
+HASH_LENGTH: int = 10
+IMMUTABLE: str = "public, max-age=31536000, immutable"
+REVALIDATE: str = "no-cache"
+
+# encodings in the order they are picked when the client accepts both equally
+ENCODINGS: list[str] = ["br", "gzip"]
+
+
+@dataclass
+class Asset:
+    content_type: str
+    body: bytes
+    etag: str
+    cache_control: str
+    encoded: dict[str, bytes] = field(default_factory=dict)  # encoding -> body
+
+    def negotiate(self, accept_encoding: str) -> tuple[bytes, Optional[str]]:
+        """returns the body and its content encoding (None if not compressed)"""
+        encoding: Optional[str] = choose_encoding(accept_encoding, list(self.encoded))
+        if encoding is None:
+            return self.body, None
+        return self.encoded[encoding], encoding
+
+
+def choose_encoding(accept_encoding: str, available: list[str]) -> Optional[str]:
+    """
+    picks the encoding from `available` with the highest q value in an
+    Accept-Encoding header, None means the identity body
+    """
+    weights: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q: float = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip().lower()] = q
+
+    best: Optional[str] = None
+    best_q: float = 0.0
+    for encoding in ENCODINGS:
+        if encoding not in available:
+            continue
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(body: bytes) -> dict[str, bytes]:
+    """compressed variants that are actually smaller than the body"""
+    encoded: dict[str, bytes] = {"gzip": gzip.compress(body, 9, mtime=0)}
+    if brotli is not None:
+        encoded["br"] = brotli.compress(body, quality=11)
+    return {name: data for name, data in encoded.items() if len(data) < len(body)}
+
+
+def content_hash(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()[:HASH_LENGTH]
+
+
+def hashed_name(name: str, body: bytes) -> str:
+    """script.js -> script.0123456789.js"""
+    stem, extension = os.path.splitext(name)
+    return f"{stem}.{content_hash(body)}{extension}"
+
+
+def make_asset(name: str, body: bytes, cache_control: str) -> Asset:
+    content_type: str = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    if content_type.startswith("text/") or content_type.endswith("javascript"):
+        content_type += "; charset=utf-8"
+    return Asset(
+        content_type, body, f'W/"{content_hash(body)}"', cache_control, compress(body)
+    )
+
+
+class StaticAssets:
+    """
+    the frontend kept in memory, every file other than index.html gets a url with
+    its content hash that can be cached forever, index.html points to those urls
+    """
+
+    def __init__(self, directory: str, prefix: str = "/static/") -> None:
+        self.directory: str = directory
+        self.prefix: str = prefix
+        self.assets: dict[str, Asset] = {}  # url path -> asset
+        self.urls: dict[str, str] = {}  # file name -> hashed url path
+
+    def build(self) -> None:
+        assets: dict[str, Asset] = {}
+        urls: dict[str, str] = {}
+        names: list[str] = sorted(
+            name
+            for name in os.listdir(self.directory)
+            if os.path.isfile(os.path.join(self.directory, name))
+        )
+
+        for name in names:
+            if name == "index.html":
+                continue
+            body: bytes = self.read(name)
+            url: str = self.prefix + hashed_name(name, body)
+            urls[name] = url
+            asset: Asset = make_asset(name, body, IMMUTABLE)
+            assets[url] = asset
+            # the plain url keeps working for pages loaded before a deploy
+            assets["/" + name] = replace(asset, cache_control=REVALIDATE)
+
+        if "index.html" in names:
+            index: bytes = rewrite_references(self.read("index.html"), urls)
+            assets["/"] = make_asset("index.html", index, REVALIDATE)
+
+        self.assets, self.urls = assets, urls
+
+    def read(self, name: str) -> bytes:
+        with open(os.path.join(self.directory, name), "rb") as file:
+            return file.read()
+
+    def get(self, path: str) -> Optional[Asset]:
+        return self.assets.get(path)
+
+
+def rewrite_references(html: bytes, urls: dict[str, str]) -> bytes:
+    """replaces src="/script.js" and href="/style.css" with the hashed urls"""
+
+    def substitute(match: re.Match[bytes]) -> bytes:
+        name: str = match.group(3).decode()
+        url: Optional[str] = urls.get(name)
+        if url is None:
+            return match.group(0)
+        return match.group(1) + match.group(2) + url.encode() + match.group(2)
+
+    return re.sub(rb'((?:src|href)=)(["\'])/?([^"\'/]+)\2', substitute, html)
@@ -0,0 +1,216 @@
+"""
+Latency of every Database method and of the /get_data pipeline on synthetic
+users, each call timed on its own. Results can be saved and compared with a
+saved run, the exit code is 1 when a p50 got slower than the tolerance.
+
+    python benchmarks/bench_database.py [--users N] [--elements M]
+        [--iterations K] [-k name] [--engine sqlite|memory]
+        [--save out.json] [--compare base.json]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from db_stuff import Database, ElementData, ElementFilter, Storage  # noqa: E402
+from memory import MemoryDatabase  # noqa: E402
+from ordering import arrange, three_day_window  # noqa: E402
+from benchmarks.workload import (  # noqa: E402
+    FAST_HASHING,
+    PASSWORD,
+    Summary,
+    format_summary,
+    populate,
+    regressions,
+    save,
+    summarize,
+    username,
+)
+
+
+@dataclass
+class Case:
+    name: str
+    call: Callable[[int], object]  # gets the iteration number
+    setup: Optional[Callable[[int], None]] = None  # untimed, before all calls
+
+
+def element(date: str) -> ElementData:
+    return {
+        "id": 0,
+        "type": "homework",
+        "lesson": "matematyka",
+        "date": date,
+        "comment": "benchmark",
+        "state": "work",
+    }
+
+
+def make_cases(db: Storage, tokens: list[str], now: datetime) -> list[Case]:
+    window: tuple[str, str] = three_day_window(now)
+    today: str = now.strftime("%Y-%m-%d")
+    ids: dict[str, list[int]] = {
+        token: [record.id for record in db.get_element_records(token)]
+        for token in tokens
+    }
+    added: list[tuple[str, int]] = []  # (token, id) for delete_element
+    new_users: list[str] = []  # tokens for delete_user
+
+    def token_of(i: int) -> str:
+        return tokens[i % len(tokens)]
+
+    def add_to_delete(iterations: int) -> None:
+        for i in range(iterations):
+            db.add_element(element(today), token_of(i))
+            added.append((token_of(i), db.get_element_records(token_of(i))[-1].id))
+
+    def add_users(iterations: int) -> None:
+        for i in range(iterations):
+            db.add_user(f"new{i}", PASSWORD)
+            new_users.append(db.get_token_from_credentials(f"new{i}", PASSWORD))
+
+    def cold(function: Callable[[str], object]) -> Callable[[int], object]:
+        def call(i: int) -> object:
+            if isinstance(db, Database):
+                db.ordering_cache.clear()
+                db.token_cache.clear()
+            return function(token_of(i))
+
+        return call
+
+    def get_data(i: int) -> bytes:
+        db.get_data_version(token_of(i))
+        return db.get_elements_json(token_of(i), window)
+
+    def ordered_to_data(i: int) -> list[ElementData]:
+        work, done = db.get_ordered_elements(token_of(i))
+        return [record.to_data() for record in arrange(work, done, now)]
+
+    def first_id(i: int) -> int:
+        user_ids: list[int] = ids[token_of(i)]
+        return user_ids[i % len(user_ids)] if user_ids else 0
+
+    return [
+        Case("is_token_valid", lambda i: db.is_token_valid(token_of(i))),
+        Case("is_token_valid cold", cold(db.is_token_valid)),
+        Case("get_user_id", lambda i: db.get_user_id(token_of(i))),
+        Case("get_data_version", lambda i: db.get_data_version(token_of(i))),
+        Case("get_changes", lambda i: db.get_changes(token_of(i), 1)),
+        Case(
+            "get_elements_from_token", lambda i: db.get_elements_from_token(token_of(i))
+        ),
+        Case("get_element_records", lambda i: db.get_element_records(token_of(i))),
+        Case("iter_elements", lambda i: sum(1 for _ in db.iter_elements(token_of(i)))),
+        Case("get_ordered_elements", lambda i: db.get_ordered_elements(token_of(i))),
+        Case("get_ordered_elements cold", cold(db.get_ordered_elements)),
+        Case("get_elements_json", lambda i: db.get_elements_json(token_of(i), window)),
+        Case(
+            "get_elements_json compact",
+            lambda i: db.get_elements_json(token_of(i), window, True),
+        ),
+        Case(
+            "get_elements_page 50",
+            lambda i: db.get_elements_page(token_of(i), window, limit=50),
+        ),
+        Case(
+            "get_elements_page filtered",
+            lambda i: db.get_elements_page(
+                token_of(i), window, ElementFilter(state="work", type="homework")
+            ),
+        ),
+        Case("/get_data pipeline", get_data),
+        Case("ordered records to dicts", ordered_to_data),
+        Case("add_element", lambda i: db.add_element(element(today), token_of(i))),
+        Case(
+            "add_elements 50",
+            lambda i: db.add_elements([element(today)] * 50, token_of(i)),
+        ),
+        Case(
+            "change_state_of_element",
+            lambda i: db.change_state_of_element(
+                "done" if i % 2 else "work", first_id(i), token_of(i)
+            ),
+        ),
+        Case(
+            "delete_element",
+            lambda i: db.delete_element(*added[i]),
+            add_to_delete,
+        ),
+        Case(
+            "get_token_from_credentials",
+            lambda i: db.get_token_from_credentials(
+                username(i % len(tokens)), PASSWORD
+            ),
+        ),
+        Case("add_user", lambda i: db.add_user(f"bench{i}", PASSWORD)),
+        Case("delete_user", lambda i: db.delete_user(new_users[i]), add_users),
+    ]
+
+
+def run(case: Case, iterations: int) -> Summary:
+    if case.setup is not None:
+        case.setup(iterations)
+    latencies: list[float] = []
+    start: float = time.perf_counter()
+    for i in range(iterations):
+        call_start: float = time.perf_counter()
+        case.call(i)
+        latencies.append(time.perf_counter() - call_start)
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def main() -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--elements", type=int, default=500, help="per user")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("-k", default="", help="only benchmarks with this in the name")
+    parser.add_argument("--engine", choices=["sqlite", "memory"], default="sqlite")
+    parser.add_argument("--save", help="write the results as JSON")
+    parser.add_argument("--compare", help="JSON of an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args: argparse.Namespace = parser.parse_args()
+
+    now: datetime = datetime(2026, 5, 1, 12)
+    db: Storage = (
+        MemoryDatabase(password_hashing=FAST_HASHING)
+        if args.engine == "memory"
+        else Database(
+            os.path.join(tempfile.mkdtemp(), "bench.sqlite"),
+            password_hashing=FAST_HASHING,
+        )
+    )
+    db.init_database()
+    tokens: list[str] = populate(db, args.users, args.elements, now)
+    print(
+        f"{args.users} users x {args.elements} elements,"
+        f" {args.iterations} calls per benchmark"
+    )
+
+    results: dict[str, Summary] = {}
+    for case in make_cases(db, tokens, now):
+        if args.k not in case.name:
+            continue
+        results[case.name] = run(case, args.iterations)
+        print(format_summary(case.name, results[case.name]))
+    db.close()
+
+    if args.save:
+        save(args.save, results)
+    if args.compare:
+        slower: list[str] = regressions(results, args.compare, args.tolerance)
+        for line in slower:
+            print("slower:", line)
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
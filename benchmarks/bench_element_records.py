@@ -0,0 +1,124 @@
+"""
+Memory and CPU of one user's elements held as ElementData dicts against
+Element records, from the rows of the data table to the display order.
+
+    python benchmarks/bench_element_records.py [rows ...]
+"""
+
+import gc
+import os
+import sys
+import timeit
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from db_stuff import Element, ElementData, OrderedElements, to_day  # noqa: E402
+from ordering import arrange  # noqa: E402
+from benchmarks.bench_ordering import generate  # noqa: E402
+from tests.test_ordering import legacy_order  # noqa: E402
+
+
+def to_rows(elements: list[ElementData]) -> list[tuple]:
+    """rows as sqlite3 returns them for dicts, strings not shared with the dicts"""
+    return [
+        (
+            element["id"],
+            "".join(element["type"]),
+            "".join(element["lesson"]),
+            "".join(element["date"]),
+            "".join(element["comment"]),
+            "".join(element["state"]),
+        )
+        for element in elements
+    ]
+
+
+def to_record_rows(elements: list[ElementData]) -> list[tuple]:
+    """rows as sqlite3 returns them for records, with day numbers and done"""
+    return [
+        (
+            element["id"],
+            "".join(element["type"]),
+            "".join(element["lesson"]),
+            to_day(element["date"]),
+            "".join(element["comment"]),
+            int(element["state"] == "done"),
+        )
+        for element in elements
+    ]
+
+
+def to_dicts(rows: list[tuple]) -> list[ElementData]:
+    return [
+        {
+            "id": row[0],
+            "type": row[1],
+            "lesson": row[2],
+            "date": row[3],
+            "comment": row[4],
+            "state": row[5],
+        }
+        for row in rows
+    ]
+
+
+def to_records(rows: list[tuple]) -> list[Element]:
+    return [Element.from_row(row) for row in rows]
+
+
+def allocated(build: Callable[[], Any]) -> tuple[Any, int]:
+    """returns what build made and the bytes it still holds"""
+    gc.collect()
+    tracemalloc.start()
+    result: Any = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+
+def measure(function: Callable[[], object]) -> float:
+    """returns the best time of a few runs in milliseconds"""
+    runs: list[float] = timeit.repeat(function, number=1, repeat=5)
+    return min(runs) * 1000
+
+
+def main() -> None:
+    sizes: list[int] = [int(arg) for arg in sys.argv[1:]] or [100_000]
+    now: datetime = datetime(2026, 5, 1, 12)
+
+    for rows_count in sizes:
+        elements: list[ElementData] = generate(rows_count, now)
+        rows: list[tuple] = to_rows(elements)
+        record_rows: list[tuple] = to_record_rows(elements)
+        dicts, dicts_size = allocated(lambda: to_dicts(rows))
+        records, records_size = allocated(lambda: to_records(record_rows))
+        ordered: OrderedElements = OrderedElements(records)
+        _, ordered_size = allocated(lambda: OrderedElements(records))
+
+        print(f"{rows_count} elements")
+        print(f"  dicts:                   {dicts_size / 2**20:8.2f} MiB")
+        print(f"  records:                 {records_size / 2**20:8.2f} MiB")
+        print(f"  OrderedElements on top:  {ordered_size / 2**20:8.2f} MiB")
+        print(f"  rows -> dicts:           {measure(lambda: to_dicts(rows)):8.2f} ms")
+        print(
+            f"  rows -> records:         {measure(lambda: to_records(record_rows)):8.2f} ms"
+        )
+        print(
+            "  legacy_order(dicts):     "
+            f"{measure(lambda: legacy_order(dicts, now)):8.2f} ms"
+        )
+        print(
+            "  OrderedElements(records):"
+            f"{measure(lambda: OrderedElements(records)):8.2f} ms"
+        )
+        print(
+            "  arrange cached records:  "
+            f"{measure(lambda: arrange(ordered.work, ordered.done, now)):8.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
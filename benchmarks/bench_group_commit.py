@@ -0,0 +1,69 @@
+"""
+Write throughput of many concurrent add_element calls with and without the
+group commit writer. Uses synchronous=FULL so every commit is an fsync.
+
+    python benchmarks/bench_group_commit.py [writers] [writes per writer]
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from db_stuff import Database, ElementData, GroupCommit, StorageProfile  # noqa: E402
+
+PROFILE: StorageProfile = StorageProfile(synchronous="FULL")
+ELEMENT: ElementData = {
+    "id": 0,
+    "type": "homework",
+    "lesson": "matematyka",
+    "date": "2026-09-01",
+    "comment": "benchmark",
+    "state": "work",
+}
+
+
+def run(group_commit: Optional[GroupCommit], writers: int, writes: int) -> float:
+    """returns writes per second"""
+    path: str = os.path.join(tempfile.mkdtemp(), "bench.sqlite")
+    db: Database = Database(path, writers, PROFILE, group_commit=group_commit)
+    db.init_database()
+    db.add_user("user", "password")
+    token: str = db.get_token_from_credentials("user", "password")
+
+    def writer() -> None:
+        for _ in range(writes):
+            db.add_element(ELEMENT, token)
+
+    threads: list[threading.Thread] = [
+        threading.Thread(target=writer) for _ in range(writers)
+    ]
+    start: float = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed: float = time.perf_counter() - start
+
+    db.close()
+    return writers * writes / elapsed
+
+
+def main() -> None:
+    writers: int = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    writes: int = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    print(f"{writers} writers x {writes} writes")
+    for name, group_commit in (
+        ("commit per write", None),
+        ("group commit", GroupCommit()),
+    ):
+        print(f"{name:>18}: {run(group_commit, writers, writes):10.0f} writes/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Body of a full /get_data response: the response_model path FastAPI takes
+for a list of dicts (validation, conversion to JSON types, json.dumps)
+against Database.get_elements_json, which joins the cached JSON of cached
+records, cold (after a restart) and warm.
+
+    python benchmarks/bench_json_response.py [rows ...]
+"""
+
+import json
+import os
+import sys
+import tempfile
+import timeit
+from datetime import datetime
+from typing import Callable
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from pydantic import TypeAdapter  # noqa: E402
+
+from db_stuff import Database, ElementData  # noqa: E402
+from ordering import arrange, three_day_window  # noqa: E402
+from benchmarks.bench_ordering import generate  # noqa: E402
+
+adapter: TypeAdapter[list[ElementData]] = TypeAdapter(list[ElementData])
+
+
+def response_model_body(data: list[ElementData]) -> bytes:
+    """what FastAPI does with the list returned by get_data"""
+    content = adapter.dump_python(adapter.validate_python(data), mode="json")
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode()
+
+
+def measure(function: Callable[[], object]) -> float:
+    """returns the best time of a few runs in milliseconds"""
+    runs: list[float] = timeit.repeat(function, number=1, repeat=5)
+    return min(runs) * 1000
+
+
+def main() -> None:
+    sizes: list[int] = [int(arg) for arg in sys.argv[1:]] or [1_000, 10_000, 100_000]
+    now: datetime = datetime(2026, 5, 1, 12)
+    window: tuple[str, str] = three_day_window(now)
+
+    for rows in sizes:
+        directory: str = tempfile.mkdtemp()
+        db: Database = Database(os.path.join(directory, "bench.sqlite"))
+        db.init_database()
+        db.add_user("bench", "bench")
+        token: str = db.get_token_from_credentials("bench", "bench")
+        db.add_elements(generate(rows, now), token)
+
+        def cold_records() -> bytes:
+            db.ordering_cache.clear()
+            work, done = db.get_ordered_elements(token)
+            return response_model_body(
+                [element.to_data() for element in arrange(work, done, now)]
+            )
+
+        def cached_records() -> bytes:
+            work, done = db.get_ordered_elements(token)
+            return response_model_body(
+                [element.to_data() for element in arrange(work, done, now)]
+            )
+
+        sizes_kb: str = ", ".join(
+            f"{len(db.get_elements_json(token, window, compact)) // 1024} KiB"
+            for compact in (False, True)
+        )
+        print(f"{rows} rows (objects, compact: {sizes_kb})")
+        print(f"  records + response_model:        {measure(cold_records):8.2f} ms")
+        print(f"  cached records + response_model: {measure(cached_records):8.2f} ms")
+
+        def cold_json() -> bytes:
+            # records read again carry no JSON yet
+            db.ordering_cache.clear()
+            return db.get_elements_json(token, window)
+
+        print(f"  get_elements_json cold:          {measure(cold_json):8.2f} ms")
+        print(
+            "  get_elements_json objects:       "
+            f"{measure(lambda: db.get_elements_json(token, window)):8.2f} ms"
+        )
+        print(
+            "  get_elements_json arrays:        "
+            f"{measure(lambda: db.get_elements_json(token, window, True)):8.2f} ms"
+        )
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
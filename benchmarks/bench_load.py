@@ -0,0 +1,239 @@
+"""
+In-process load test of the FastAPI app: virtual users, each with its own
+cookie, send a mix of requests through an ASGI client for a while and the
+latency of every kind of request is reported. Runs against a fresh database
+in a temporary directory, the server is set up as configured in server.py.
+
+    python benchmarks/bench_load.py [--users N] [--elements M] [--duration S]
+        [--fast-hashing] [--save out.json] [--compare base.json]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Awaitable, Callable
+
+ROOT: str = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)  # the app builds ./frontend on startup
+
+import httpx  # noqa: E402
+
+import server  # noqa: E402
+from benchmarks.workload import (  # noqa: E402
+    FAST_HASHING,
+    PASSWORD,
+    Summary,
+    format_summary,
+    populate,
+    regressions,
+    save,
+    summarize,
+    username,
+)
+
+
+@dataclass
+class VirtualUser:
+    client: httpx.AsyncClient
+    rng: random.Random
+    etag: str = ""
+    version: int = 0
+    ids: list[int] = field(default_factory=list)
+
+
+Operation = Callable[[VirtualUser], Awaitable[httpx.Response]]
+
+
+async def get_data(user: VirtualUser) -> httpx.Response:
+    response: httpx.Response = await user.client.get("/get_data")
+    if response.status_code == 200:
+        user.etag = response.headers["ETag"]
+        user.version = int(response.headers["X-Data-Version"])
+        user.ids = [element["id"] for element in response.json()]
+    return response
+
+
+async def revalidate(user: VirtualUser) -> httpx.Response:
+    """what the frontend does when it comes back to the page"""
+    if not user.etag:
+        return await get_data(user)
+    return await user.client.get("/get_data", headers={"If-None-Match": user.etag})
+
+
+async def get_page(user: VirtualUser) -> httpx.Response:
+    return await user.client.get("/get_data", params={"state": "work", "limit": 50})
+
+
+async def changes(user: VirtualUser) -> httpx.Response:
+    response: httpx.Response = await user.client.get(
+        "/changes", params={"since": user.version}
+    )
+    if response.status_code == 200:
+        user.version = response.json()["version"]
+    return response
+
+
+async def add_data(user: VirtualUser) -> httpx.Response:
+    day: date = date.today() + timedelta(days=user.rng.randint(-3, 14))
+    return await user.client.post(
+        "/add_data",
+        json={
+            "id": 0,
+            "type": user.rng.choice(["homework", "kartk", "sprawdz"]),
+            "lesson": "matematyka",
+            "date": day.isoformat(),
+            "comment": "load test",
+            "state": "work",
+        },
+    )
+
+
+async def change_state(user: VirtualUser) -> httpx.Response:
+    if not user.ids:
+        return await get_data(user)
+    return await user.client.post(
+        "/change_state",
+        json={
+            "state": user.rng.choice(["work", "done"]),
+            "id": user.rng.choice(user.ids),
+        },
+    )
+
+
+async def delete_data(user: VirtualUser) -> httpx.Response:
+    if not user.ids:
+        return await get_data(user)
+    id: int = user.ids.pop(user.rng.randrange(len(user.ids)))
+    return await user.client.delete("/delete_data", params={"id": id})
+
+
+# operation -> weight, mostly reads like a class checking their homework
+MIX: dict[str, tuple[Operation, int]] = {
+    "GET /get_data": (get_data, 20),
+    "GET /get_data If-None-Match": (revalidate, 35),
+    "GET /get_data?limit=50": (get_page, 10),
+    "GET /changes": (changes, 15),
+    "POST /add_data": (add_data, 10),
+    "POST /change_state": (change_state, 7),
+    "DELETE /delete_data": (delete_data, 3),
+}
+
+
+async def run_user(
+    user: VirtualUser, deadline: float, latencies: dict[str, list[float]]
+) -> int:
+    """sends requests until the deadline, returns how many failed"""
+    names: list[str] = list(MIX)
+    weights: list[int] = [MIX[name][1] for name in names]
+    errors: int = 0
+    while time.perf_counter() < deadline:
+        name: str = user.rng.choices(names, weights)[0]
+        start: float = time.perf_counter()
+        response: httpx.Response = await MIX[name][0](user)
+        latencies[name].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            errors += 1
+    return errors
+
+
+async def load(
+    users: int, elements: int, duration: float
+) -> tuple[dict[str, Summary], int]:
+    server.db.close()  # never opened, the one at server.DB_PATH
+    server.db = server.open_database(os.path.join(tempfile.mkdtemp(), "load.sqlite"))
+    transport: httpx.ASGITransport = httpx.ASGITransport(app=server.app)
+    async with server.lifespan(server.app):
+        populate(server.db.database, users, elements)
+        clients: list[httpx.AsyncClient] = [
+            httpx.AsyncClient(transport=transport, base_url="http://load-test")
+            for _ in range(users)
+        ]
+
+        login_latencies: list[float] = []
+
+        async def login(client: httpx.AsyncClient, user: int) -> None:
+            start: float = time.perf_counter()
+            response: httpx.Response = await client.post(
+                "/login", json={"username": username(user), "password": PASSWORD}
+            )
+            response.raise_for_status()
+            login_latencies.append(time.perf_counter() - start)
+
+        start: float = time.perf_counter()
+        await asyncio.gather(*(login(client, i) for i, client in enumerate(clients)))
+        results: dict[str, Summary] = {
+            "POST /login": summarize(login_latencies, time.perf_counter() - start)
+        }
+
+        latencies: dict[str, list[float]] = {name: [] for name in MIX}
+        start = time.perf_counter()
+        errors: list[int] = await asyncio.gather(
+            *(
+                run_user(
+                    VirtualUser(client, random.Random(i)),
+                    start + duration,
+                    latencies,
+                )
+                for i, client in enumerate(clients)
+            )
+        )
+        elapsed: float = time.perf_counter() - start
+
+        all_latencies: list[float] = []
+        for name, values in latencies.items():
+            if values:
+                results[name] = summarize(values, elapsed)
+                all_latencies += values
+        results["all requests"] = summarize(all_latencies, elapsed)
+        for client in clients:
+            await client.aclose()
+    return results, sum(errors)
+
+
+def main() -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20, help="concurrent clients")
+    parser.add_argument("--elements", type=int, default=300, help="per user")
+    parser.add_argument("--duration", type=float, default=10, help="seconds")
+    parser.add_argument(
+        "--fast-hashing",
+        action="store_true",
+        help="cheap password hashes, logins and seeding many users get fast",
+    )
+    parser.add_argument("--save", help="write the results as JSON")
+    parser.add_argument("--compare", help="JSON of an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args: argparse.Namespace = parser.parse_args()
+
+    if args.fast_hashing:
+        server.PASSWORD_HASHING = FAST_HASHING
+    print(
+        f"{args.users} users x {args.elements} elements for {args.duration:g} s,"
+        f" {server.DB_READERS} reader threads, {os.cpu_count()} cpus"
+    )
+    results, errors = asyncio.run(load(args.users, args.elements, args.duration))
+    for name, summary in results.items():
+        print(format_summary(name, summary))
+    print(f"  errors: {errors}")
+
+    if args.save:
+        save(args.save, results)
+    if args.compare:
+        slower: list[str] = regressions(results, args.compare, args.tolerance)
+        for line in slower:
+            print("slower:", line)
+        if slower:
+            sys.exit(1)
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Login throughput of AsyncDatabase with scrypt password hashes, and the
+latency of data reads while a burst of logins is being verified, with
+the hashes checked on the reader threads (as before the hasher pool) or
+on the hasher threads.
+
+    python benchmarks/bench_login.py [logins] [n ...]
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Awaitable, Callable
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from db_stuff import AsyncDatabase, Database, PasswordHashing  # noqa: E402
+from ordering import three_day_window  # noqa: E402
+from benchmarks.bench_ordering import generate  # noqa: E402
+
+READERS: int = 4
+USERS: int = 16
+
+
+def make_database(directory: str, cost: PasswordHashing, hashers: int) -> AsyncDatabase:
+    database: Database = Database(
+        tempfile.mktemp(".sqlite", dir=directory),
+        pool_size=READERS + 1,
+        password_hashing=cost,
+    )
+    database.init_database()
+    for user in range(USERS):
+        database.add_user(f"user{user}", "password")
+    token: str = database.get_token_from_credentials("user0", "password")
+    database.add_elements(generate(1000, datetime(2026, 5, 1, 12)), token)
+    return AsyncDatabase(database, readers=READERS, hashers=hashers)
+
+
+async def login_on_readers(db: AsyncDatabase, username: str) -> str:
+    """the login path before the hasher threads, everything on a reader thread"""
+    return await db._read(db.database.get_token_from_credentials, username, "password")
+
+
+async def login_on_hashers(db: AsyncDatabase, username: str) -> str:
+    return await db.get_token_from_credentials(username, "password")
+
+
+async def burst(
+    db: AsyncDatabase,
+    logins: int,
+    login: Callable[[AsyncDatabase, str], Awaitable[str]],
+) -> tuple[float, list[float]]:
+    """returns logins per second and latencies in ms of reads made meanwhile"""
+    token: str = await db.get_token_from_credentials("user0", "password")
+    window: tuple[str, str] = three_day_window(datetime(2026, 5, 1, 12))
+    latencies: list[float] = []
+    done: asyncio.Event = asyncio.Event()
+
+    async def reads() -> None:
+        while not done.is_set():
+            start: float = time.perf_counter()
+            await db.get_elements_json(token, window)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    reader: asyncio.Task = asyncio.create_task(reads())
+    start: float = time.perf_counter()
+    await asyncio.gather(*(login(db, f"user{i % USERS}") for i in range(logins)))
+    elapsed: float = time.perf_counter() - start
+    done.set()
+    await reader
+    return logins / elapsed, latencies
+
+
+def percentile(values: list[float], q: int) -> float:
+    return statistics.quantiles(values, n=100)[q - 1] if len(values) > 1 else values[0]
+
+
+async def main() -> None:
+    logins: int = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    costs: list[int] = [int(arg) for arg in sys.argv[2:]] or [2**12, 2**14]
+    directory: str = tempfile.mkdtemp()
+    print(
+        f"{logins} concurrent logins, {READERS} reader threads, {os.cpu_count()} cpus"
+    )
+
+    for n in costs:
+        cost: PasswordHashing = PasswordHashing(n=n)
+        for name, hashers, login in (
+            ("on readers", 1, login_on_readers),
+            ("1 hasher", 1, login_on_hashers),
+            ("2 hashers", 2, login_on_hashers),
+            ("4 hashers", 4, login_on_hashers),
+        ):
+            db: AsyncDatabase = make_database(directory, cost, hashers)
+            rate, latencies = await burst(db, logins, login)
+            print(
+                f"  n={n:<6} {name:<11} {rate:8.1f} logins/s   reads during burst:"
+                f" {len(latencies):5} p50 {percentile(latencies, 50):7.2f} ms"
+                f" p99 {percentile(latencies, 99):7.2f} ms"
+            )
+            db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
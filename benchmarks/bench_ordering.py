@@ -0,0 +1,59 @@
+"""
+Ordering of one user's elements: the old chained helpers against
+ordering.arrange on cached partitions.
+
+    python benchmarks/bench_ordering.py [rows ...]
+"""
+
+import os
+import random
+import sys
+import timeit
+from datetime import datetime
+from typing import Callable
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from db_stuff import Element, ElementData, OrderedElements  # noqa: E402
+from ordering import arrange  # noqa: E402
+from tests.test_ordering import legacy_order, random_elements  # noqa: E402
+
+
+def generate(rows: int, now: datetime) -> list[ElementData]:
+    rng: random.Random = random.Random(rows)
+    elements: list[ElementData] = []
+    while len(elements) < rows:
+        elements.extend(random_elements(rng, now))
+    elements = elements[:rows]
+    for id, element in enumerate(elements, start=1):
+        element["id"] = id
+    return elements
+
+
+def measure(function: Callable[[], object]) -> float:
+    """returns the best time of a few runs in milliseconds"""
+    runs: list[float] = timeit.repeat(function, number=1, repeat=5)
+    return min(runs) * 1000
+
+
+def main() -> None:
+    sizes: list[int] = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000]
+    now: datetime = datetime(2026, 5, 1, 12)
+
+    for rows in sizes:
+        elements: list[ElementData] = generate(rows, now)
+        ordered: OrderedElements = OrderedElements(
+            [Element.from_data(element) for element in elements]
+        )
+
+        print(f"{rows} rows")
+        print(
+            f"  legacy chain:     {measure(lambda: legacy_order(elements, now)):8.2f} ms"
+        )
+        print(
+            f"  cached + arrange: {measure(lambda: arrange(ordered.work, ordered.done, now)):8.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Mixed read/write throughput of Database under different storage profiles.
+
+Every simulated user runs in its own thread (like requests on the FastAPI
+threadpool) and does mostly reads with some writes in between.
+
+    python benchmarks/bench_storage_profile.py [users] [operations per user]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from db_stuff import (  # noqa: E402
+    DEFAULT_PROFILE,
+    ROLLBACK_PROFILE,
+    Database,
+    ElementData,
+    StorageProfile,
+)
+
+WRITE_RATIO: float = 0.2
+
+
+def make_element(rng: random.Random) -> ElementData:
+    return {
+        "id": 0,
+        "type": rng.choice(["homework", "kartk", "sprawdz"]),
+        "lesson": rng.choice(["polski", "matematyka", "fizyka", "historia"]),
+        "date": f"2026-{rng.randint(1, 12):02}-{rng.randint(1, 28):02}",
+        "comment": "benchmark",
+        "state": "work",
+    }
+
+
+def run(profile: StorageProfile, users: int, operations: int) -> float:
+    """returns operations per second"""
+    with tempfile.TemporaryDirectory() as directory:
+        db: Database = Database(os.path.join(directory, "bench.sqlite"), users, profile)
+        db.init_database()
+
+        rng: random.Random = random.Random(0)
+        tokens: list[str] = []
+        for i in range(users):
+            db.add_user(f"user{i}", "password")
+            tokens.append(db.get_token_from_credentials(f"user{i}", "password"))
+            for _ in range(20):
+                db.add_element(make_element(rng), tokens[-1])
+
+        def user(token: str, seed: int) -> None:
+            rng: random.Random = random.Random(seed)
+            for _ in range(operations):
+                if rng.random() < WRITE_RATIO:
+                    db.add_element(make_element(rng), token)
+                else:
+                    db.get_elements_from_token(token)
+
+        threads: list[threading.Thread] = [
+            threading.Thread(target=user, args=(token, i))
+            for i, token in enumerate(tokens)
+        ]
+        start: float = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed: float = time.perf_counter() - start
+
+        db.close()
+    return users * operations / elapsed
+
+
+def main() -> None:
+    users: int = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    operations: int = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    print(f"{users} users x {operations} operations, {WRITE_RATIO:.0%} writes")
+    for name, profile in (("rollback", ROLLBACK_PROFILE), ("wal", DEFAULT_PROFILE)):
+        print(f"{name:>10}: {run(profile, users, operations):10.0f} ops/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Throughput of /get_data over real HTTP with 1, 2, 4, ... worker processes
+started through server.run, driven by several client processes so the
+client is not what runs out of CPU first. The clients share the machine with
+the workers and take some of its cores, so the speedup measured here is
+below what the workers reach with clients elsewhere.
+
+    python benchmarks/bench_workers.py [--workers 1 2 4] [--clients C]
+        [--connections K] [--duration S] [--users N] [--elements M]
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT: str = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, ROOT)
+
+from db_stuff import Database  # noqa: E402
+from benchmarks.workload import (  # noqa: E402
+    FAST_HASHING,
+    Summary,
+    format_summary,
+    populate,
+    summarize,
+)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workers: int, port: int, database: str) -> subprocess.Popen:
+    process: subprocess.Popen = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.join(ROOT, "server.py"),
+            f"--workers={workers}",
+            "--host=127.0.0.1",
+            f"--port={port}",
+            f"--database={database}",
+        ],
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline: float = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/valid", timeout=1)
+            # every worker has to be up, not only the first one answering
+            time.sleep(1 + workers * 0.5)
+            return process
+        except httpx.TransportError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("the server did not start")
+
+
+def stop_server(process: subprocess.Popen) -> None:
+    process.send_signal(signal.SIGINT)
+    try:
+        process.wait(30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+async def drive(
+    url: str, tokens: list[str], connections: int, duration: float
+) -> list[float]:
+    """sends /get_data requests on `connections` connections, returns latencies"""
+    latencies: list[float] = []
+    deadline: float = time.perf_counter() + duration
+
+    async def connection(token: str) -> None:
+        async with httpx.AsyncClient(
+            base_url=url, cookies={"token": token}, timeout=30
+        ) as client:
+            while time.perf_counter() < deadline:
+                start: float = time.perf_counter()
+                response: httpx.Response = await client.get("/get_data")
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(
+        *(connection(tokens[i % len(tokens)]) for i in range(connections))
+    )
+    return latencies
+
+
+def client_process(args: tuple[str, list[str], int, float]) -> list[float]:
+    return asyncio.run(drive(*args))
+
+
+def main() -> None:
+    cpus: int = os.cpu_count() or 1
+    parser: argparse.ArgumentParser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=[n for n in (1, 2, 4, 8, 16) if n <= max(cpus, 1)],
+    )
+    parser.add_argument("--clients", type=int, default=max(cpus // 2, 1))
+    parser.add_argument("--connections", type=int, default=16, help="per client")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--elements", type=int, default=200, help="per user")
+    args: argparse.Namespace = parser.parse_args()
+
+    database_path: str = os.path.join(tempfile.mkdtemp(), "workers.sqlite")
+    database: Database = Database(database_path, password_hashing=FAST_HASHING)
+    database.init_database()
+    tokens: list[str] = populate(database, args.users, args.elements)
+    database.close()
+    print(
+        f"{args.users} users x {args.elements} elements, {args.clients} client"
+        f" processes x {args.connections} connections, {cpus} cpus"
+    )
+
+    baseline: float = 0.0
+    for workers in args.workers:
+        port: int = free_port()
+        server: subprocess.Popen = start_server(workers, port, database_path)
+        try:
+            with multiprocessing.Pool(args.clients) as pool:
+                start: float = time.perf_counter()
+                results: list[list[float]] = pool.map(
+                    client_process,
+                    [
+                        (
+                            f"http://127.0.0.1:{port}",
+                            tokens,
+                            args.connections,
+                            args.duration,
+                        )
+                    ]
+                    * args.clients,
+                )
+                elapsed: float = time.perf_counter() - start
+        finally:
+            stop_server(server)
+
+        latencies: list[float] = [value for result in results for value in result]
+        summary: Summary = summarize(latencies, elapsed)
+        baseline = baseline or summary["per_second"]
+        print(
+            format_summary(f"{workers} workers", summary)
+            + f"  {summary['per_second'] / baseline:5.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Synthetic users and elements for the benchmarks, and latency summaries.
+Seeded, so two runs with the same sizes work on the same data.
+"""
+
+import json
+import os
+import random
+import statistics
+import sys
+from datetime import datetime
+from typing import Optional, TypedDict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from db_stuff import ElementData, PasswordHashing, Storage  # noqa: E402
+from benchmarks.bench_ordering import generate  # noqa: E402
+
+# cheap enough that seeding many users does not take minutes, logins measured
+# with it show the cost of everything around the hash
+FAST_HASHING: PasswordHashing = PasswordHashing(n=2**4)
+PASSWORD: str = "password"
+
+
+class Summary(TypedDict):
+    count: int
+    p50_ms: float
+    p99_ms: float
+    mean_ms: float
+    per_second: float  # calls finished per second of wall time
+
+
+def username(user: int) -> str:
+    return f"user{user}"
+
+
+def user_elements(user: int, elements: int, now: datetime) -> list[ElementData]:
+    """`elements` of one user around `now`, different for every user"""
+    data: list[ElementData] = generate(elements, now)
+    random.Random(user).shuffle(data)
+    return data
+
+
+def populate(
+    database: Storage, users: int, elements: int, now: Optional[datetime] = None
+) -> list[str]:
+    """adds `users` users with `elements` elements each, returns their tokens"""
+    now = now or datetime.now()
+    tokens: list[str] = []
+    for user in range(users):
+        database.add_user(username(user), PASSWORD)
+        token: str = database.get_token_from_credentials(username(user), PASSWORD)
+        if elements:
+            database.add_elements(user_elements(user, elements, now), token)
+        tokens.append(token)
+    return tokens
+
+
+def percentile(values: list[float], q: int) -> float:
+    return statistics.quantiles(values, n=100)[q - 1] if len(values) > 1 else values[0]
+
+
+def summarize(latencies: list[float], elapsed: float) -> Summary:
+    """latencies in seconds, elapsed is the wall time they were taken in"""
+    return {
+        "count": len(latencies),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "per_second": len(latencies) / elapsed if elapsed else 0.0,
+    }
+
+
+def format_summary(name: str, summary: Summary) -> str:
+    return (
+        f"  {name:<36} {summary['count']:7}  p50 {summary['p50_ms']:8.3f} ms"
+        f"  p99 {summary['p99_ms']:8.3f} ms  {summary['per_second']:10.1f}/s"
+    )
+
+
+def save(path: str, results: dict[str, Summary]) -> None:
+    with open(path, "w") as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+
+
+def regressions(
+    results: dict[str, Summary], baseline_path: str, tolerance: float
+) -> list[str]:
+    """
+    benchmarks whose p50 grew by more than `tolerance` (0.25 is 25%) against a
+    saved run, p99 is too noisy on a shared machine to fail on
+    """
+    with open(baseline_path) as file:
+        baseline: dict[str, Summary] = json.load(file)
+    slower: list[str] = []
+    for name, summary in sorted(results.items()):
+        before: Optional[Summary] = baseline.get(name)
+        if before is None or before["p50_ms"] <= 0:
+            continue
+        ratio: float = summary["p50_ms"] / before["p50_ms"]
+        if ratio > 1 + tolerance:
+            slower.append(
+                f"{name}: p50 {before['p50_ms']:.3f} ms -> "
+                f"{summary['p50_ms']:.3f} ms ({ratio:.2f}x)"
+            )
+    return slower
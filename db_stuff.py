@@ -1,7 +1,38 @@
+import asyncio
+import base64
+import bisect
+import functools
+import hashlib
+import hmac
+import json
+import operator
+import os
+import queue
 import sqlite3
+import threading
+import time
 import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import date
 from sqlite3 import Connection, Cursor
-from typing import Any, Literal, Optional, TypedDict
+from typing import (
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    Literal,
+    Optional,
+    Protocol,
+    TypeVar,
+    cast,
+    get_args,
+)
+
+# pydantic needs this one to validate request bodies on python < 3.12
+from typing_extensions import TypedDict
 
 LessonTypes = Literal[
     "niemiecki",
@@ -29,7 +60,7 @@ class ElementData(TypedDict):
     id: int
     type: Literal["homework", "kartk", "sprawdz"]
     lesson: LessonTypes
-    date: str  # "1232-12-31"
+    date: str  # "1232-12-31", a real day
     comment: str
     state: Literal["work", "done"]
 
@@ -38,121 +69,1541 @@ class InvalidCredentialsError(LookupError):
     """Raised when user with  some credentials is not found"""
 
 
-class Database:
-    def __init__(self, dbPath: str) -> None:
+class InvalidTokenError(LookupError):
+    """Raised when no user has the given token"""
+
+
+JournalMode = Literal["DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"]
+SynchronousMode = Literal["OFF", "NORMAL", "FULL", "EXTRA"]
+
+
+@dataclass(frozen=True)
+class StorageProfile:
+    """PRAGMA settings applied to every connection handed out by the pool.
+
+    The default profile puts the database in WAL mode so readers are not
+    blocked by a writer, and relaxes fsyncs to once per checkpoint.
+    """
+
+    journal_mode: JournalMode = "WAL"
+    synchronous: SynchronousMode = "NORMAL"
+    busy_timeout: int = 5000  # milliseconds
+    mmap_size: int = 64 * 1024 * 1024  # bytes
+    cache_size: int = -16 * 1024  # negative means KiB, positive means pages
+
+    def __post_init__(self) -> None:
+        if self.journal_mode not in get_args(JournalMode):
+            raise ValueError(f"unknown journal_mode {self.journal_mode!r}")
+        if self.synchronous not in get_args(SynchronousMode):
+            raise ValueError(f"unknown synchronous mode {self.synchronous!r}")
+
+    def apply(self, conn: Connection) -> None:
+        conn.execute(f"PRAGMA journal_mode = {self.journal_mode}")
+        conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size = {int(self.cache_size)}")
+
+
+DEFAULT_PROFILE: StorageProfile = StorageProfile()
+# sqlite defaults, what every connection used before profiles existed
+ROLLBACK_PROFILE: StorageProfile = StorageProfile(
+    journal_mode="DELETE",
+    synchronous="FULL",
+    busy_timeout=5000,
+    mmap_size=0,
+    cache_size=-2000,
+)
+
+
+T = TypeVar("T")
+
+
+class DatabaseStats:
+    """Calls, failures and time per Database method and the statements sqlite ran.
+
+    Methods calling other methods are counted in both, like cumulative time in
+    a profiler. Statements are counted by their first keyword with the time
+    spent in execute, rows fetched afterwards count towards the method only.
+    """
+
+    def __init__(self) -> None:
+        self.calls: dict[str, int] = {}
+        self.errors: dict[str, int] = {}
+        self.seconds: dict[str, float] = {}
+        self.statements: dict[str, int] = {}
+        self.statement_seconds: dict[str, float] = {}
+        self.caches: list[tuple[str, "TokenCache"]] = []
+        self._lock: threading.Lock = threading.Lock()
+
+    def add_cache(self, name: str, cache: "TokenCache") -> None:
+        """reports the counts of `cache`, added up with other caches of the name"""
+        with self._lock:
+            self.caches.append((name, cache))
+
+    def record_call(self, method: str, seconds: float, failed: bool) -> None:
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            self.seconds[method] = self.seconds.get(method, 0.0) + seconds
+            if failed:
+                self.errors[method] = self.errors.get(method, 0) + 1
+
+    def record_statement(self, sql: str, seconds: float) -> None:
+        words: list[str] = sql.split(None, 1)
+        kind: str = words[0].upper() if words else "EMPTY"
+        with self._lock:
+            self.statements[kind] = self.statements.get(kind, 0) + 1
+            self.statement_seconds[kind] = (
+                self.statement_seconds.get(kind, 0.0) + seconds
+            )
+
+    def snapshot(self) -> dict[str, dict[str, float]]:
+        with self._lock:
+            snapshot: dict[str, dict[str, float]] = {
+                "calls": dict(self.calls),
+                "errors": dict(self.errors),
+                "seconds": dict(self.seconds),
+                "statements": dict(self.statements),
+                "statement_seconds": dict(self.statement_seconds),
+                "cache_hits": {},
+                "cache_misses": {},
+                "cache_entries": {},
+            }
+            caches: list[tuple[str, TokenCache]] = list(self.caches)
+        for name, cache in caches:
+            counts: dict[str, int] = cache.stats()
+            for key, count in (
+                ("cache_hits", counts["hits"]),
+                ("cache_misses", counts["misses"]),
+                ("cache_entries", counts["size"]),
+            ):
+                snapshot[key][name] = snapshot[key].get(name, 0) + count
+        return snapshot
+
+
+def timed(method: Callable[..., T]) -> Callable[..., T]:
+    """records every call of a Storage method in its `stats`"""
+    name: str = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self: "Storage", *args: Any, **kwargs: Any) -> T:
+        start: float = time.perf_counter()
+        failed: bool = True
+        try:
+            result: T = method(self, *args, **kwargs)
+            failed = False
+            return result
+        finally:
+            self.stats.record_call(name, time.perf_counter() - start, failed)
+
+    return wrapper
+
+
+class TracedCursor(sqlite3.Cursor):
+    """cursor reporting the statements it runs to the stats of its connection"""
+
+    connection: "TracedConnection"
+
+    def execute(self, sql: str, parameters: Any = (), /) -> "TracedCursor":
+        start: float = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self.connection.stats.record_statement(sql, time.perf_counter() - start)
+
+    def executemany(self, sql: str, parameters: Iterable[Any], /) -> "TracedCursor":
+        start: float = time.perf_counter()
+        try:
+            return super().executemany(sql, parameters)
+        finally:
+            self.connection.stats.record_statement(sql, time.perf_counter() - start)
+
+
+class TracedConnection(sqlite3.Connection):
+    """connection whose cursors are TracedCursors"""
+
+    stats: DatabaseStats
+
+    def cursor(self, factory: Any = TracedCursor) -> Any:
+        return super().cursor(factory)
+
+    # the shortcuts of sqlite3.Connection make plain cursors, not self.cursor()
+    def execute(self, sql: str, parameters: Any = (), /) -> TracedCursor:
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql: str, parameters: Iterable[Any], /) -> TracedCursor:
+        return self.cursor().executemany(sql, parameters)
+
+
+class ConnectionPool:
+    """Bounded pool of long-lived sqlite connections shared between threads.
+
+    Connections are opened lazily up to `size` and handed back to the pool
+    after use, so a request reuses an already opened connection instead of
+    paying the connect cost every time. When all connections are busy the
+    caller waits until one is released.
+    """
+
+    def __init__(
+        self,
+        dbPath: str,
+        size: int = 5,
+        profile: StorageProfile = DEFAULT_PROFILE,
+        stats: Optional[DatabaseStats] = None,
+    ) -> None:
+        if size < 1:
+            raise ValueError("pool size must be at least 1")
         self.dbPath: str = dbPath
+        self.size: int = size
+        self.profile: StorageProfile = profile
+        self.stats: Optional[DatabaseStats] = stats
+        self._idle: queue.LifoQueue[Connection] = queue.LifoQueue(maxsize=size)
+        self._lock: threading.Lock = threading.Lock()
+        self._opened: int = 0
+        self._generation: int = 0
+        self._born: dict[Connection, int] = {}
+
+    def _connect(self) -> Connection:
+        conn: Connection = sqlite3.connect(
+            self.dbPath,
+            timeout=self.profile.busy_timeout / 1000,
+            check_same_thread=False,
+            factory=Connection if self.stats is None else TracedConnection,
+        )
+        if self.stats is not None:
+            cast(TracedConnection, conn).stats = self.stats
+        self.profile.apply(conn)
+        return conn
+
+    def acquire(self) -> Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_open: bool = self._opened < self.size
+            if can_open:
+                self._opened += 1
+            generation: int = self._generation
+
+        if not can_open:
+            return self._idle.get()
+
+        try:
+            conn: Connection = self._connect()
+        except BaseException:
+            with self._lock:
+                if generation == self._generation:
+                    self._opened -= 1
+            raise
+
+        with self._lock:
+            self._born[conn] = generation
+        return conn
+
+    def release(self, conn: Connection) -> None:
+        with self._lock:
+            stale: bool = self._born[conn] != self._generation
+            if stale:
+                del self._born[conn]
+        if stale:
+            conn.close()
+            return
+        self._idle.put_nowait(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[Connection]:
+        """yields a connection, commits on success and rolls back on error"""
+        conn: Connection = self.acquire()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            self.release(conn)
+
+    def close(self) -> None:
+        """closes idle connections, busy ones are closed when released"""
+        with self._lock:
+            self._generation += 1
+            self._opened = 0
+        while True:
+            try:
+                conn: Connection = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                del self._born[conn]
+            conn.close()
+
+
+class TokenCache:
+    """Bounded LRU cache of token -> user_id with entries expiring after `ttl`.
+
+    Only existing users are cached, so guessing tokens can not fill it up.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: float = 300.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.maxsize: int = maxsize
+        self.ttl: float = ttl
+        self.clock: Callable[[], float] = clock
+        self.hits: int = 0
+        self.misses: int = 0
+        self._entries: OrderedDict[str, tuple[int, float]] = OrderedDict()
+        self._lock: threading.Lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[int]:
+        return self._get(token, count_miss=True)
+
+    def probe(self, token: str) -> Optional[int]:
+        """
+        get for a check that falls back to get on a miss, only hits are
+        counted so a miss is not counted twice
+        """
+        return self._get(token, count_miss=False)
+
+    def _get(self, token: str, count_miss: bool) -> Optional[int]:
+        with self._lock:
+            entry: Optional[tuple[int, float]] = self._entries.get(token)
+            if entry is None or entry[1] <= self.clock():
+                if entry is not None:
+                    del self._entries[token]
+                if count_miss:
+                    self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, token: str, user_id: int) -> None:
+        with self._lock:
+            self._entries[token] = (user_id, self.clock() + self.ttl)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, token: str) -> None:
+        with self._lock:
+            self._entries.pop(token, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+            }
+
+
+@dataclass(frozen=True)
+class PasswordHashing:
+    """scrypt cost of new password hashes, time and memory grow linearly with n"""
+
+    n: int = 2**14
+    r: int = 8
+    p: int = 1
+
+
+DEFAULT_PASSWORD_HASHING: PasswordHashing = PasswordHashing()
+_SCRYPT_PREFIX: str = "scrypt"
+# a password stored before hashing, "plain$password", replaced on the next login
+_LEGACY_PREFIX: str = "plain$"
+
+
+def _scrypt(password: str, salt: bytes, cost: PasswordHashing) -> bytes:
+    return hashlib.scrypt(
+        password.encode(),
+        salt=salt,
+        n=cost.n,
+        r=cost.r,
+        p=cost.p,
+        maxmem=128 * cost.r * (cost.n + cost.p + 2),
+        dklen=32,
+    )
+
+
+def hash_password(
+    password: str, cost: PasswordHashing = DEFAULT_PASSWORD_HASHING
+) -> str:
+    """returns "scrypt$n$r$p$salt$key", stored in users.password"""
+    salt: bytes = os.urandom(16)
+    key: bytes = _scrypt(password, salt, cost)
+    return "$".join(
+        [
+            _SCRYPT_PREFIX,
+            str(cost.n),
+            str(cost.r),
+            str(cost.p),
+            base64.b64encode(salt).decode(),
+            base64.b64encode(key).decode(),
+        ]
+    )
+
+
+def _parse_password_hash(
+    password_hash: str,
+) -> Optional[tuple[PasswordHashing, bytes, bytes]]:
+    parts: list[str] = password_hash.split("$")
+    if len(parts) != 6 or parts[0] != _SCRYPT_PREFIX:
+        return None
+    try:
+        cost: PasswordHashing = PasswordHashing(
+            int(parts[1]), int(parts[2]), int(parts[3])
+        )
+        return cost, base64.b64decode(parts[4]), base64.b64decode(parts[5])
+    except ValueError:
+        return None
+
+
+def is_password_hash(password: str) -> bool:
+    return _parse_password_hash(password) is not None
+
+
+def verify_password(password: str, password_hash: str) -> bool:
+    """takes as long as the hash cost, whether the password matches or not"""
+    if password_hash.startswith(_LEGACY_PREFIX):
+        # as slow as a hashed password, so the check does not tell legacy users apart
+        _scrypt(password, b"", DEFAULT_PASSWORD_HASHING)
+        return hmac.compare_digest(
+            password.encode(), password_hash[len(_LEGACY_PREFIX) :].encode()
+        )
+    parsed: Optional[tuple[PasswordHashing, bytes, bytes]] = _parse_password_hash(
+        password_hash
+    )
+    if parsed is None:
+        return False
+    cost, salt, key = parsed
+    return hmac.compare_digest(_scrypt(password, salt, cost), key)
+
+
+def password_needs_rehash(password_hash: str, cost: PasswordHashing) -> bool:
+    parsed: Optional[tuple[PasswordHashing, bytes, bytes]] = _parse_password_hash(
+        password_hash
+    )
+    return parsed is None or parsed[0] != cost
+
+
+SQLITE_MAX_INTEGER: int = 2**63 - 1
+
+# the code of a type is also its rank among elements due the same day
+ELEMENT_TYPES: tuple[str, ...] = ("sprawdz", "kartk", "homework")
+TYPE_ORDER: dict[str, int] = {type: code for code, type in enumerate(ELEMENT_TYPES)}
+LESSONS: tuple[str, ...] = get_args(LessonTypes)
+LESSON_CODES: dict[str, int] = {lesson: code for code, lesson in enumerate(LESSONS)}
+
+
+# day number of elements without a date, "" from an empty date input, it sorts
+# them first like the text did
+NO_DATE: int = 0
+
+
+@functools.lru_cache(maxsize=4096)
+def to_day(text: str) -> int:
+    """
+    "YYYY-MM-DD" as the day number stored in data.date, date.toordinal(), ""
+    as NO_DATE, raises ValueError for anything else that is not a real day
+    """
+    if text == "":
+        return NO_DATE
+    return date.fromisoformat(text).toordinal()
+
+
+def from_day(day: int) -> str:
+    if day == NO_DATE:
+        return ""
+    return date.fromordinal(day).isoformat()
+
+
+class Element:
+    """
+    ElementData in slots: type and lesson as their index in ELEMENT_TYPES and
+    LESSONS, date as its day number and state as `done`. Records are never
+    changed in place, so each one keeps its JSON once it was encoded
+    """
+
+    fields: tuple[str, ...] = ("id", "type", "lesson", "date", "comment", "done")
+    __slots__ = fields + ("_json", "_compact_json")
+
+    def __init__(
+        self, id: int, type: int, lesson: int, date: int, comment: str, done: bool
+    ) -> None:
+        self.id: int = id
+        self.type: int = type
+        self.lesson: int = lesson
+        self.date: int = date
+        self.comment: str = comment
+        self.done: bool = done
+        self._json: Optional[str] = None
+        self._compact_json: Optional[str] = None
+
+    @classmethod
+    def from_row(cls, row: tuple[int, str, str, int, str, int]) -> "Element":
+        """row of id, type, lesson, date, comment, done as stored in data"""
+        return cls(
+            row[0],
+            TYPE_ORDER[row[1]],
+            LESSON_CODES[row[2]],
+            row[3],
+            row[4],
+            row[5] == 1,
+        )
+
+    @classmethod
+    def from_data(cls, data: ElementData) -> "Element":
+        return cls(
+            data["id"],
+            TYPE_ORDER[data["type"]],
+            LESSON_CODES[data["lesson"]],
+            to_day(data["date"]),
+            data["comment"],
+            data["state"] == "done",
+        )
+
+    def to_data(self) -> ElementData:
+        return {
+            "id": self.id,
+            "type": cast(
+                Literal["homework", "kartk", "sprawdz"], ELEMENT_TYPES[self.type]
+            ),
+            "lesson": cast(LessonTypes, LESSONS[self.lesson]),
+            "date": from_day(self.date),
+            "comment": self.comment,
+            "state": "done" if self.done else "work",
+        }
+
+    def to_json(self, compact: bool = False) -> str:
+        """
+        the element as get_elements_json writes it, an array of the values
+        when `compact`, encoded on the first call only
+        """
+        encoded: Optional[str] = self._compact_json if compact else self._json
+        if encoded is None:
+            data: ElementData = self.to_data()
+            encoded = json.dumps(
+                list(data.values()) if compact else data,
+                ensure_ascii=False,
+                separators=(",", ":"),
+            )
+            if compact:
+                self._compact_json = encoded
+            else:
+                self._json = encoded
+        return encoded
+
+    def with_state(self, done: bool) -> "Element":
+        return Element(self.id, self.type, self.lesson, self.date, self.comment, done)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Element):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.fields)
 
-    def init_database(self):
-        conn: Connection = sqlite3.connect(self.dbPath)
-        cursor: Cursor = conn.cursor()
+    def __repr__(self) -> str:
+        return f"Element({self.to_data()})"
 
+
+# position of an element among elements with the same state
+element_sort_key: Callable[[Element], tuple[int, int, int]] = operator.attrgetter(
+    "date", "type", "id"
+)
+
+
+def display_order(
+    work: list[Element], done: list[Element], upcoming: bool
+) -> list[Element]:
+    """
+    the order elements are shown in, for partitions sorted by element_sort_key:
+    work before done, then (only when nothing is `upcoming`) homework before
+    other types, then date, then sprawdz, kartk, homework
+    """
+    if upcoming:
+        return work + done
+    homework: int = TYPE_ORDER["homework"]
+    return (
+        [element for element in work if element.type == homework]
+        + [element for element in work if element.type != homework]
+        + done
+    )
+
+
+def display_key(element: Element, upcoming: bool) -> tuple[bool, bool, int, int, int]:
+    """
+    the position of an element in display_order, as the values of a PageCursor,
+    display_order yields the elements by this key
+    """
+    homework_later: bool = not (
+        element.done or upcoming or element.type == TYPE_ORDER["homework"]
+    )
+    return element.done, homework_later, element.date, element.type, element.id
+
+
+def is_upcoming(work: list[Element], window: tuple[str, str]) -> bool:
+    """if some work is due within `window`, work is sorted by date"""
+    first, last = to_day(window[0]), to_day(window[1])
+    index: int = bisect.bisect_left(work, first, key=operator.attrgetter("date"))
+    return index < len(work) and work[index].date <= last
+
+
+def elements_json(
+    work: list[Element], done: list[Element], window: tuple[str, str], compact: bool
+) -> bytes:
+    """the body of a full /get_data from partitions sorted by element_sort_key"""
+    rows: list[str] = [
+        element.to_json(compact)
+        for element in display_order(work, done, is_upcoming(work, window))
+    ]
+    return ("[" + ",".join(rows) + "]").encode()
+
+
+# display_key as sql, :upcoming is 1 when some work is due soon
+_DONE_SQL: str = "(done = 1)"
+_HOMEWORK_LATER_SQL: str = "(done = 0 AND NOT :upcoming AND type != 'homework')"
+_TYPE_RANK_SQL: str = "(CASE type WHEN 'sprawdz' THEN 0 WHEN 'kartk' THEN 1 ELSE 2 END)"
+_ORDER_KEY_SQL: str = f"{_DONE_SQL}, {_HOMEWORK_LATER_SQL}, date, {_TYPE_RANK_SQL}, id"
+
+# julianday() of day number 0, day numbers are turned back into "YYYY-MM-DD" in sql
+_JULIAN_DAY_OFFSET: float = 1721424.5
+
+ELEMENT_FIELDS: list[str] = ["id", "type", "lesson", "date", "comment", "state"]
+# the columns of a data row in ELEMENT_FIELDS order, as the API shows them
+_ELEMENT_COLUMNS: list[str] = [
+    "data.id",
+    "data.type",
+    "data.lesson",
+    f"(CASE data.date WHEN {NO_DATE} THEN '' "
+    f"ELSE date(data.date + {_JULIAN_DAY_OFFSET}) END)",
+    "data.comment",
+    "(CASE data.done WHEN 1 THEN 'done' ELSE 'work' END)",
+]
+_ELEMENT_COLUMNS_SQL: str = ", ".join(_ELEMENT_COLUMNS)
+
+
+class ChangeSet(TypedDict):
+    version: int
+    reset: bool  # the changes are not known anymore, everything has to be reloaded
+    changed: list[ElementData]  # added or modified since then
+    deleted: list[int]
+
+
+@dataclass(frozen=True)
+class ElementFilter:
+    """conditions for Database.get_elements_page, None means any"""
+
+    state: Optional[Literal["work", "done"]] = None
+    lesson: Optional[LessonTypes] = None
+    type: Optional[Literal["homework", "kartk", "sprawdz"]] = None
+    date_from: Optional[str] = None  # inclusive "YYYY-MM-DD"
+    date_to: Optional[str] = None  # inclusive "YYYY-MM-DD"
+
+    def day_range(self) -> tuple[Optional[int], Optional[int]]:
+        """date_from and date_to as day numbers"""
+        return (
+            to_day(self.date_from) if self.date_from is not None else None,
+            to_day(self.date_to) if self.date_to is not None else None,
+        )
+
+
+@dataclass(frozen=True)
+class PageCursor:
+    """position after the last element of a page, in the display order"""
+
+    upcoming: bool
+    done: bool
+    homework_later: bool
+    date: int  # day number
+    type_rank: int
+    id: int
+
+    def encode(self) -> str:
+        raw: bytes = json.dumps(
+            [
+                self.upcoming,
+                self.done,
+                self.homework_later,
+                self.date,
+                self.type_rank,
+                self.id,
+            ]
+        ).encode()
+        return base64.urlsafe_b64encode(raw).decode()
+
+    @classmethod
+    def decode(cls, cursor: str) -> "PageCursor":
+        """raises ValueError for cursors that were not made by encode"""
+        try:
+            upcoming, done, later, day, rank, id = json.loads(
+                base64.urlsafe_b64decode(cursor.encode())
+            )
+            page: PageCursor = cls(
+                bool(upcoming), bool(done), bool(later), int(day), int(rank), int(id)
+            )
+        except (TypeError, ValueError, OverflowError) as error:
+            raise ValueError("invalid page cursor") from error
+        # the values end up as SQLite parameters, which are 64 bit at most
+        if not (
+            0 <= page.date <= date.max.toordinal()
+            and 0 <= page.type_rank < len(ELEMENT_TYPES)
+            and 0 <= page.id <= SQLITE_MAX_INTEGER
+        ):
+            raise ValueError("invalid page cursor")
+        return page
+
+    def key(self) -> tuple[bool, bool, int, int, int]:
+        """the display_key of the last element of the page"""
+        return self.done, self.homework_later, self.date, self.type_rank, self.id
+
+
+class OrderedElements:
+    """Elements of one user split by state, each part kept sorted by element_sort_key"""
+
+    def __init__(self, elements: list[Element]) -> None:
+        self.work: list[Element] = []
+        self.done: list[Element] = []
+        self._by_id: dict[int, Element] = {}
+
+        for element in sorted(elements, key=element_sort_key):
+            self._partition(element).append(element)
+            self._by_id[element.id] = element
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def get(self, element_id: int) -> Optional[Element]:
+        return self._by_id.get(element_id)
+
+    def _partition(self, element: Element) -> list[Element]:
+        return self.done if element.done else self.work
+
+    def insert(self, element: Element) -> None:
+        # a reader may load the new row and store the entry between the commit
+        # of an INSERT and the update of the cache, the element is in it then
+        if element.id in self._by_id:
+            return
+        bisect.insort(self._partition(element), element, key=element_sort_key)
+        self._by_id[element.id] = element
+
+    def remove(self, element_id: int) -> Optional[Element]:
+        element: Optional[Element] = self._by_id.pop(element_id, None)
+        if element is None:
+            return None
+
+        partition: list[Element] = self._partition(element)
+        index: int = bisect.bisect_left(
+            partition, element_sort_key(element), key=element_sort_key
+        )
+        del partition[index]
+        return element
+
+    def set_state(self, element_id: int, state: Literal["work", "done"]) -> None:
+        element: Optional[Element] = self.remove(element_id)
+        if element is not None:
+            # a new record, the old one may still be used by a response being sent
+            self.insert(element.with_state(state == "done"))
+
+
+class OrderingCache:
+    """LRU of OrderedElements per token, holding at most `maxsize` users.
+
+    Database updates cached entries in place on every write. `generation`
+    grows with every write, an entry loaded while a write was running is
+    not stored because it may miss that write. When other processes write
+    too, entries carry the data version they were loaded at and are only
+    served for that version, in place updates then leave them stale.
+    """
+
+    def __init__(self, maxsize: int = 256) -> None:
+        self.maxsize: int = maxsize
+        self.generation: int = 0
+        # token -> (ordered, data version or None when versions are not checked)
+        self._entries: OrderedDict[str, tuple[OrderedElements, Optional[int]]] = (
+            OrderedDict()
+        )
+        self._lock: threading.Lock = threading.Lock()
+
+    def partitions(
+        self, token: str, version: Optional[int] = None
+    ) -> Optional[tuple[list[Element], list[Element]]]:
+        """
+        returns copies of (work, done) or None when the token is not cached,
+        or was cached at another data version than `version`
+        """
+        with self._lock:
+            entry: Optional[tuple[OrderedElements, Optional[int]]] = self._entries.get(
+                token
+            )
+            if entry is None or entry[1] != version:
+                return None
+            self._entries.move_to_end(token)
+            return list(entry[0].work), list(entry[0].done)
+
+    def store(
+        self,
+        token: str,
+        ordered: OrderedElements,
+        generation: int,
+        version: Optional[int] = None,
+    ) -> None:
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[token] = (ordered, version)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def update(self, token: str, change: Callable[[OrderedElements], None]) -> None:
+        with self._lock:
+            self.generation += 1
+            entry: Optional[tuple[OrderedElements, Optional[int]]] = self._entries.get(
+                token
+            )
+            if entry is not None:
+                change(entry[0])
+
+    def invalidate(self, token: str) -> None:
+        with self._lock:
+            self.generation += 1
+            self._entries.pop(token, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+
+Statement = Callable[[Cursor], T]
+
+
+@dataclass(frozen=True)
+class GroupCommit:
+    """Settings of GroupCommitWriter"""
+
+    max_batch: int = 64
+    max_delay: float = 0.002  # seconds the first write of a batch waits for others
+
+
+class GroupCommitWriter:
+    """Runs writes of many threads in shared transactions.
+
+    Writes submitted within `max_delay` of the first one (up to `max_batch`)
+    are committed together, so a burst of clicks costs one commit instead of
+    one per click. `submit` returns only after the batch was committed. Each
+    write runs in its own savepoint, a failing write is rolled back alone and
+    its error is raised in the thread that submitted it.
+    """
+
+    def __init__(self, pool: ConnectionPool, settings: GroupCommit) -> None:
+        self.pool: ConnectionPool = pool
+        self.settings: GroupCommit = settings
+        self.batches: int = 0
+        self._jobs: queue.Queue[Optional[tuple[Statement, Future]]] = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock: threading.Lock = threading.Lock()
+
+    def submit(self, statement: Statement[T]) -> T:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="db-group-commit", daemon=True
+                )
+                self._thread.start()
+            future: Future = Future()
+            self._jobs.put((statement, future))
+        return future.result()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                return
+            self._jobs.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            job: Optional[tuple[Statement, Future]] = self._jobs.get()
+            if job is None:
+                return
+
+            batch: list[tuple[Statement, Future]] = [job]
+            deadline: float = time.monotonic() + self.settings.max_delay
+            stopping: bool = False
+            while len(batch) < self.settings.max_batch:
+                try:
+                    job = self._jobs.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if job is None:
+                    stopping = True
+                    break
+                batch.append(job)
+
+            self._commit(batch)
+            if stopping:
+                return
+
+    def _commit(self, batch: list[tuple[Statement, Future]]) -> None:
+        outcomes: list[tuple[Future, Any, Optional[BaseException]]] = []
+        try:
+            with self.pool.connection() as conn:
+                cursor: Cursor = conn.cursor()
+                cursor.execute("BEGIN IMMEDIATE")
+
+                for statement, future in batch:
+                    cursor.execute("SAVEPOINT job")
+                    try:
+                        outcomes.append((future, statement(cursor), None))
+                    except Exception as error:
+                        cursor.execute("ROLLBACK TO job")
+                        outcomes.append((future, None, error))
+                    cursor.execute("RELEASE job")
+        except BaseException as error:
+            for _, future in batch:
+                future.set_exception(error)
+            return
+
+        self.batches += 1
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+Migration = Callable[[Cursor], None]
+
+
+def _index_users_token(cursor: Cursor) -> None:
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS users_token ON users (token)")
+
+
+def _index_data_user_state_date(cursor: Cursor) -> None:
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS data_user_state_date
+        ON data (user_id, state, date)
+        """
+    )
+
+
+def _index_users_username(cursor: Cursor) -> None:
+    cursor.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS users_username ON users (username)"
+    )
+
+
+def _add_data_versions(cursor: Cursor) -> None:
+    """per-user counter bumped by triggers on every change of the data table"""
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS data_versions (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+        """
+    )
+    for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
         cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT NOT NULL,
-                password TEXT NOT NULL,
-                token TEXT NOT NULL
-            );
+            f"""
+            CREATE TRIGGER IF NOT EXISTS data_version_{event.lower()}
+            AFTER {event} ON data
+            BEGIN
+                INSERT INTO data_versions (user_id, version) VALUES ({row}.user_id, 1)
+                ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+            END
             """
         )
 
+
+# changes kept per user, baked into the triggers, changing it needs a migration
+CHANGE_LOG_SIZE: int = 1000
+
+
+def _add_data_changes(cursor: Cursor) -> None:
+    """log of changed element ids per data version, replacing the version triggers"""
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS data_changes (
+            user_id INTEGER NOT NULL,
+            version INTEGER NOT NULL,
+            element_id INTEGER NOT NULL,
+            PRIMARY KEY (user_id, version)
+        ) WITHOUT ROWID
+        """
+    )
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        cursor.execute(f"DROP TRIGGER IF EXISTS data_version_{event.lower()}")
+    _create_data_change_triggers(cursor)
+
+
+def _create_data_change_triggers(cursor: Cursor) -> None:
+    for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
         cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS data (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                type TEXT NOT NULL,
-                lesson TEXT NOT NULL,
-                date TEXT NOT NULL,
-                comment TEXT,
-                state BOOLEAN NOT NULL,
-                user_id INTEGER NOT NULL,
-                FOREIGN KEY(user_id) REFERENCES users(id)
-            );
+            f"""
+            CREATE TRIGGER IF NOT EXISTS data_change_{event.lower()}
+            AFTER {event} ON data
+            BEGIN
+                INSERT INTO data_versions (user_id, version) VALUES ({row}.user_id, 1)
+                ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+
+                INSERT INTO data_changes (user_id, version, element_id)
+                SELECT user_id, version, {row}.id FROM data_versions
+                WHERE user_id = {row}.user_id;
+
+                DELETE FROM data_changes
+                WHERE user_id = {row}.user_id AND version <= (
+                    SELECT version FROM data_versions WHERE user_id = {row}.user_id
+                ) - {CHANGE_LOG_SIZE};
+            END
             """
         )
 
-        conn.commit()
-        conn.close()
 
-    def add_user(self, username: str, password: str) -> None:
-        conn: Connection = sqlite3.connect(self.dbPath)
-        cursor: Cursor = conn.cursor()
+def _store_days_and_done(cursor: Cursor) -> None:
+    """
+    rebuilds data with date as a day number and state as done 0/1. dates that
+    are not a real day (like "" from an empty date input) become NO_DATE
+    """
+    columns: list[str] = [row[1] for row in cursor.execute("PRAGMA table_info(data)")]
+    if "done" in columns:
+        return
 
+    sequence: Optional[tuple[int]] = cursor.execute(
+        "SELECT seq FROM sqlite_sequence WHERE name = 'data'"
+    ).fetchone()
+    cursor.execute(
+        """
+        CREATE TABLE data_days (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            type TEXT NOT NULL,
+            lesson TEXT NOT NULL,
+            date INTEGER NOT NULL,
+            comment TEXT,
+            done BOOLEAN NOT NULL CHECK (done IN (0, 1)),
+            user_id INTEGER NOT NULL,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+        """
+    )
+    cursor.execute(
+        f"""
+        INSERT INTO data_days (id, type, lesson, date, comment, done, user_id)
+        SELECT
+            id, type, lesson,
+            COALESCE(
+                CAST(julianday(date) - {_JULIAN_DAY_OFFSET} AS INTEGER), {NO_DATE}
+            ),
+            comment, state = 'done', user_id
+        FROM data
+        """
+    )
+    # dropping data drops its index and triggers too
+    cursor.execute("DROP TABLE data")
+    cursor.execute("ALTER TABLE data_days RENAME TO data")
+    if sequence is not None:
+        # ids of deleted elements stay unused, the change log may still name them
         cursor.execute(
-            """INSERT INTO users (username, password, token) VALUES (?, ?, ?)""",
-            (username, password, str(uuid.uuid4())),
+            "UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'data'",
+            sequence,
         )
+        cursor.execute(
+            """
+            INSERT INTO sqlite_sequence (name, seq)
+            SELECT 'data', ? WHERE NOT EXISTS (
+                SELECT 1 FROM sqlite_sequence WHERE name = 'data'
+            )
+            """,
+            sequence,
+        )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS data_user_done_date ON data (user_id, done, date)"
+    )
+    _create_data_change_triggers(cursor)
+
 
-        conn.commit()
-        conn.close()
+def _hash_passwords(cursor: Cursor) -> None:
+    """
+    marks plaintext passwords as legacy, they are hashed on the next login of
+    their user. Hashing all of them here would hold the write lock for as
+    long as scrypt takes times the number of users
+    """
+    rows: list[tuple[int, str]] = cursor.execute(
+        "SELECT id, password FROM users"
+    ).fetchall()
+    cursor.executemany(
+        "UPDATE users SET password = ? WHERE id = ?",
+        [
+            (_LEGACY_PREFIX + password, user_id)
+            for user_id, password in rows
+            if not is_password_hash(password)
+        ],
+    )
+
+
+def _add_login_attempts(cursor: Cursor) -> None:
+    """login attempts per username, for a rate limit shared by processes"""
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS login_attempts (
+            username TEXT NOT NULL,
+            time REAL NOT NULL
+        )
+        """
+    )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS login_attempts_username_time
+        ON login_attempts (username, time)
+        """
+    )
+
+
+# schema version N means MIGRATIONS[:N] were applied, only ever append here
+MIGRATIONS: list[Migration] = [
+    _index_users_token,
+    _index_data_user_state_date,
+    _index_users_username,
+    _add_data_versions,
+    _add_data_changes,
+    _store_days_and_done,
+    _hash_passwords,
+    _add_login_attempts,
+]
 
+
+class Storage(Protocol):
+    """
+    What AsyncDatabase and the server use of a database. Database keeps the
+    data in SQLite, sharding.ShardedDatabase in several SQLite files and
+    memory.MemoryDatabase in this process.
+    """
+
+    password_hashing: PasswordHashing
+    shared: bool
+    stats: DatabaseStats
+
+    @property
+    def dummy_password_hash(self) -> str: ...
+
+    @property
+    def writer_threads(self) -> int: ...
+
+    def cached_ordered_elements(
+        self, token: str
+    ) -> Optional[tuple[list[Element], list[Element]]]: ...
+
+    def is_token_cached(self, token: str) -> bool: ...
+
+    def close(self) -> None: ...
+
+    def init_database(self) -> None: ...
+
+    def get_schema_version(self) -> int: ...
+
+    def migrate(self) -> int: ...
+
+    def add_user(self, username: str, password: str) -> None: ...
+
+    def add_user_hash(
+        self,
+        username: str,
+        password_hash: str,
+        user_id: Optional[int] = None,
+        token: Optional[str] = None,
+    ) -> None: ...
+
+    def get_user_id(self, token: str) -> int: ...
+
+    def add_element(self, data: ElementData, token: str) -> bool: ...
+
+    def add_elements(self, data: list[ElementData], token: str) -> int: ...
+
+    def change_state_of_element(
+        self, state: Literal["work", "done"], element_id: int, token: str
+    ) -> bool: ...
+
+    def get_elements_from_token(self, token: str) -> list[ElementData]: ...
+
+    def get_element_records(self, token: str) -> list[Element]: ...
+
+    def iter_elements(
+        self, token: str, chunk_size: int = 500
+    ) -> Iterator[ElementData]: ...
+
+    def get_token_from_credentials(self, username: str, password: str) -> str: ...
+
+    def get_credentials(self, username: str) -> Optional[tuple[str, int, str]]: ...
+
+    def verify_credentials(
+        self, password: str, row: Optional[tuple[str, int, str]]
+    ) -> bool: ...
+
+    def accept_credentials(self, row: tuple[str, int, str]) -> str: ...
+
+    def set_password_hash(self, user_id: int, old_hash: str, new_hash: str) -> None: ...
+
+    def delete_element(self, token: str, id: int) -> bool: ...
+
+    def get_elements_page(
+        self,
+        token: str,
+        window: tuple[str, str],
+        filters: ElementFilter = ElementFilter(),
+        limit: Optional[int] = None,
+        after: Optional[PageCursor] = None,
+    ) -> tuple[list[ElementData], Optional[PageCursor]]: ...
+
+    def get_elements_json(
+        self, token: str, window: tuple[str, str], compact: bool = False
+    ) -> bytes: ...
+
+    def get_changes(self, token: str, since: int) -> ChangeSet: ...
+
+    def get_data_version(self, token: str) -> tuple[int, int]: ...
+
+    def get_ordered_elements(
+        self, token: str
+    ) -> tuple[list[Element], list[Element]]: ...
+
+    def get_data_versions(self, user_ids: list[int]) -> dict[int, int]: ...
+
+    def record_login_attempt(
+        self, username: str, attempts: int, period: float, now: Optional[float] = None
+    ) -> float: ...
+
+    def delete_user(self, token: str) -> None: ...
+
+    def rotate_token(self, token: str) -> str: ...
+
+    def is_token_valid(self, token: Optional[str]) -> bool: ...
+
+
+class Database:
+    def __init__(
+        self,
+        dbPath: str,
+        pool_size: int = 5,
+        profile: StorageProfile = DEFAULT_PROFILE,
+        token_cache: Optional[TokenCache] = None,
+        ordering_cache: Optional[OrderingCache] = None,
+        group_commit: Optional[GroupCommit] = None,
+        password_hashing: PasswordHashing = DEFAULT_PASSWORD_HASHING,
+        shared: bool = False,
+        stats: Optional[DatabaseStats] = None,
+    ) -> None:
+        """
+        `shared` is for a file other processes write to as well, the caches
+        then never answer from what may have changed behind their back
+        """
+        self.dbPath: str = dbPath
+        self.password_hashing: PasswordHashing = password_hashing
+        self.shared: bool = shared
+        self.stats: DatabaseStats = stats if stats is not None else DatabaseStats()
+        self.pool: ConnectionPool = ConnectionPool(
+            dbPath, pool_size, profile, self.stats
+        )
+        self.writer: Optional[GroupCommitWriter] = (
+            GroupCommitWriter(self.pool, group_commit) if group_commit else None
+        )
+        # a token rotated or deleted by another process would stay valid here
+        self.token_cache: TokenCache = (
+            token_cache
+            if token_cache is not None
+            else TokenCache(maxsize=0 if shared else 1024)
+        )
+        self.stats.add_cache("token", self.token_cache)
+        self.ordering_cache: OrderingCache = (
+            ordering_cache if ordering_cache is not None else OrderingCache()
+        )
+
+    @functools.cached_property
+    def dummy_password_hash(self) -> str:
+        """verified against for unknown usernames, so they take as long as known ones"""
+        return hash_password("", self.password_hashing)
+
+    @property
+    def writer_threads(self) -> int:
+        """writes AsyncDatabase may run at once"""
+        # with group commit, writes wait for their batch, so more of them may be in flight
+        return self.writer.settings.max_batch if self.writer is not None else 1
+
+    def cached_ordered_elements(
+        self, token: str
+    ) -> Optional[tuple[list[Element], list[Element]]]:
+        """get_ordered_elements if it can be answered from memory, otherwise None"""
+        if self.shared:
+            return None
+        return self.ordering_cache.partitions(token)
+
+    def is_token_cached(self, token: str) -> bool:
+        return self.token_cache.probe(token) is not None
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+        self.pool.close()
+        self.token_cache.clear()
+        self.ordering_cache.clear()
+
+    def _submit(self, statement: Statement[T]) -> T:
+        """runs a writing statement, through the group commit writer when enabled"""
+        if self.writer is not None:
+            return self.writer.submit(statement)
+
+        with self.pool.connection() as conn:
+            return statement(conn.cursor())
+
+    def _write(self, sql: str, parameters: tuple) -> tuple[int, Optional[int]]:
+        """runs one writing statement and returns its (rowcount, lastrowid)"""
+
+        def statement(cursor: Cursor) -> tuple[int, Optional[int]]:
+            cursor.execute(sql, parameters)
+            return cursor.rowcount, cursor.lastrowid
+
+        return self._submit(statement)
+
+    def _write_many(self, sql: str, parameters: Iterable[tuple]) -> int:
+        """runs a writing statement for every parameter tuple, returns the rowcount"""
+
+        def statement(cursor: Cursor) -> int:
+            cursor.executemany(sql, parameters)
+            return cursor.rowcount
+
+        return self._submit(statement)
+
+    def _user_filter(self, token: str) -> tuple[str, int | str]:
+        """returns a users condition and its parameter, by id when the token is cached"""
+        user_id: Optional[int] = self.token_cache.get(token)
+        if user_id is None:
+            return "users.token = ?", token
+        return "users.id = ?", user_id
+
+    @timed
+    def init_database(self) -> None:
+        with self.pool.connection() as conn:
+            cursor: Cursor = conn.cursor()
+
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS users (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    username TEXT NOT NULL,
+                    password TEXT NOT NULL,
+                    token TEXT NOT NULL
+                );
+                """
+            )
+
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS data (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    type TEXT NOT NULL,
+                    lesson TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    comment TEXT,
+                    state BOOLEAN NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    FOREIGN KEY(user_id) REFERENCES users(id)
+                );
+                """
+            )
+
+        self.migrate()
+
+    @timed
+    def get_schema_version(self) -> int:
+        with self.pool.connection() as conn:
+            version: int = conn.execute("PRAGMA user_version").fetchone()[0]
+        return version
+
+    @timed
+    def migrate(self) -> int:
+        """applies pending MIGRATIONS in one transaction, returns schema version"""
+        with self.pool.connection() as conn:
+            cursor: Cursor = conn.cursor()
+
+            # taking the write lock first makes concurrent starts apply each migration once
+            cursor.execute("BEGIN IMMEDIATE")
+            version: int = cursor.execute("PRAGMA user_version").fetchone()[0]
+
+            for migration in MIGRATIONS[version:]:
+                migration(cursor)
+                version += 1
+                cursor.execute(f"PRAGMA user_version = {version}")
+
+        return version
+
+    @timed
+    def add_user(self, username: str, password: str) -> None:
+        self.add_user_hash(username, hash_password(password, self.password_hashing))
+
+    @timed
+    def add_user_hash(
+        self,
+        username: str,
+        password_hash: str,
+        user_id: Optional[int] = None,
+        token: Optional[str] = None,
+    ) -> None:
+        """
+        add_user with the password already hashed by hash_password, the id
+        and token are only given when they were picked elsewhere
+        """
+        self._write(
+            "INSERT INTO users (id, username, password, token) VALUES (?, ?, ?, ?)",
+            (user_id, username, password_hash, token or str(uuid.uuid4())),
+        )
+
+    @timed
     def get_user_id(self, token: str) -> int:
-        conn: Connection = sqlite3.connect(self.dbPath)
-        cursor: Cursor = conn.cursor()
+        cached: Optional[int] = self.token_cache.get(token)
+        if cached is not None:
+            return cached
+
+        with self.pool.connection() as conn:
+            cursor: Cursor = conn.cursor()
 
-        cursor.execute("SELECT id FROM users WHERE token = ?", (token,))
+            cursor.execute("SELECT id FROM users WHERE token = ?", (token,))
 
-        user_id: int = cursor.fetchone()[0]
-        conn.close()
+            user_id: int = cursor.fetchone()[0]
+
+        self.token_cache.put(token, user_id)
         return user_id
 
-    def add_element(self, data: ElementData, token: str) -> None:
-        conn: Connection = sqlite3.connect(self.dbPath)
-        cursor: Cursor = conn.cursor()
+    @timed
+    def add_element(self, data: ElementData, token: str) -> bool:
+        """returns False when the token does not belong to any user"""
+        user_filter, user_param = self._user_filter(token)
 
-        user_id: int = self.get_user_id(token)
-        cursor.execute(
-            """INSERT INTO data (type, lesson, date, comment, state, user_id) VALUES (?, ?, ?, ?, ?, ?)""",
+        rowcount, element_id = self._write(
+            f"""
+            INSERT INTO data (type, lesson, date, comment, done, user_id)
+            SELECT ?, ?, ?, ?, ?, id FROM users WHERE {user_filter}
+            """,
             (
                 data["type"],
                 data["lesson"],
-                data["date"],
+                to_day(data["date"]),
                 data["comment"],
-                data["state"],
-                user_id,
+                data["state"] == "done",
+                user_param,
             ),
         )
+        inserted: bool = rowcount == 1
+
+        if inserted:
+            self.ordering_cache.update(
+                token,
+                lambda ordered: ordered.insert(
+                    Element.from_data({**data, "id": cast(int, element_id)})
+                ),
+            )
+        return inserted
 
-        conn.commit()
-        conn.close()
+    @timed
+    def add_elements(self, data: list[ElementData], token: str) -> int:
+        """
+        adds all elements in one statement and returns how many were added,
+        raises InvalidTokenError when the token does not belong to any user
+        """
+        if not self.is_token_valid(token):
+            raise InvalidTokenError("user with this token does not exists")
+        user_filter, user_param = self._user_filter(token)
 
+        # converted up front, so a bad date fails before anything is written
+        rows: list[tuple] = [
+            (
+                element["type"],
+                element["lesson"],
+                to_day(element["date"]),
+                element["comment"],
+                element["state"] == "done",
+                user_param,
+            )
+            for element in data
+        ]
+        added: int = self._write_many(
+            f"""
+            INSERT INTO data (type, lesson, date, comment, done, user_id)
+            SELECT ?, ?, ?, ?, ?, id FROM users WHERE {user_filter}
+            """,
+            rows,
+        )
+
+        # ids of rows added by executemany are not known, so reload on next read
+        self.ordering_cache.invalidate(token)
+        return added
+
+    @timed
     def change_state_of_element(
         self, state: Literal["work", "done"], element_id: int, token: str
-    ) -> None:
-        conn: Connection = sqlite3.connect(self.dbPath)
-        cursor: Cursor = conn.cursor()
+    ) -> bool:
+        """returns False when no element with this id belongs to the token"""
+        user_filter, user_param = self._user_filter(token)
 
-        cursor.execute(
-            """
-            UPDATE data 
-            SET state = ?
-            WHERE (id, user_id) = (?, ?)
+        rowcount, _ = self._write(
+            f"""
+            UPDATE data
+            SET done = ?
+            WHERE id = ? AND user_id = (SELECT id FROM users WHERE {user_filter})
             """,
-            (state, element_id, self.get_user_id(token)),
+            (state == "done", element_id, user_param),
         )
+        changed: bool = rowcount == 1
+
+        if changed:
+            self.ordering_cache.update(
+                token, lambda ordered: ordered.set_state(element_id, state)
+            )
+        return changed
 
-        conn.commit()
-        conn.close()
+    def _element_rows(
+        self, token: str, columns: str = _ELEMENT_COLUMNS_SQL
+    ) -> list[Any]:
+        """rows of `columns` of the token's elements in id order"""
+        user_filter, user_param = self._user_filter(token)
 
-    def get_elements_from_token(self, token: str) -> list[ElementData]:
-        conn: Connection = sqlite3.connect(self.dbPath)
-        cursor: Cursor = conn.cursor()
+        with self.pool.connection() as conn:
+            cursor: Cursor = conn.cursor()
 
-        user_id: int = self.get_user_id(token)
+            # the users row is always returned, so an empty list and an invalid token differ
+            cursor.execute(
+                f"""
+                SELECT users.id, {columns}
+                FROM users LEFT JOIN data ON data.user_id = users.id
+                WHERE {user_filter}
+                ORDER BY data.id
+                """,
+                (user_param,),
+            )
 
-        cursor.execute(
-            """SELECT id, type, lesson, date, comment, state FROM data WHERE user_id = ?""",
-            (user_id,),
-        )
+            rows: list[Any] = cursor.fetchall()
 
-        rows: list[Any] = cursor.fetchall()
+        if not rows:
+            self.token_cache.invalidate(token)
+            raise InvalidTokenError("user with this token does not exists")
+        self.token_cache.put(token, rows[0][0])
 
-        conn.close()
+        return [row[1:] for row in rows if row[1] is not None]
 
+    @timed
+    def get_elements_from_token(self, token: str) -> list[ElementData]:
         return_data: list[ElementData] = []
 
-        for row in rows:
+        for row in self._element_rows(token):
             return_data.append(
                 {
                     "id": row[0],
@@ -165,56 +1616,614 @@ class Database:
             )
         return return_data
 
+    @timed
+    def get_element_records(self, token: str) -> list[Element]:
+        """get_elements_from_token as Element records, without building dicts"""
+        return [
+            Element.from_row(row)
+            for row in self._element_rows(
+                token,
+                "data.id, data.type, data.lesson, data.date, data.comment, data.done",
+            )
+        ]
+
+    @timed
+    def iter_elements(self, token: str, chunk_size: int = 500) -> Iterator[ElementData]:
+        """
+        yields elements of the token in id order, reading `chunk_size` rows at
+        a time, raises InvalidTokenError right away, not on the first element.
+        Every chunk is read on its own, so writes in between show up in the
+        chunks after them
+        """
+        if not self.is_token_valid(token):
+            raise InvalidTokenError("user with this token does not exists")
+        return self._iter_elements(self.get_user_id(token), chunk_size)
+
+    def _iter_elements(self, user_id: int, chunk_size: int) -> Iterator[ElementData]:
+        # a connection for each chunk, not for the whole download, so slow
+        # clients can't hold the pool. Rows after the last id keep the order
+        # when elements are added or deleted in between
+        last_id: int = 0
+        while True:
+            with self.pool.connection() as conn:
+                rows: list[Any] = conn.execute(
+                    f"""
+                    SELECT {_ELEMENT_COLUMNS_SQL}
+                    FROM data WHERE user_id = ? AND id > ? ORDER BY id LIMIT ?
+                    """,
+                    (user_id, last_id, chunk_size),
+                ).fetchall()
+
+            for row in rows:
+                yield {
+                    "id": row[0],
+                    "type": row[1],
+                    "lesson": row[2],
+                    "date": row[3],
+                    "comment": row[4],
+                    "state": row[5],
+                }
+            if len(rows) < chunk_size:
+                return
+            last_id = rows[-1][0]
+
+    @timed
     def get_token_from_credentials(self, username: str, password: str) -> str:
-        conn: Connection = sqlite3.connect(self.dbPath)
-        cursor: Cursor = conn.cursor()
+        row: Optional[tuple[str, int, str]] = self.get_credentials(username)
+        if not self.verify_credentials(password, row) or row is None:
+            raise InvalidCredentialsError("user with this credentials  does not exists")
 
-        cursor.execute(
-            "SELECT token FROM users WHERE (username, password) = (?, ?)",
-            (username, password),
-        )
-        row: Optional[tuple[str]] = cursor.fetchone()
+        if password_needs_rehash(row[2], self.password_hashing):
+            self.set_password_hash(
+                row[1], row[2], hash_password(password, self.password_hashing)
+            )
+        return self.accept_credentials(row)
+
+    @timed
+    def get_credentials(self, username: str) -> Optional[tuple[str, int, str]]:
+        """returns (token, user id, password hash) of the username"""
+        with self.pool.connection() as conn:
+            cursor: Cursor = conn.cursor()
 
+            cursor.execute(
+                "SELECT token, id, password FROM users WHERE username = ?",
+                (username,),
+            )
+            row: Optional[tuple[str, int, str]] = cursor.fetchone()
+        return row
+
+    @timed
+    def verify_credentials(
+        self, password: str, row: Optional[tuple[str, int, str]]
+    ) -> bool:
+        """checks the password against a row of get_credentials, slow on purpose"""
         if row is None:
-            raise InvalidCredentialsError("user with this credentials  does not exists")
+            verify_password(password, self.dummy_password_hash)
+            return False
+        return verify_password(password, row[2])
 
+    @timed
+    def accept_credentials(self, row: tuple[str, int, str]) -> str:
+        """caches the token of verified credentials and returns it"""
         token: str = row[0]
-
-        conn.close()
+        self.token_cache.put(token, row[1])
         return token
 
-    def delete_element(self, token: str, id: int) -> None:
+    @timed
+    def set_password_hash(self, user_id: int, old_hash: str, new_hash: str) -> None:
+        """replaces the hash unless the password was changed in the meantime"""
+        self._write(
+            "UPDATE users SET password = ? WHERE id = ? AND password = ?",
+            (new_hash, user_id, old_hash),
+        )
+
+    @timed
+    def delete_element(self, token: str, id: int) -> bool:
+        """returns False when no element with this id belongs to the token"""
+        user_filter, user_param = self._user_filter(token)
+
+        rowcount, _ = self._write(
+            f"""
+            DELETE FROM data
+            WHERE id = ? AND user_id = (SELECT id FROM users WHERE {user_filter})
+            """,
+            (id, user_param),
+        )
+        deleted: bool = rowcount == 1
+
+        if deleted:
+            self.ordering_cache.update(token, lambda ordered: ordered.remove(id))
+        return deleted
+
+    @timed
+    def get_elements_page(
+        self,
+        token: str,
+        window: tuple[str, str],
+        filters: ElementFilter = ElementFilter(),
+        limit: Optional[int] = None,
+        after: Optional[PageCursor] = None,
+    ) -> tuple[list[ElementData], Optional[PageCursor]]:
+        """
+        returns up to `limit` filtered elements in display order and the cursor
+        of the next page, or None on the last page. `window` is the
+        ordering.three_day_window deciding if homework goes first, the first
+        page fixes that choice for all pages after it
+        """
+        if not self.is_token_valid(token):
+            raise InvalidTokenError("user with this token does not exists")
+        user_id: int = self.get_user_id(token)
+
+        day_from, day_to = filters.day_range()
+        first_day, last_day = to_day(window[0]), to_day(window[1])
+
+        conditions: list[str] = ["user_id = :user_id"]
+        parameters: dict[str, Any] = {"user_id": user_id}
+        for column, value in (
+            ("done", None if filters.state is None else filters.state == "done"),
+            ("lesson", filters.lesson),
+            ("type", filters.type),
+        ):
+            if value is not None:
+                conditions.append(f"{column} = :{column}")
+                parameters[column] = value
+        if day_from is not None:
+            conditions.append("date >= :date_from")
+            parameters["date_from"] = day_from
+        if day_to is not None:
+            conditions.append("date <= :date_to")
+            parameters["date_to"] = day_to
+        if after is not None:
+            conditions.append(
+                f"({_ORDER_KEY_SQL}) > (:done, :later, :date, :rank, :id)"
+            )
+            parameters.update(
+                done=after.done,
+                later=after.homework_later,
+                date=after.date,
+                rank=after.type_rank,
+                id=after.id,
+            )
+
+        with self.pool.connection() as conn:
+            cursor: Cursor = conn.cursor()
+
+            if after is not None:
+                upcoming: bool = after.upcoming
+            else:
+                cursor.execute(
+                    """
+                    SELECT EXISTS(
+                        SELECT 1 FROM data
+                        WHERE user_id = ? AND done = 0 AND date BETWEEN ? AND ?
+                    )
+                    """,
+                    (user_id, first_day, last_day),
+                )
+                upcoming = cursor.fetchone()[0] == 1
+            parameters["upcoming"] = upcoming
+
+            limit_sql: str = ""
+            if limit is not None:
+                # one more row tells if there is a next page
+                limit_sql = "LIMIT :limit"
+                parameters["limit"] = limit + 1
+
+            cursor.execute(
+                f"""
+                SELECT {_ELEMENT_COLUMNS_SQL},
+                    {_DONE_SQL}, {_HOMEWORK_LATER_SQL}, {_TYPE_RANK_SQL}, data.date
+                FROM data
+                WHERE {" AND ".join(conditions)}
+                ORDER BY {_ORDER_KEY_SQL}
+                {limit_sql}
+                """,
+                parameters,
+            )
+            rows: list[Any] = cursor.fetchall()
+
+        next_page: Optional[PageCursor] = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            last: Any = rows[-1]
+            next_page = PageCursor(
+                upcoming, bool(last[6]), bool(last[7]), last[9], last[8], last[0]
+            )
+
+        page: list[ElementData] = [
+            {
+                "id": row[0],
+                "type": row[1],
+                "lesson": row[2],
+                "date": row[3],
+                "comment": row[4],
+                "state": row[5],
+            }
+            for row in rows
+        ]
+        return page, next_page
+
+    @timed
+    def get_elements_json(
+        self, token: str, window: tuple[str, str], compact: bool = False
+    ) -> bytes:
+        """
+        returns every element of the token in display order as a UTF-8 JSON
+        array, encoded from the ordering cache, which writes keep up to date,
+        with the JSON of every record cached as well. compact rows are arrays
+        in ELEMENT_FIELDS order instead of objects
+        """
+        if not self.is_token_valid(token):
+            raise InvalidTokenError("user with this token does not exists")
+        work, done = self.get_ordered_elements(token)
+        return elements_json(work, done, window, compact)
+
+    @timed
+    def get_changes(self, token: str, since: int) -> ChangeSet:
+        """returns what changed in the elements of the token after data version `since`"""
+        if not self.is_token_valid(token):
+            raise InvalidTokenError("user with this token does not exists")
         user_id: int = self.get_user_id(token)
 
-        conn: Connection = sqlite3.connect(self.dbPath)
-        cursor: Cursor = conn.cursor()
+        with self.pool.connection() as conn:
+            cursor: Cursor = conn.cursor()
 
-        cursor.execute("DELETE FROM data WHERE (id, user_id) = (?, ?)", (id, user_id))
+            # one read transaction, so the version and the changes are from the same moment
+            cursor.execute("BEGIN")
+            cursor.execute(
+                "SELECT COALESCE(MAX(version), 0) FROM data_versions WHERE user_id = ?",
+                (user_id,),
+            )
+            version: int = cursor.fetchone()[0]
+            if not version - CHANGE_LOG_SIZE <= since <= version:
+                return {"version": version, "reset": True, "changed": [], "deleted": []}
+
+            cursor.execute(
+                """
+                SELECT DISTINCT element_id FROM data_changes
+                WHERE user_id = ? AND version > ?
+                """,
+                (user_id, since),
+            )
+            ids: set[int] = {row[0] for row in cursor.fetchall()}
+            cursor.execute(
+                f"""
+                SELECT {_ELEMENT_COLUMNS_SQL}
+                FROM data_changes JOIN data ON data.id = data_changes.element_id
+                WHERE data_changes.user_id = ? AND data_changes.version > ?
+                GROUP BY data.id
+                ORDER BY data.id
+                """,
+                (user_id, since),
+            )
+            rows: list[Any] = cursor.fetchall()
 
-        conn.commit()
-        conn.close()
+        changed: list[ElementData] = [
+            {
+                "id": row[0],
+                "type": row[1],
+                "lesson": row[2],
+                "date": row[3],
+                "comment": row[4],
+                "state": row[5],
+            }
+            for row in rows
+        ]
+        deleted: list[int] = sorted(ids - {element["id"] for element in changed})
+        return {
+            "version": version,
+            "reset": False,
+            "changed": changed,
+            "deleted": deleted,
+        }
 
+    @timed
+    def get_data_version(self, token: str) -> tuple[int, int]:
+        """
+        returns (user_id, version), the version grows with every change of the
+        user's elements and is 0 before the first one
+        """
+        user_filter, user_param = self._user_filter(token)
+
+        with self.pool.connection() as conn:
+            cursor: Cursor = conn.cursor()
+
+            cursor.execute(
+                f"""
+                SELECT users.id, COALESCE(data_versions.version, 0)
+                FROM users LEFT JOIN data_versions ON data_versions.user_id = users.id
+                WHERE {user_filter}
+                """,
+                (user_param,),
+            )
+            row: Optional[tuple[int, int]] = cursor.fetchone()
+
+        if row is None:
+            self.token_cache.invalidate(token)
+            raise InvalidTokenError("user with this token does not exists")
+        self.token_cache.put(token, row[0])
+        return row
+
+    @timed
+    def get_ordered_elements(self, token: str) -> tuple[list[Element], list[Element]]:
+        """
+        returns (work_data, done_data), each sorted by date and then type,
+        served from the ordering cache when possible
+        """
+        # read before the rows, a write in between leaves the entry outdated, not wrong
+        version: Optional[int] = (
+            self.get_data_version(token)[1] if self.shared else None
+        )
+        partitions: Optional[tuple[list[Element], list[Element]]] = (
+            self.ordering_cache.partitions(token, version)
+        )
+        if partitions is not None:
+            return partitions
+
+        generation: int = self.ordering_cache.generation
+        ordered: OrderedElements = OrderedElements(self.get_element_records(token))
+        self.ordering_cache.store(token, ordered, generation, version)
+        return list(ordered.work), list(ordered.done)
+
+    @timed
+    def get_data_versions(self, user_ids: list[int]) -> dict[int, int]:
+        """user_id -> data version of the given users that have any data yet"""
+        if not user_ids:
+            return {}
+        with self.pool.connection() as conn:
+            rows: list[tuple[int, int]] = conn.execute(
+                f"""
+                SELECT user_id, version FROM data_versions
+                WHERE user_id IN ({", ".join("?" * len(user_ids))})
+                """,
+                user_ids,
+            ).fetchall()
+        return dict(rows)
+
+    @timed
+    def record_login_attempt(
+        self, username: str, attempts: int, period: float, now: Optional[float] = None
+    ) -> float:
+        """
+        LoginRateLimiter.retry_after kept in the database, so every process
+        counts the same attempts: 0 and records the attempt when it is one of
+        `attempts` in the last `period` seconds, otherwise seconds to wait
+        """
+        now = time.time() if now is None else now
+
+        def statement(cursor: Cursor) -> float:
+            cursor.execute(
+                "DELETE FROM login_attempts WHERE time <= ?", (now - period,)
+            )
+            times: list[tuple[float]] = cursor.execute(
+                """
+                SELECT time FROM login_attempts WHERE username = ?
+                ORDER BY time LIMIT ?
+                """,
+                (username, attempts),
+            ).fetchall()
+            if len(times) >= attempts:
+                return times[0][0] + period - now
+            cursor.execute(
+                "INSERT INTO login_attempts (username, time) VALUES (?, ?)",
+                (username, now),
+            )
+            return 0
+
+        return self._submit(statement)
+
+    @timed
     def delete_user(self, token: str) -> None:  # !untested
         """delete_user untested"""
-        conn: Connection = sqlite3.connect(self.dbPath)
-        cursor: Cursor = conn.cursor()
+        self._write("DELETE FROM users WHERE token = ?", (token,))
 
-        cursor.execute("DELETE FROM users WHERE token = ?", (token,))
+        self.token_cache.invalidate(token)
+        self.ordering_cache.invalidate(token)
 
-        conn.commit()
-        conn.close()
+    @timed
+    def rotate_token(self, token: str) -> str:
+        """replaces the token of a user with a new one and returns it"""
+        new_token: str = str(uuid.uuid4())
 
+        rowcount, _ = self._write(
+            "UPDATE users SET token = ? WHERE token = ?", (new_token, token)
+        )
+        rotated: bool = rowcount == 1
+
+        self.token_cache.invalidate(token)
+        self.ordering_cache.invalidate(token)
+        if not rotated:
+            raise InvalidTokenError("user with this token does not exists")
+        return new_token
+
+    @timed
     def is_token_valid(self, token: Optional[str]) -> bool:
-        conn: Connection = sqlite3.connect(self.dbPath)
-        cursor: Cursor = conn.cursor()
+        if token is None:
+            return False
+        if self.token_cache.get(token) is not None:
+            return True
+
+        with self.pool.connection() as conn:
+            cursor: Cursor = conn.cursor()
+
+            cursor.execute("SELECT id FROM users WHERE token = ?", (token,))
+            row: Optional[tuple[int]] = cursor.fetchone()
+
+        if row is None:
+            return False
+        self.token_cache.put(token, row[0])
+        return True
+
+
+class AsyncDatabase:
+    """Coroutine version of a Storage for async endpoints.
+
+    Writes run on `database.writer_threads` writer threads, one after another
+    for a single file (or batched by the group commit writer of `database`),
+    and reads run on a small pool of reader threads, so waiting requests
+    queue up as cheap coroutines instead of each holding a thread of the
+    server threadpool.
+    Lookups that hit the in-memory caches are answered without a thread hop.
+    Password hashing runs on its own `hashers` threads, so a burst of logins
+    can't take the reader threads from data requests.
+    """
+
+    def __init__(self, database: Storage, readers: int = 4, hashers: int = 2) -> None:
+        self.database: Storage = database
+        self._writer: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=database.writer_threads, thread_name_prefix="db-writer"
+        )
+        self._readers: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=readers, thread_name_prefix="db-reader"
+        )
+        # hashlib.scrypt releases the GIL, so these hash in parallel
+        self._hashers: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=hashers, thread_name_prefix="password-hasher"
+        )
+
+    async def _run(
+        self, executor: ThreadPoolExecutor, function: Callable[..., T], *args: Any
+    ) -> T:
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(function, *args))
+
+    async def _read(self, function: Callable[..., T], *args: Any) -> T:
+        return await self._run(self._readers, function, *args)
+
+    async def _write(self, function: Callable[..., T], *args: Any) -> T:
+        return await self._run(self._writer, function, *args)
+
+    async def _hash(self, function: Callable[..., T], *args: Any) -> T:
+        return await self._run(self._hashers, function, *args)
+
+    def close(self) -> None:
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+        self._hashers.shutdown(wait=True)
+        self.database.close()
+
+    async def init_database(self) -> None:
+        await self._write(self.database.init_database)
+
+    async def migrate(self) -> int:
+        return await self._write(self.database.migrate)
+
+    async def get_schema_version(self) -> int:
+        return await self._read(self.database.get_schema_version)
+
+    async def add_user(self, username: str, password: str) -> None:
+        password_hash: str = await self._hash(
+            hash_password, password, self.database.password_hashing
+        )
+        await self._write(self.database.add_user_hash, username, password_hash)
+
+    async def get_user_id(self, token: str) -> int:
+        return await self._read(self.database.get_user_id, token)
+
+    async def add_element(self, data: ElementData, token: str) -> bool:
+        return await self._write(self.database.add_element, data, token)
+
+    async def add_elements(self, data: list[ElementData], token: str) -> int:
+        return await self._write(self.database.add_elements, data, token)
+
+    async def change_state_of_element(
+        self, state: Literal["work", "done"], element_id: int, token: str
+    ) -> bool:
+        return await self._write(
+            self.database.change_state_of_element, state, element_id, token
+        )
+
+    async def get_elements_from_token(self, token: str) -> list[ElementData]:
+        return await self._read(self.database.get_elements_from_token, token)
+
+    async def get_element_records(self, token: str) -> list[Element]:
+        return await self._read(self.database.get_element_records, token)
+
+    async def iter_elements(self, token: str) -> Iterator[ElementData]:
+        """
+        checks the token and returns a blocking iterator of the elements, to be
+        consumed on a worker thread, like StreamingResponse does
+        """
+        if not await self.is_token_valid(token):
+            raise InvalidTokenError("user with this token does not exists")
+        return await self._read(self.database.iter_elements, token)
+
+    async def get_token_from_credentials(self, username: str, password: str) -> str:
+        """Database.get_token_from_credentials with hashing on the hasher threads"""
+        cost: PasswordHashing = self.database.password_hashing
+        row: Optional[tuple[str, int, str]] = await self._read(
+            self.database.get_credentials, username
+        )
+        verified: bool = await self._hash(
+            self.database.verify_credentials, password, row
+        )
+        if not verified or row is None:
+            raise InvalidCredentialsError("user with this credentials  does not exists")
+
+        if password_needs_rehash(row[2], cost):
+            new_hash: str = await self._hash(hash_password, password, cost)
+            await self._write(self.database.set_password_hash, row[1], row[2], new_hash)
+        return self.database.accept_credentials(row)
+
+    async def delete_element(self, token: str, id: int) -> bool:
+        return await self._write(self.database.delete_element, token, id)
+
+    async def get_elements_page(
+        self,
+        token: str,
+        window: tuple[str, str],
+        filters: ElementFilter = ElementFilter(),
+        limit: Optional[int] = None,
+        after: Optional[PageCursor] = None,
+    ) -> tuple[list[ElementData], Optional[PageCursor]]:
+        return await self._read(
+            self.database.get_elements_page, token, window, filters, limit, after
+        )
+
+    async def get_elements_json(
+        self, token: str, window: tuple[str, str], compact: bool = False
+    ) -> bytes:
+        return await self._read(self.database.get_elements_json, token, window, compact)
+
+    async def get_changes(self, token: str, since: int) -> ChangeSet:
+        return await self._read(self.database.get_changes, token, since)
+
+    async def get_data_version(self, token: str) -> tuple[int, int]:
+        return await self._read(self.database.get_data_version, token)
+
+    async def get_ordered_elements(
+        self, token: str
+    ) -> tuple[list[Element], list[Element]]:
+        partitions: Optional[tuple[list[Element], list[Element]]] = (
+            self.database.cached_ordered_elements(token)
+        )
+        if partitions is not None:
+            return partitions
+        return await self._read(self.database.get_ordered_elements, token)
+
+    async def get_data_versions(self, user_ids: list[int]) -> dict[int, int]:
+        return await self._read(self.database.get_data_versions, user_ids)
+
+    async def record_login_attempt(
+        self, username: str, attempts: int, period: float
+    ) -> float:
+        return await self._write(
+            self.database.record_login_attempt, username, attempts, period
+        )
+
+    async def delete_user(self, token: str) -> None:
+        await self._write(self.database.delete_user, token)
 
-        cursor.execute("SELECT EXISTS(SELECT 1 FROM users WHERE token = ?)", (token,))
-        exists: bool = cursor.fetchone()[0] == 1
+    async def rotate_token(self, token: str) -> str:
+        return await self._write(self.database.rotate_token, token)
 
-        conn.close()
-        return exists
+    async def is_token_valid(self, token: Optional[str]) -> bool:
+        if token is not None and self.database.is_token_cached(token):
+            return True
+        return await self._read(self.database.is_token_valid, token)
 
 
 if __name__ == "__main__":
     db: Database = Database("database.sqlite")
     db.add_user("rys", "kowalski")
+    db.close()
@@ -6,15 +6,21 @@ async function checkLogin() {
 }
 
 async function log_in() {
+  if (hydrate()) {
+    listenForChanges();
+    return
+  }
   if (await checkLogin()) {
     status.textContent = "Login successful.";
     document.getElementById("login-container").classList.add("hidden");
     document.getElementById("main").classList.remove("hidden");
     await loadData();
+    listenForChanges();
   }
 }
 
 async function log_out() {
+  stopListening()
   await fetch("/logout", {
     method: "POST"
   })
@@ -36,11 +42,54 @@ async function login() {
     document.getElementById("login-container").classList.add("hidden");
     document.getElementById("main").classList.remove("hidden");
     await loadData();
+    listenForChanges();
   } else {
     status.textContent = "Login failed.";
   }
 }
 
+let dataVersion = null
+const elements = new Map() // id -> element shown in the table
+const rows = new Map() // id -> <tr> of that element
+
+const TYPE_ORDER = { sprawdz: 0, kartk: 1, homework: 2 }
+
+function compareKeys(a, b) {
+  for (let i = 0; i < a.length; i++) {
+    if (a[i] < b[i]) return -1
+    if (a[i] > b[i]) return 1
+  }
+  return 0
+}
+
+// same order as order_key in ordering.py, window comes from the server
+function sortElements(list, [first, last]) {
+  const upcoming = list.some(e => e.state !== 'done' && first <= e.date && e.date <= last)
+  const key = e => {
+    const done = e.state === 'done'
+    const homeworkLater = !done && !upcoming && e.type !== 'homework'
+    return [done ? 1 : 0, homeworkLater ? 1 : 0, e.date, TYPE_ORDER[e.type] ?? 2, e.id]
+  }
+  return list
+    .map(e => [key(e), e])
+    .sort((a, b) => compareKeys(a[0], b[0]))
+    .map(pair => pair[1])
+}
+
+function makeRow(item) {
+  const tr = document.createElement("tr");
+  tr.innerHTML = `
+          <td>${item.lesson}</td>
+          <td>${item.type}</td>
+          <td>${new Date(item.date).toLocaleDateString()}</td>
+          <td><t>${item.comment}</t></td>
+          <td><button onclick="action(${item.id}, '${item.state}')" class="${action_button_state}_button action_button">${action_button_state}</button></td>
+      `;
+  tr.classList.add(item.state)
+  tr.classList.add(item.type)
+  return tr
+}
+
 async function loadData() {
   const response = await fetch("/get_data");
   if (!response.ok) {
@@ -49,24 +98,101 @@ async function loadData() {
   }
 
   const data = await response.json();
+  dataVersion = Number(response.headers.get("X-Data-Version"))
   const tbody = document.getElementById("table-body");
   tbody.innerHTML = "";
+  elements.clear()
+  rows.clear()
 
   data.forEach(item => {
-    const tr = document.createElement("tr");
-    tr.innerHTML = `
-            <td>${item.lesson}</td>
-            <td>${item.type}</td>
-            <td>${new Date(item.date).toLocaleDateString()}</td>
-            <td><t>${item.comment}</t></td>
-            <td><button onclick="action(${item.id}, '${item.state}')" class="${action_button_state}_button action_button">switch</button></td>
-        `;
-    tr.classList.add(item.state)
-    tr.classList.add(item.type)
+    const tr = makeRow(item)
+    elements.set(item.id, item)
+    rows.set(item.id, tr)
     tbody.appendChild(tr);
   });
 }
 
+// takes over the table the server rendered into the page, see pages.py
+function hydrate() {
+  const initial = document.getElementById("initial-data")
+  if (initial === null) return false
+
+  const tbody = document.getElementById("table-body")
+  dataVersion = Number(tbody.dataset.version)
+  JSON.parse(initial.textContent).forEach(item => {
+    elements.set(item.id, item)
+    rows.set(item.id, tbody.querySelector(`tr[data-id="${item.id}"]`))
+  })
+  initial.remove()
+  return true
+}
+
+// applies only what changed since the last load instead of rebuilding the table
+async function syncChanges() {
+  if (dataVersion === null) {
+    await loadData()
+    return
+  }
+
+  const response = await fetch(`/changes?since=${dataVersion}`);
+  if (!response.ok) {
+    alert("Invalid token or unauthorized.");
+    return;
+  }
+
+  const changes = await response.json();
+  if (changes.reset) {
+    await loadData()
+    return
+  }
+  dataVersion = changes.version
+
+  const tbody = document.getElementById("table-body");
+  changes.deleted.forEach(id => {
+    rows.get(id)?.remove()
+    rows.delete(id)
+    elements.delete(id)
+  })
+  changes.changed.forEach(item => {
+    rows.get(item.id)?.remove()
+    rows.set(item.id, makeRow(item))
+    elements.set(item.id, item)
+  })
+
+  // moves only the rows that are not in their place yet
+  sortElements([...elements.values()], changes.window).forEach((item, index) => {
+    const tr = rows.get(item.id)
+    if (tbody.children[index] !== tr) {
+      tbody.insertBefore(tr, tbody.children[index] ?? null)
+    }
+  })
+}
+
+let events = null
+let syncing = Promise.resolve()
+
+// one sync at a time, a change made here and pushed back by /events is applied once
+function queueSync() {
+  syncing = syncing.then(syncChanges, syncChanges)
+  return syncing
+}
+
+// changes made on other devices arrive as the new data version
+function listenForChanges() {
+  stopListening()
+  events = new EventSource("/events")
+  events.addEventListener("version", event => {
+    if (dataVersion === null || Number(event.data) > dataVersion) {
+      queueSync()
+    }
+  })
+}
+
+function stopListening() {
+  events?.close()
+  events = null
+}
+
 async function addData() {
   const data = {
     id: 0,
@@ -84,7 +210,7 @@ async function addData() {
   });
 
   if (response.ok) {
-    await loadData();
+    await queueSync();
   } else {
     alert("Failed to add data.");
   }
@@ -107,7 +233,7 @@ async function action(element_id, state) {
     });
 
     if (response.ok) {
-      await loadData();
+      await queueSync();
     } else {
       alert("Failed to change state")
     }
@@ -119,7 +245,7 @@ async function deleteData(id) {
     method: "DELETE"
   });
   if (response.ok) {
-    await loadData();
+    await queueSync();
   } else {
     alert("Failed to delete data.");
   }
@@ -0,0 +1,579 @@
+"""
+Storage kept in dicts of the server process, for tests and for a server that
+answers without a trip to SQLite. With a snapshot file the data outlives the
+process: the file is loaded on start and written again every
+`snapshot_seconds` when something changed, and on close. Writes after the last
+snapshot are lost when the process dies.
+"""
+
+import bisect
+import functools
+import itertools
+import json
+import operator
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Iterator, Literal, Optional
+
+from db_stuff import (
+    CHANGE_LOG_SIZE,
+    DEFAULT_PASSWORD_HASHING,
+    ELEMENT_TYPES,
+    LESSON_CODES,
+    LESSONS,
+    MIGRATIONS,
+    TYPE_ORDER,
+    ChangeSet,
+    DatabaseStats,
+    Element,
+    ElementData,
+    ElementFilter,
+    InvalidCredentialsError,
+    InvalidTokenError,
+    OrderedElements,
+    PageCursor,
+    PasswordHashing,
+    display_key,
+    display_order,
+    elements_json,
+    hash_password,
+    is_upcoming,
+    password_needs_rehash,
+    timed,
+    verify_password,
+)
+
+# written into snapshots, files of another format are refused instead of misread
+SNAPSHOT_FORMAT: int = 1
+
+
+class MemoryUser:
+    """a users row together with the elements and the change log of the user"""
+
+    __slots__ = (
+        "id",
+        "username",
+        "password",
+        "token",
+        "elements",
+        "version",
+        "changes",
+    )
+
+    def __init__(self, id: int, username: str, password: str, token: str) -> None:
+        self.id: int = id
+        self.username: str = username
+        self.password: str = password
+        self.token: str = token
+        self.elements: OrderedElements = OrderedElements([])
+        self.version: int = 0
+        # (version, element id) of the last changes, like data_changes
+        self.changes: deque[tuple[int, int]] = deque(maxlen=CHANGE_LOG_SIZE)
+
+    def changed(self, element_id: int) -> None:
+        self.version += 1
+        self.changes.append((self.version, element_id))
+
+    def records(self) -> list[Element]:
+        return sorted(
+            itertools.chain(self.elements.work, self.elements.done),
+            key=operator.attrgetter("id"),
+        )
+
+
+class MemoryDatabase:
+    """
+    Storage in dicts behind one lock, every call is a few dict and list
+    operations. Element ids come from one sequence for all users, like the
+    AUTOINCREMENT of data, and data versions and changes behave like the
+    triggers of Database, so clients can't tell the two apart. Only one
+    process can use it, `shared` is always False.
+    """
+
+    def __init__(
+        self,
+        snapshot_path: Optional[str] = None,
+        snapshot_seconds: Optional[float] = None,
+        password_hashing: PasswordHashing = DEFAULT_PASSWORD_HASHING,
+        stats: Optional[DatabaseStats] = None,
+    ) -> None:
+        self.snapshot_path: Optional[str] = snapshot_path
+        self.password_hashing: PasswordHashing = password_hashing
+        self.shared: bool = False
+        self.stats: DatabaseStats = stats if stats is not None else DatabaseStats()
+        self._lock: threading.Lock = threading.Lock()
+        self._users: dict[int, MemoryUser] = {}
+        self._by_token: dict[str, MemoryUser] = {}
+        self._by_username: dict[str, MemoryUser] = {}
+        self._login_attempts: dict[str, list[float]] = {}
+        self._last_user_id: int = 0
+        self._last_element_id: int = 0
+        self._writes: int = 0
+        self._saved_writes: int = 0
+
+        if snapshot_path is not None and os.path.exists(snapshot_path):
+            self._load(snapshot_path)
+        self._stop: threading.Event = threading.Event()
+        self._snapshotter: Optional[threading.Thread] = None
+        if snapshot_path is not None and snapshot_seconds is not None:
+            self._snapshotter = threading.Thread(
+                target=self._snapshot_every,
+                args=(snapshot_seconds,),
+                name="memory-snapshot",
+                daemon=True,
+            )
+            self._snapshotter.start()
+
+    @functools.cached_property
+    def dummy_password_hash(self) -> str:
+        """verified against for unknown usernames, so they take as long as known ones"""
+        return hash_password("", self.password_hashing)
+
+    @property
+    def writer_threads(self) -> int:
+        """writes AsyncDatabase may run at once, more would only wait for the lock"""
+        return 1
+
+    def cached_ordered_elements(
+        self, token: str
+    ) -> Optional[tuple[list[Element], list[Element]]]:
+        with self._lock:
+            user: Optional[MemoryUser] = self._by_token.get(token)
+            if user is None:
+                return None
+            return list(user.elements.work), list(user.elements.done)
+
+    def is_token_cached(self, token: str) -> bool:
+        return token in self._by_token
+
+    def close(self) -> None:
+        if self._snapshotter is not None:
+            self._stop.set()
+            self._snapshotter.join()
+            self._snapshotter = None
+        self.snapshot()
+
+    def snapshot(self) -> bool:
+        """writes the snapshot file when anything changed since the last one"""
+        if self.snapshot_path is None:
+            return False
+        with self._lock:
+            writes: int = self._writes
+            if writes == self._saved_writes:
+                return False
+            # elements are never changed in place, so copies of the lists will do
+            users: list[tuple[int, str, str, str, int, list, list[Element]]] = [
+                (
+                    user.id,
+                    user.username,
+                    user.password,
+                    user.token,
+                    user.version,
+                    list(user.changes),
+                    user.records(),
+                )
+                for user in self._users.values()
+            ]
+            state: dict[str, Any] = {
+                "format": SNAPSHOT_FORMAT,
+                "last_user_id": self._last_user_id,
+                "last_element_id": self._last_element_id,
+            }
+
+        state["users"] = [
+            [
+                *user[:6],
+                [
+                    [
+                        element.id,
+                        ELEMENT_TYPES[element.type],
+                        LESSONS[element.lesson],
+                        element.date,
+                        element.comment,
+                        int(element.done),
+                    ]
+                    for element in user[6]
+                ],
+            ]
+            for user in users
+        ]
+        partial: str = self.snapshot_path + ".partial"
+        with open(partial, "w") as file:
+            json.dump(state, file, ensure_ascii=False, separators=(",", ":"))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(partial, self.snapshot_path)
+        self._saved_writes = writes
+        return True
+
+    def _snapshot_every(self, seconds: float) -> None:
+        while not self._stop.wait(seconds):
+            try:
+                self.snapshot()
+            except OSError:
+                pass  # tried again next time, close raises it
+
+    def _load(self, path: str) -> None:
+        with open(path) as file:
+            state: dict[str, Any] = json.load(file)
+        if state.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"{path} is not a snapshot of format {SNAPSHOT_FORMAT}")
+
+        self._last_user_id = state["last_user_id"]
+        self._last_element_id = state["last_element_id"]
+        for id, username, password, token, version, changes, rows in state["users"]:
+            user: MemoryUser = MemoryUser(id, username, password, token)
+            user.elements = OrderedElements([Element.from_row(row) for row in rows])
+            user.version = version
+            user.changes.extend((change[0], change[1]) for change in changes)
+            self._register(user)
+
+    def _register(self, user: MemoryUser) -> None:
+        self._users[user.id] = user
+        self._by_token[user.token] = user
+        self._by_username[user.username] = user
+
+    def _user(self, token: str) -> MemoryUser:
+        user: Optional[MemoryUser] = self._by_token.get(token)
+        if user is None:
+            raise InvalidTokenError("user with this token does not exists")
+        return user
+
+    @timed
+    def init_database(self) -> None:
+        """nothing to create, the snapshot is loaded when the database is made"""
+
+    @timed
+    def get_schema_version(self) -> int:
+        return len(MIGRATIONS)
+
+    @timed
+    def migrate(self) -> int:
+        return len(MIGRATIONS)
+
+    @timed
+    def add_user(self, username: str, password: str) -> None:
+        self.add_user_hash(username, hash_password(password, self.password_hashing))
+
+    @timed
+    def add_user_hash(
+        self,
+        username: str,
+        password_hash: str,
+        user_id: Optional[int] = None,
+        token: Optional[str] = None,
+    ) -> None:
+        token = token or str(uuid.uuid4())
+        with self._lock:
+            if (
+                username in self._by_username
+                or token in self._by_token
+                or user_id in self._users
+            ):
+                # what Database raises for its unique columns
+                raise sqlite3.IntegrityError("UNIQUE constraint failed: users")
+            if user_id is None:
+                user_id = self._last_user_id + 1
+            self._last_user_id = max(self._last_user_id, user_id)
+            self._register(MemoryUser(user_id, username, password_hash, token))
+            self._writes += 1
+
+    @timed
+    def get_user_id(self, token: str) -> int:
+        with self._lock:
+            return self._user(token).id
+
+    @timed
+    def add_element(self, data: ElementData, token: str) -> bool:
+        """returns False when the token does not belong to any user"""
+        element: Element = Element.from_data({**data, "id": 0})
+        with self._lock:
+            user: Optional[MemoryUser] = self._by_token.get(token)
+            if user is None:
+                return False
+            self._last_element_id += 1
+            element.id = self._last_element_id
+            user.elements.insert(element)
+            user.changed(element.id)
+            self._writes += 1
+        return True
+
+    @timed
+    def add_elements(self, data: list[ElementData], token: str) -> int:
+        """
+        adds all elements and returns how many were added, raises
+        InvalidTokenError when the token does not belong to any user
+        """
+        # converted up front, so a bad date fails before anything is written
+        elements: list[Element] = [
+            Element.from_data({**element, "id": 0}) for element in data
+        ]
+        with self._lock:
+            user: MemoryUser = self._user(token)
+            for element in elements:
+                self._last_element_id += 1
+                element.id = self._last_element_id
+                user.elements.insert(element)
+                user.changed(element.id)
+            self._writes += 1
+        return len(elements)
+
+    @timed
+    def change_state_of_element(
+        self, state: Literal["work", "done"], element_id: int, token: str
+    ) -> bool:
+        """returns False when no element with this id belongs to the token"""
+        with self._lock:
+            user: Optional[MemoryUser] = self._by_token.get(token)
+            if user is None or user.elements.get(element_id) is None:
+                return False
+            user.elements.set_state(element_id, state)
+            user.changed(element_id)
+            self._writes += 1
+        return True
+
+    @timed
+    def get_elements_from_token(self, token: str) -> list[ElementData]:
+        return [element.to_data() for element in self.get_element_records(token)]
+
+    @timed
+    def get_element_records(self, token: str) -> list[Element]:
+        with self._lock:
+            return self._user(token).records()
+
+    @timed
+    def iter_elements(self, token: str, chunk_size: int = 500) -> Iterator[ElementData]:
+        """
+        yields elements of the token in id order as they were when called,
+        raises InvalidTokenError right away, `chunk_size` makes no difference
+        """
+        records: list[Element] = self.get_element_records(token)
+        return (element.to_data() for element in records)
+
+    @timed
+    def get_token_from_credentials(self, username: str, password: str) -> str:
+        row: Optional[tuple[str, int, str]] = self.get_credentials(username)
+        if not self.verify_credentials(password, row) or row is None:
+            raise InvalidCredentialsError("user with this credentials  does not exists")
+
+        if password_needs_rehash(row[2], self.password_hashing):
+            self.set_password_hash(
+                row[1], row[2], hash_password(password, self.password_hashing)
+            )
+        return self.accept_credentials(row)
+
+    @timed
+    def get_credentials(self, username: str) -> Optional[tuple[str, int, str]]:
+        """returns (token, user id, password hash) of the username"""
+        with self._lock:
+            user: Optional[MemoryUser] = self._by_username.get(username)
+            if user is None:
+                return None
+            return user.token, user.id, user.password
+
+    @timed
+    def verify_credentials(
+        self, password: str, row: Optional[tuple[str, int, str]]
+    ) -> bool:
+        """checks the password against a row of get_credentials, slow on purpose"""
+        if row is None:
+            verify_password(password, self.dummy_password_hash)
+            return False
+        return verify_password(password, row[2])
+
+    @timed
+    def accept_credentials(self, row: tuple[str, int, str]) -> str:
+        return row[0]
+
+    @timed
+    def set_password_hash(self, user_id: int, old_hash: str, new_hash: str) -> None:
+        """replaces the hash unless the password was changed in the meantime"""
+        with self._lock:
+            user: Optional[MemoryUser] = self._users.get(user_id)
+            if user is not None and user.password == old_hash:
+                user.password = new_hash
+                self._writes += 1
+
+    @timed
+    def delete_element(self, token: str, id: int) -> bool:
+        """returns False when no element with this id belongs to the token"""
+        with self._lock:
+            user: Optional[MemoryUser] = self._by_token.get(token)
+            if user is None or user.elements.remove(id) is None:
+                return False
+            user.changed(id)
+            self._writes += 1
+        return True
+
+    @timed
+    def get_elements_page(
+        self,
+        token: str,
+        window: tuple[str, str],
+        filters: ElementFilter = ElementFilter(),
+        limit: Optional[int] = None,
+        after: Optional[PageCursor] = None,
+    ) -> tuple[list[ElementData], Optional[PageCursor]]:
+        """Database.get_elements_page"""
+        with self._lock:
+            user: MemoryUser = self._user(token)
+            work: list[Element] = list(user.elements.work)
+            done: list[Element] = list(user.elements.done)
+
+        upcoming: bool = (
+            after.upcoming if after is not None else is_upcoming(work, window)
+        )
+        day_from, day_to = filters.day_range()
+        state: Optional[bool] = (
+            None if filters.state is None else filters.state == "done"
+        )
+        lesson: Optional[int] = (
+            None if filters.lesson is None else LESSON_CODES[filters.lesson]
+        )
+        element_type: Optional[int] = (
+            None if filters.type is None else TYPE_ORDER[filters.type]
+        )
+        start: Optional[tuple[bool, bool, int, int, int]] = (
+            None if after is None else after.key()
+        )
+
+        matching: Iterator[Element] = (
+            element
+            for element in display_order(work, done, upcoming)
+            if (state is None or element.done == state)
+            and (lesson is None or element.lesson == lesson)
+            and (element_type is None or element.type == element_type)
+            and (day_from is None or element.date >= day_from)
+            and (day_to is None or element.date <= day_to)
+            and (start is None or display_key(element, upcoming) > start)
+        )
+        # one more element tells if there is a next page
+        rows: list[Element] = list(
+            itertools.islice(matching, None if limit is None else limit + 1)
+        )
+
+        next_page: Optional[PageCursor] = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_page = PageCursor(upcoming, *display_key(rows[-1], upcoming))
+        return [element.to_data() for element in rows], next_page
+
+    @timed
+    def get_elements_json(
+        self, token: str, window: tuple[str, str], compact: bool = False
+    ) -> bytes:
+        """Database.get_elements_json, with the same bytes"""
+        with self._lock:
+            user: MemoryUser = self._user(token)
+            work: list[Element] = list(user.elements.work)
+            done: list[Element] = list(user.elements.done)
+
+        return elements_json(work, done, window, compact)
+
+    @timed
+    def get_changes(self, token: str, since: int) -> ChangeSet:
+        """returns what changed in the elements of the token after data version `since`"""
+        with self._lock:
+            user: MemoryUser = self._user(token)
+            version: int = user.version
+            if not version - CHANGE_LOG_SIZE <= since <= version:
+                return {"version": version, "reset": True, "changed": [], "deleted": []}
+
+            ids: set[int] = {
+                element_id for change, element_id in user.changes if change > since
+            }
+            changed: list[Element] = sorted(
+                (
+                    element
+                    for element in map(user.elements.get, ids)
+                    if element is not None
+                ),
+                key=operator.attrgetter("id"),
+            )
+
+        return {
+            "version": version,
+            "reset": False,
+            "changed": [element.to_data() for element in changed],
+            "deleted": sorted(ids - {element.id for element in changed}),
+        }
+
+    @timed
+    def get_data_version(self, token: str) -> tuple[int, int]:
+        """
+        returns (user_id, version), the version grows with every change of the
+        user's elements and is 0 before the first one
+        """
+        with self._lock:
+            user: MemoryUser = self._user(token)
+            return user.id, user.version
+
+    @timed
+    def get_ordered_elements(self, token: str) -> tuple[list[Element], list[Element]]:
+        """returns (work_data, done_data), each sorted by date and then type"""
+        with self._lock:
+            user: MemoryUser = self._user(token)
+            return list(user.elements.work), list(user.elements.done)
+
+    @timed
+    def get_data_versions(self, user_ids: list[int]) -> dict[int, int]:
+        """user_id -> data version of the given users that have any data yet"""
+        with self._lock:
+            return {
+                user_id: self._users[user_id].version
+                for user_id in user_ids
+                if user_id in self._users and self._users[user_id].version
+            }
+
+    @timed
+    def record_login_attempt(
+        self, username: str, attempts: int, period: float, now: Optional[float] = None
+    ) -> float:
+        """Database.record_login_attempt for this process"""
+        now = time.time() if now is None else now
+        with self._lock:
+            if len(self._login_attempts) > 1024:
+                for name, times in list(self._login_attempts.items()):
+                    if not times or times[-1] <= now - period:
+                        del self._login_attempts[name]
+
+            times: list[float] = [
+                attempt
+                for attempt in self._login_attempts.get(username, [])
+                if attempt > now - period
+            ]
+            self._login_attempts[username] = times
+            if len(times) >= attempts:
+                return times[0] + period - now
+            bisect.insort(times, now)
+            return 0
+
+    @timed
+    def delete_user(self, token: str) -> None:
+        with self._lock:
+            user: Optional[MemoryUser] = self._by_token.pop(token, None)
+            if user is None:
+                return
+            del self._users[user.id]
+            del self._by_username[user.username]
+            self._writes += 1
+
+    @timed
+    def rotate_token(self, token: str) -> str:
+        """replaces the token of a user with a new one and returns it"""
+        new_token: str = str(uuid.uuid4())
+        with self._lock:
+            user: MemoryUser = self._user(token)
+            del self._by_token[token]
+            user.token = new_token
+            self._by_token[new_token] = user
+            self._writes += 1
+        return new_token
+
+    @timed
+    def is_token_valid(self, token: Optional[str]) -> bool:
+        return token is not None and token in self._by_token
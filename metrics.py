@@ -0,0 +1,439 @@
+import bisect
+import cProfile
+import json
+import os
+import re
+import sys
+import threading
+import time
+from types import CodeType, FrameType
+from typing import Any, Literal, Optional, Union
+
+# seconds, from a cached read to a request stuck behind the password hashers
+DEFAULT_BUCKETS: tuple[float, ...] = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+# text exposition format read by prometheus and most other scrapers
+CONTENT_TYPE: str = "text/plain; version=0.0.4; charset=utf-8"
+
+ProfileMode = Literal["sample", "cprofile"]
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: dict[str, str]) -> str:
+    """{"method": "GET"} -> {method="GET"}"""
+    if not labels:
+        return ""
+    return (
+        "{"
+        + ",".join(f'{name}="{escape(value)}"' for name, value in labels.items())
+        + "}"
+    )
+
+
+def sample_line(name: str, labels: dict[str, str], value: float) -> str:
+    return f"{name}{format_labels(labels)} {format_value(value)}"
+
+
+def header(name: str, kind: str, help: str) -> list[str]:
+    return [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+
+
+class Histogram:
+    """counts of observed values per bucket, bucket i holds values <= buckets[i]"""
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets: tuple[float, ...] = buckets
+        self.counts: list[int] = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum: float = 0.0
+        self.count: int = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, counts: list[int], total: float) -> None:
+        """adds the counts and sum of a histogram with the same buckets"""
+        self.counts = [mine + other for mine, other in zip(self.counts, counts)]
+        self.sum += total
+        self.count += sum(counts)
+
+    def lines(self, name: str, labels: dict[str, str]) -> list[str]:
+        result: list[str] = []
+        cumulative: int = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            result.append(
+                sample_line(
+                    name + "_bucket", {**labels, "le": format_value(bound)}, cumulative
+                )
+            )
+        result.append(sample_line(name + "_sum", labels, self.sum))
+        result.append(sample_line(name + "_count", labels, self.count))
+        return result
+
+
+class RequestMetrics:
+    """
+    latency histograms and response counts per route, updated from the event
+    loop only so nothing is locked, routes are the path templates so ids in
+    urls do not make new series
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets: tuple[float, ...] = buckets
+        self.in_flight: int = 0
+        self.latency: dict[tuple[str, str], Histogram] = {}  # (method, route)
+        self.responses: dict[tuple[str, str, int], int] = {}  # (.., status)
+
+    def started(self) -> None:
+        self.in_flight += 1
+
+    def finished(self, method: str, route: str, status: int, seconds: float) -> None:
+        self.in_flight -= 1
+        self.histogram(method, route).observe(seconds)
+        key: tuple[str, str, int] = (method, route, status)
+        self.responses[key] = self.responses.get(key, 0) + 1
+
+    def histogram(self, method: str, route: str) -> Histogram:
+        histogram: Optional[Histogram] = self.latency.get((method, route))
+        if histogram is None:
+            histogram = self.latency[(method, route)] = Histogram(self.buckets)
+        return histogram
+
+    def snapshot(self) -> dict[str, Any]:
+        """everything counted so far as JSON types, for merge in another process"""
+        return {
+            "in_flight": self.in_flight,
+            "latency": [
+                [method, route, histogram.counts, histogram.sum]
+                for (method, route), histogram in self.latency.items()
+            ],
+            "responses": [
+                [method, route, status, count]
+                for (method, route, status), count in self.responses.items()
+            ],
+        }
+
+    def merge(self, snapshot: dict[str, Any]) -> None:
+        self.in_flight += snapshot["in_flight"]
+        for method, route, counts, total in snapshot["latency"]:
+            self.histogram(method, route).merge(counts, total)
+        for method, route, status, count in snapshot["responses"]:
+            key: tuple[str, str, int] = (method, route, status)
+            self.responses[key] = self.responses.get(key, 0) + count
+
+    def lines(self) -> list[str]:
+        result: list[str] = header(
+            "http_requests_in_flight", "gauge", "Requests being handled."
+        )
+        result.append(sample_line("http_requests_in_flight", {}, self.in_flight))
+
+        result += header(
+            "http_request_duration_seconds",
+            "histogram",
+            "Time until the response headers were ready.",
+        )
+        for (method, route), histogram in sorted(self.latency.items()):
+            result += histogram.lines(
+                "http_request_duration_seconds", {"method": method, "route": route}
+            )
+
+        result += header("http_responses_total", "counter", "Responses sent.")
+        for (method, route, status), count in sorted(self.responses.items()):
+            result.append(
+                sample_line(
+                    "http_responses_total",
+                    {"method": method, "route": route, "status": str(status)},
+                    count,
+                )
+            )
+        return result
+
+
+def database_lines(snapshot: dict[str, dict[str, float]]) -> list[str]:
+    """metrics of a DatabaseStats snapshot"""
+    result: list[str] = []
+    for name, key, label, kind, help in (
+        ("db_calls_total", "calls", "method", "counter", "Database method calls."),
+        (
+            "db_call_errors_total",
+            "errors",
+            "method",
+            "counter",
+            "Database method calls that raised.",
+        ),
+        (
+            "db_call_seconds_total",
+            "seconds",
+            "method",
+            "counter",
+            "Time spent in database methods.",
+        ),
+        (
+            "db_statements_total",
+            "statements",
+            "kind",
+            "counter",
+            "SQL statements executed, by first keyword.",
+        ),
+        (
+            "db_statement_seconds_total",
+            "statement_seconds",
+            "kind",
+            "counter",
+            "Time spent executing SQL statements, without fetching rows.",
+        ),
+        (
+            "db_cache_hits_total",
+            "cache_hits",
+            "cache",
+            "counter",
+            "Lookups answered by an in-memory cache.",
+        ),
+        (
+            "db_cache_misses_total",
+            "cache_misses",
+            "cache",
+            "counter",
+            "Lookups an in-memory cache could not answer.",
+        ),
+        ("db_cache_entries", "cache_entries", "cache", "gauge", "Entries cached."),
+    ):
+        result += header(name, kind, help)
+        for value_label, value in sorted(snapshot.get(key, {}).items()):
+            result.append(sample_line(name, {label: value_label}, value))
+    return result
+
+
+def add_counts(
+    totals: dict[str, dict[str, float]], counts: dict[str, dict[str, float]]
+) -> None:
+    """adds DatabaseStats snapshots of several processes up in `totals`"""
+    for key, values in counts.items():
+        total: dict[str, float] = totals.setdefault(key, {})
+        for name, value in values.items():
+            total[name] = total.get(name, 0) + value
+
+
+def render(snapshots: list[dict[str, Any]], gauges_help: dict[str, str]) -> str:
+    """
+    the metrics page of snapshots with "requests" of RequestMetrics.snapshot,
+    "database" of DatabaseStats.snapshot and "gauges" by name, summed up
+    """
+    requests: RequestMetrics = RequestMetrics()
+    database: dict[str, dict[str, float]] = {}
+    gauges: dict[str, float] = {}
+    for snapshot in snapshots:
+        requests.merge(snapshot["requests"])
+        add_counts(database, snapshot["database"])
+        for name, value in snapshot["gauges"].items():
+            gauges[name] = gauges.get(name, 0) + value
+
+    lines: list[str] = requests.lines() + database_lines(database)
+    for name, help in gauges_help.items():
+        lines += header(name, "gauge", help)
+        lines.append(sample_line(name, {}, gauges.get(name, 0)))
+    return "\n".join(lines) + "\n"
+
+
+class MetricsExchange:
+    """
+    worker processes each write a snapshot of their metrics to `directory`,
+    so whichever worker answers /metrics can add up all of them
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory: str = directory
+        self.path: str = os.path.join(directory, f"{os.getpid()}.json")
+
+    def publish(self, snapshot: dict[str, Any]) -> None:
+        # written next to it and renamed, readers never see half a file
+        partial: str = self.path + ".partial"
+        with open(partial, "w") as file:
+            json.dump(snapshot, file)
+        os.replace(partial, self.path)
+
+    def collect(self) -> list[dict[str, Any]]:
+        """snapshots of the other workers that are still running"""
+        snapshots: list[dict[str, Any]] = []
+        for name in os.listdir(self.directory):
+            path: str = os.path.join(self.directory, name)
+            if not name.endswith(".json") or path == self.path:
+                continue
+            if not is_running(int(name.removesuffix(".json"))):
+                remove_file(path)
+                continue
+            try:
+                with open(path) as file:
+                    snapshots.append(json.load(file))
+            except (OSError, ValueError):
+                continue  # removed by its worker meanwhile
+        return snapshots
+
+    def remove(self) -> None:
+        remove_file(self.path)
+
+
+def remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def is_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def fold(frame: Optional[FrameType], thread_name: str) -> str:
+    """a stack as one line of folded frames, outermost first, as flamegraph.pl reads"""
+    frames: list[str] = []
+    while frame is not None:
+        code: CodeType = frame.f_code
+        frames.append(
+            f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        )
+        frame = frame.f_back
+    frames.append(thread_name)
+    return ";".join(reversed(frames))
+
+
+class StackSampler:
+    """
+    samples the stacks of all other threads every `interval` seconds while
+    running, the event loop and the database threads alike, a request on the
+    loop waits on the database threads so looking at the loop alone hides where
+    its time went
+    """
+
+    def __init__(self, interval: float = 0.005) -> None:
+        self.interval: float = interval
+        self.stacks: dict[str, int] = {}  # folded stack -> samples
+        self._stop: threading.Event = threading.Event()
+        self._thread: threading.Thread = threading.Thread(
+            target=self._run, name="stack-sampler", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> dict[str, int]:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self) -> None:
+        own: int = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names: dict[int, str] = {
+                thread.ident: thread.name
+                for thread in threading.enumerate()
+                if thread.ident is not None
+            }
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack: str = fold(frame, names.get(ident, str(ident)))
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def write(self, path: str) -> None:
+        with open(path, "w") as file:
+            for stack, count in sorted(self.stacks.items()):
+                file.write(f"{stack} {count}\n")
+
+
+Profile = Union[StackSampler, cProfile.Profile]
+
+
+class SlowRequestProfiler:
+    """
+    profiles one request at a time and keeps the profile when the request took
+    longer than `threshold` seconds, "sample" writes folded stacks for
+    flamegraph.pl or speedscope, "cprofile" a pstats file of the loop thread
+    """
+
+    def __init__(
+        self,
+        threshold: float,
+        directory: str,
+        mode: ProfileMode = "sample",
+        interval: float = 0.005,
+    ) -> None:
+        self.threshold: float = threshold
+        self.directory: str = directory
+        self.mode: ProfileMode = mode
+        self.interval: float = interval
+        self.busy: bool = False
+        self.written: int = 0
+
+    def begin(self) -> Optional[Profile]:
+        """starts a profile unless another request is being profiled"""
+        if self.busy:
+            return None
+        self.busy = True
+        if self.mode == "cprofile":
+            profile: cProfile.Profile = cProfile.Profile()
+            profile.enable()
+            return profile
+        sampler: StackSampler = StackSampler(self.interval)
+        sampler.start()
+        return sampler
+
+    def end(
+        self, profile: Profile, method: str, route: str, seconds: float
+    ) -> Optional[str]:
+        """stops the profile, returns the file it was written to if the request was slow"""
+        self.busy = False
+        if isinstance(profile, cProfile.Profile):
+            profile.disable()
+        else:
+            profile.stop()
+        if seconds < self.threshold:
+            return None
+
+        os.makedirs(self.directory, exist_ok=True)
+        name: str = re.sub(r"[^A-Za-z0-9_.-]+", "_", f"{method}{route}").strip("_")
+        extension: str = "prof" if isinstance(profile, cProfile.Profile) else "folded"
+        path: str = os.path.join(
+            self.directory,
+            f"{time.strftime('%Y%m%d-%H%M%S')}-{self.written}-{name}-"
+            f"{seconds * 1000:.0f}ms.{extension}",
+        )
+        if isinstance(profile, cProfile.Profile):
+            profile.dump_stats(path)
+        else:
+            profile.write(path)
+        self.written += 1
+        return path
@@ -0,0 +1,35 @@
+from datetime import date, datetime, time, timedelta
+from typing import Optional
+
+from db_stuff import Element, display_order, is_upcoming
+
+
+def three_day_dates(now: datetime) -> tuple[date, date]:
+    """
+    returns (first, last) date of elements that are due in the next three
+    days, meaning now <= midnight of the date <= now + 3 days
+    """
+    today = now.date()
+    first = today if now == datetime.combine(today, time()) else today + timedelta(1)
+    last = (now + timedelta(days=3)).date()
+    return first, last
+
+
+def three_day_window(now: datetime) -> tuple[str, str]:
+    """three_day_dates as "YYYY-MM-DD" """
+    first, last = three_day_dates(now)
+    return first.isoformat(), last.isoformat()
+
+
+def arrange(
+    work_data: list[Element],
+    done_data: list[Element],
+    now: Optional[datetime] = None,
+) -> list[Element]:
+    """
+    records in partitions sorted by db_stuff.element_sort_key in the order
+    they are shown, without sorting again. This is the order
+    get_elements_json serves /get_data and the rendered index in
+    """
+    window: tuple[str, str] = three_day_window(now or datetime.now())
+    return display_order(work_data, done_data, is_upcoming(work_data, window))
@@ -0,0 +1,130 @@
+"""
+index.html with the table of a logged-in user already in it, so the first
+paint needs no /valid and /get_data round trips. script.js picks the rows and
+the data version up from the page and goes on from there like after a load.
+"""
+
+import gzip
+import json
+from collections import OrderedDict
+from datetime import date
+from html import escape
+from typing import Optional
+
+from assets import Asset, content_hash
+from db_stuff import ElementData
+
+# parts of frontend/index.html that are changed, the static page is served
+# instead when one of them is missing
+LOGIN_MARKER: bytes = b'<div id="login-container">'
+MAIN_MARKER: bytes = b'<div id="main" class="hidden">'
+TABLE_MARKER: bytes = b'<tbody id="table-body"></tbody>'
+SCRIPT_MARKER: bytes = b"<script src="
+
+# how toLocaleDateString shows dates on the pl-PL machines of the school
+DATE_FORMAT: str = "%d.%m.%Y"
+PRIVATE: str = "private, no-cache"
+
+
+def row_html(element: ElementData) -> str:
+    """the <tr> makeRow in script.js builds, with the text escaped"""
+    day: str = date.fromisoformat(element["date"]).strftime(DATE_FORMAT)
+    return (
+        f'<tr class="{element["state"]} {element["type"]}" data-id="{element["id"]}">'
+        f"<td>{escape(element['lesson'])}</td>"
+        f"<td>{element['type']}</td>"
+        f"<td>{day}</td>"
+        f"<td><t>{escape(element['comment'] or '')}</t></td>"
+        f"<td><button onclick=\"action({element['id']}, '{element['state']}')\""
+        ' class="switch_button action_button">switch</button></td>'
+        "</tr>"
+    )
+
+
+def fill(template: bytes, version: int, elements_json: bytes) -> Optional[bytes]:
+    """
+    index.html logged in, with the rows of a /get_data body and its version,
+    None when the template lacks a marker
+    """
+    rows: str = "".join(row_html(element) for element in json.loads(elements_json))
+    # no "<" at all, "</script>" in a comment would end the element early and
+    # "<!--<script>" would keep the closing tag from ending it, \u003c is the
+    # same character to JSON.parse
+    data: bytes = elements_json.replace(b"<", b"\\u003c")
+    replacements: list[tuple[bytes, bytes]] = [
+        (LOGIN_MARKER, b'<div id="login-container" class="hidden">'),
+        (MAIN_MARKER, b'<div id="main">'),
+        (
+            TABLE_MARKER,
+            f'<tbody id="table-body" data-version="{version}">{rows}</tbody>'.encode(),
+        ),
+        (
+            SCRIPT_MARKER,
+            b'<script id="initial-data" type="application/json">'
+            + data
+            + b"</script>\n  "
+            + SCRIPT_MARKER,
+        ),
+    ]
+    page: bytes = template
+    for marker, replacement in replacements:
+        if page.count(marker) != 1:
+            return None
+        page = page.replace(marker, replacement)
+    return page
+
+
+class IndexPages:
+    """
+    Rendered pages of the last `maxsize` users. A page is tagged with the data
+    version and the three day window it shows and the template it was made
+    from, a change of the data makes a new version and so a new page.
+    """
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        self.maxsize: int = maxsize
+        self._template: bytes = b""
+        self._template_hash: str = ""
+        self._pages: OrderedDict[int, Asset] = OrderedDict()  # user id -> page
+
+    def etag(
+        self, template: bytes, user_id: int, version: int, window: tuple[str, str]
+    ) -> str:
+        if template is not self._template:
+            self._template, self._template_hash = template, content_hash(template)
+            self._pages.clear()
+        first, last = window
+        return f'W/"{user_id}-{version}-{first}-{last}-{self._template_hash}"'
+
+    def get(self, user_id: int, etag: str) -> Optional[Asset]:
+        page: Optional[Asset] = self._pages.get(user_id)
+        if page is None or page.etag != etag:
+            return None
+        self._pages.move_to_end(user_id)
+        return page
+
+    def render(
+        self, user_id: int, etag: str, version: int, elements_json: bytes
+    ) -> Optional[Asset]:
+        """the page of a tag from etag, None when the template can't be filled"""
+        body: Optional[bytes] = fill(self._template, version, elements_json)
+        if body is None:
+            return None
+
+        # made again on every change, so a quick level instead of the assets' best
+        compressed: bytes = gzip.compress(body, 6, mtime=0)
+        page: Asset = Asset(
+            "text/html; charset=utf-8",
+            body,
+            etag,
+            PRIVATE,
+            {"gzip": compressed} if len(compressed) < len(body) else {},
+        )
+        self._pages[user_id] = page
+        self._pages.move_to_end(user_id)
+        while len(self._pages) > self.maxsize:
+            self._pages.popitem(last=False)
+        return page
+
+    def __len__(self) -> int:
+        return len(self._pages)
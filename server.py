@@ -1,10 +1,56 @@
-from typing import Literal, Optional, TypedDict, cast
-from fastapi.responses import FileResponse
-from datetime import datetime, timedelta
-
-from db_stuff import ElementData, Database, InvalidCredentialsError
-
-from fastapi import FastAPI, Request, Response, Cookie, HTTPException, status
+import asyncio
+import csv
+import io
+import json
+import logging
+import math
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from typing import Any, AsyncIterator, Callable, Iterator, Literal, Optional, cast
+from typing_extensions import TypedDict
+from fastapi.responses import StreamingResponse
+from fastapi.exceptions import RequestValidationError
+from pydantic import TypeAdapter, ValidationError
+
+from db_stuff import (
+    AsyncDatabase,
+    ChangeSet,
+    ElementData,
+    Database,
+    ELEMENT_FIELDS,
+    ElementFilter,
+    GroupCommit,
+    InvalidCredentialsError,
+    InvalidTokenError,
+    LessonTypes,
+    PageCursor,
+    PasswordHashing,
+    Storage,
+    to_day,
+)
+from assets import Asset, StaticAssets
+from metrics import (
+    CONTENT_TYPE,
+    MetricsExchange,
+    Profile,
+    ProfileMode,
+    RequestMetrics,
+    SlowRequestProfiler,
+    render,
+)
+from memory import MemoryDatabase
+from ordering import three_day_window
+from pages import IndexPages
+from sharding import ShardedDatabase, shard_paths
+
+from fastapi import FastAPI, Request, Response, Cookie, HTTPException, Query, status
 
 
 class LoginCredentials(TypedDict):
@@ -17,130 +63,557 @@ class StateChange(TypedDict):
     id: int
 
 
-db: Database = Database("database.sqlite")
+class Changes(ChangeSet):
+    window: tuple[str, str]  # three day window to order the elements with
 
 
-def sort_by_date(data: list[ElementData]) -> list[ElementData]:
-    return sorted(data, key=lambda x: x["date"])
+class TooManyStreamsError(Exception):
+    pass
 
 
-def sort_by_state(
-    data: list[ElementData],
-) -> tuple[list[ElementData], list[ElementData]]:
+class ChangeHub:
     """
-    returns (done_data, work_data)
+    tells open /events streams of a user the new data version after every write,
+    a stream that can't keep up only gets the newest version
     """
-    done_data: list[ElementData] = []
-    work_data: list[ElementData] = []
-    for element in data:
-        if element["state"] == "done":
-            work_data.append(element)
-        else:
-            done_data.append(element)
-    return work_data, done_data
 
+    def __init__(self, max_streams_per_user: int) -> None:
+        self.max_streams_per_user: int = max_streams_per_user
+        self.closed: bool = False
+        self.streams: dict[int, set[asyncio.Queue[Optional[int]]]] = {}
+        # newest version each stream was given, the same one is not sent twice
+        self.sent: dict[asyncio.Queue[Optional[int]], int] = {}
 
-def sort_by_type(data: list[ElementData]) -> list[ElementData]:
-    sorted_data: list[ElementData] = []
-    same_day: dict[str, list[ElementData]] = {}
-    for element in data:
-        if element["date"] in same_day:
-            same_day[element["date"]].append(element)
-        else:
-            same_day[element["date"]] = [element]
-
-    for key in same_day.keys():
-        if len(same_day[key]) < 2:
-            sorted_data.append(same_day[key][0])
-            continue
-
-        sprawdz: list[ElementData] = []
-        kartk: list[ElementData] = []
-        homework: list[ElementData] = []
-        for element in same_day[key]:
-            if element["type"] == "sprawdz":
-                sprawdz.append(element)
-            elif element["type"] == "kartk":
-                kartk.append(element)
-            else:
-                homework.append(element)
-
-        sorted_data.extend(sprawdz)
-        sorted_data.extend(kartk)
-        sorted_data.extend(homework)
-
-    return sorted_data
-
-
-def check_three_days(data: list[ElementData]) -> bool:
-    """returns true if there is any element in next three days, else returns False"""
-    now: datetime = datetime.now()
-    limit: datetime = now + timedelta(days=3)
-
-    for element in data:
-        dt: datetime = datetime.strptime(element["date"], "%Y-%m-%d")
-        if now <= dt <= limit:
-            return True
-    return False
-
-
-def if_thre_days_sort_diffrent(data: list[ElementData]):
-    if check_three_days(data):
-        return data
-
-    homeworks: list[ElementData] = []
-    others: list[ElementData] = []
-    for element in data:
-        if element["type"] == "homework":
-            homeworks.append(element)
+    def __len__(self) -> int:
+        return sum(len(queues) for queues in self.streams.values())
+
+    def subscribe(self, user_id: int, version: int = 0) -> asyncio.Queue[Optional[int]]:
+        """`version` is the one the stream starts with"""
+        queues: set[asyncio.Queue[Optional[int]]] = self.streams.setdefault(
+            user_id, set()
+        )
+        if len(queues) >= self.max_streams_per_user:
+            raise TooManyStreamsError
+        queue: asyncio.Queue[Optional[int]] = asyncio.Queue(maxsize=1)
+        queues.add(queue)
+        self.sent[queue] = version
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue[Optional[int]]) -> None:
+        self.sent.pop(queue, None)
+        queues: Optional[set[asyncio.Queue[Optional[int]]]] = self.streams.get(user_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.streams[user_id]
+
+    def publish(self, user_id: int, version: int) -> None:
+        """
+        called after writes of this process and, with several workers, with
+        versions polled from the database, so it may see a version again
+        """
+        for queue in self.streams.get(user_id, ()):
+            if version <= self.sent.get(queue, 0):
+                continue
+            self.sent[queue] = version
+            latest: int = version
+            if queue.full():
+                # the client only needs the newest version to sync up, versions
+                # read by concurrent writes may also arrive out of order
+                latest = max(version, queue.get_nowait() or 0)
+            queue.put_nowait(latest)
+
+    def close(self) -> None:
+        """ends every stream, /events takes no new ones after this"""
+        self.closed = True
+        for queues in self.streams.values():
+            for queue in queues:
+                if queue.full():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+        self.streams.clear()
+        self.sent.clear()
+
+    def is_full(self, user_id: int) -> bool:
+        return len(self.streams.get(user_id, ())) >= self.max_streams_per_user
+
+
+class LoginRateLimiter:
+    """allows `attempts` logins per username in any `period` seconds"""
+
+    def __init__(
+        self, attempts: int, period: float, max_usernames: int = 10_000
+    ) -> None:
+        self.attempts: int = attempts
+        self.period: float = period
+        self.max_usernames: int = max_usernames
+        self.recent: dict[str, deque[float]] = {}
+
+    def retry_after(self, username: str, now: Optional[float] = None) -> float:
+        """0 and counts the attempt when allowed, otherwise seconds to wait"""
+        now = time.monotonic() if now is None else now
+        times: deque[float] = self.recent.setdefault(username, deque())
+        while times and times[0] <= now - self.period:
+            times.popleft()
+        if len(times) >= self.attempts:
+            return times[0] + self.period - now
+
+        times.append(now)
+        if len(self.recent) > self.max_usernames:
+            self.forget_expired(now)
+        return 0
+
+    def forget_expired(self, now: float) -> None:
+        for username in [
+            username
+            for username, times in self.recent.items()
+            if not times or times[-1] <= now - self.period
+        ]:
+            del self.recent[username]
+
+
+# run() passes these to the worker processes it starts in the environment
+DB_PATH: str = os.environ.get("SERVER_DB_PATH", "database.sqlite")
+WORKERS: int = int(os.environ.get("SERVER_WORKERS", "1"))
+# users spread over this many files next to DB_PATH, 0 keeps them all in DB_PATH,
+# sharding.py moves existing users when it changes
+DB_SHARDS: int = int(os.environ.get("SERVER_DB_SHARDS", "0"))
+# "sqlite", or "memory" to keep everything in the one worker process, snapshotted
+# next to DB_PATH every MEMORY_SNAPSHOT_SECONDS (None keeps no snapshot)
+DB_ENGINE: str = os.environ.get("SERVER_DB_ENGINE", "sqlite")
+MEMORY_SNAPSHOT_SECONDS: Optional[float] = 5
+METRICS_DIRECTORY: Optional[str] = os.environ.get("SERVER_METRICS_DIRECTORY")
+# with several workers, how often /events streams look for writes of the others
+# and metrics are shared with them
+SYNC_SECONDS: float = 0.5
+# requests still running are cut after this on shutdown and reload, /events
+# streams end as soon as one of SHUTDOWN_SIGNALS arrives
+GRACEFUL_SHUTDOWN_SECONDS: float = 10
+SHUTDOWN_SIGNALS: tuple[signal.Signals, ...] = (signal.SIGINT, signal.SIGTERM)
+PORT: int = 3000
+DB_READERS: int = 8
+MAX_PAGE_SIZE: int = 500
+# Accept header asking /get_data for rows as arrays in X-Element-Fields order
+COMPACT_MEDIA_TYPE: str = "application/vnd.elements.compact+json"
+# set to GroupCommit() to commit writes of concurrent requests together
+DB_GROUP_COMMIT: Optional[GroupCommit] = None
+# scrypt cost of stored passwords, logins with an older cost are rehashed
+PASSWORD_HASHING: PasswordHashing = PasswordHashing()
+PASSWORD_HASHERS: int = 2
+LOGIN_ATTEMPTS: int = 10  # per username in LOGIN_PERIOD_SECONDS
+LOGIN_PERIOD_SECONDS: float = 60
+# logins waiting for a hasher thread, more are turned away with 503
+MAX_PENDING_LOGINS: int = 32
+MAX_EVENT_STREAMS_PER_USER: int = 5
+EVENT_HEARTBEAT_SECONDS: float = 15
+# requests slower than this many seconds leave a profile, None turns it off
+PROFILE_SLOW_REQUESTS_SECONDS: Optional[float] = None
+# "sample" writes folded stacks for flamegraphs, "cprofile" pstats files
+PROFILE_MODE: ProfileMode = "sample"
+PROFILE_DIRECTORY: str = "profiles"
+PROFILE_INTERVAL_SECONDS: float = 0.005
+# / comes with the table of the user of the token cookie in it, pages of the
+# last INDEX_PAGES users are kept until their data changes
+RENDER_INDEX: bool = False
+INDEX_PAGES: int = 1024
+
+
+def open_storage(path: str, engine: str, shards: int, pool_size: int) -> Storage:
+    if engine == "memory":
+        return MemoryDatabase(
+            os.path.splitext(path)[0] + ".memory.json",
+            MEMORY_SNAPSHOT_SECONDS,
+            password_hashing=PASSWORD_HASHING,
+        )
+    if engine != "sqlite":
+        raise ValueError(f"unknown storage engine {engine!r}")
+    if shards:
+        directory, files = shard_paths(path, shards)
+        return ShardedDatabase(
+            directory,
+            files,
+            pool_size=pool_size,
+            group_commit=DB_GROUP_COMMIT,
+            password_hashing=PASSWORD_HASHING,
+            shared=WORKERS > 1,
+        )
+    return Database(
+        path,
+        pool_size=pool_size,
+        group_commit=DB_GROUP_COMMIT,
+        password_hashing=PASSWORD_HASHING,
+        shared=WORKERS > 1,
+    )
+
+
+def open_database(path: str) -> AsyncDatabase:
+    """the database of the server at `path`, set up as configured above"""
+    # one connection per reader thread plus one for the writer thread
+    return AsyncDatabase(
+        open_storage(path, DB_ENGINE, DB_SHARDS, DB_READERS + 1),
+        readers=DB_READERS,
+        hashers=PASSWORD_HASHERS,
+    )
+
+
+db: AsyncDatabase = open_database(DB_PATH)
+hub: ChangeHub = ChangeHub(MAX_EVENT_STREAMS_PER_USER)
+login_limiter: LoginRateLimiter = LoginRateLimiter(LOGIN_ATTEMPTS, LOGIN_PERIOD_SECONDS)
+login_slots: asyncio.Semaphore = asyncio.Semaphore(MAX_PENDING_LOGINS)
+# frontend files with compressed variants and hashed urls, built at startup
+static: StaticAssets = StaticAssets("./frontend")
+index_pages: IndexPages = IndexPages(INDEX_PAGES)
+request_metrics: RequestMetrics = RequestMetrics()
+profiler: Optional[SlowRequestProfiler] = (
+    SlowRequestProfiler(
+        PROFILE_SLOW_REQUESTS_SECONDS,
+        PROFILE_DIRECTORY,
+        PROFILE_MODE,
+        PROFILE_INTERVAL_SECONDS,
+    )
+    if PROFILE_SLOW_REQUESTS_SECONDS is not None
+    else None
+)
+exchange: Optional[MetricsExchange] = (
+    MetricsExchange(METRICS_DIRECTORY) if METRICS_DIRECTORY is not None else None
+)
+logger: logging.Logger = logging.getLogger("uvicorn.error")
+
+
+element_list_adapter: TypeAdapter[list[ElementData]] = TypeAdapter(list[ElementData])
+
+
+def parse_bulk_body(body: bytes, content_type: str) -> list[ElementData]:
+    """parses a JSON array or, for application/x-ndjson, one element per line"""
+    try:
+        if content_type.startswith("application/x-ndjson"):
+            items: object = [json.loads(line) for line in body.splitlines() if line]
         else:
-            others.append(element)
+            items = json.loads(body)
+        return element_list_adapter.validate_python(items)
+    except json.JSONDecodeError as error:
+        raise RequestValidationError(
+            [{"type": "json_invalid", "loc": ("body", error.pos), "msg": error.msg}]
+        )
+    except ValidationError as error:
+        raise RequestValidationError(error.errors())
+
+
+def check_dates(elements: list[ElementData]) -> None:
+    """422 unless every date is "" (no date) or a real "YYYY-MM-DD" day"""
+    for element in elements:
+        try:
+            to_day(element["date"])
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="invalid date"
+            )
+
+
+def ndjson_lines(elements: Iterator[ElementData]) -> Iterator[str]:
+    for element in elements:
+        yield json.dumps(element, ensure_ascii=False) + "\n"
+
+
+def csv_lines(elements: Iterator[ElementData]) -> Iterator[str]:
+    buffer: io.StringIO = io.StringIO()
+    writer = csv.DictWriter(buffer, ELEMENT_FIELDS)
+    writer.writeheader()
+    for element in elements:
+        writer.writerow(element)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def data_etag(
+    user_id: int, version: int, now: Optional[datetime] = None, compact: bool = False
+) -> str:
+    """the sorted list depends on the data and on the three day window, both go in"""
+    first, last = three_day_window(now or datetime.now())
+    variant: str = "-compact" if compact else ""
+    return f'W/"{user_id}-{version}-{first}-{last}{variant}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match: str = request.headers.get("if-none-match", "")
+    return etag in (tag.strip() for tag in if_none_match.split(","))
+
+
+async def check_credentials(username: str, password: str) -> str:
+    """db.get_token_from_credentials behind the rate limit and the pending cap"""
+    # every worker has to count the same attempts
+    retry_after: float = (
+        await db.record_login_attempt(username, LOGIN_ATTEMPTS, LOGIN_PERIOD_SECONDS)
+        if WORKERS > 1
+        else login_limiter.retry_after(username)
+    )
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="too many login attempts",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+    if login_slots.locked():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="too many logins",
+            headers={"Retry-After": "1"},
+        )
+    async with login_slots:
+        return await db.get_token_from_credentials(username, password)
+
 
-    return homeworks + others
+async def notify(token: str) -> None:
+    """publishes the data version of the user after a successful write"""
+    if not len(hub):
+        return
+    try:
+        user_id, version = await db.get_data_version(token)
+    except InvalidTokenError:
+        return
+    hub.publish(user_id, version)
+
+
+async def version_events(user_id: int, version: int) -> AsyncIterator[str]:
+    # subscribed only once streaming starts, so a client gone before that leaks nothing
+    try:
+        queue: asyncio.Queue[Optional[int]] = hub.subscribe(user_id, version)
+    except TooManyStreamsError:
+        return
+    try:
+        yield f"event: version\ndata: {version}\n\n"
+        while True:
+            try:
+                new_version: Optional[int] = await asyncio.wait_for(
+                    queue.get(), EVENT_HEARTBEAT_SECONDS
+                )
+            except asyncio.TimeoutError:
+                # keeps proxies from closing an idle stream
+                yield ": ping\n\n"
+                continue
+            if new_version is None:
+                return
+            yield f"event: version\ndata: {new_version}\n\n"
+    finally:
+        hub.unsubscribe(user_id, queue)
+
+
+def metrics_snapshot() -> dict:
+    return {
+        "requests": request_metrics.snapshot(),
+        "database": db.database.stats.snapshot(),
+        "gauges": {"event_streams": len(hub)},
+    }
+
+
+async def sync_workers() -> None:
+    """
+    with several workers, sends /events streams the versions written through
+    the other workers and shares the metrics of this one
+    """
+    while True:
+        await asyncio.sleep(SYNC_SECONDS)
+        try:
+            if len(hub):
+                versions: dict[int, int] = await db.get_data_versions(list(hub.streams))
+                for user_id, version in versions.items():
+                    hub.publish(user_id, version)
+            if exchange is not None:
+                exchange.publish(metrics_snapshot())
+        except Exception:
+            logger.exception("syncing with the other workers failed")
+
+
+def end_streams_on_shutdown() -> Callable[[], None]:
+    """
+    uvicorn runs the lifespan shutdown only after open responses are done,
+    so /events streams would hold shutdown up until GRACEFUL_SHUTDOWN_SECONDS.
+    They are ended on the shutdown signals instead, before the handlers of
+    uvicorn run. Returns what puts those handlers back
+    """
+    # only the main thread can set handlers, TestClient runs the app in another
+    if threading.current_thread() is not threading.main_thread():
+        return lambda: None
+
+    loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+    previous: dict[int, Any] = {}
+
+    def handle(signum: int, frame: object) -> None:
+        loop.call_soon_threadsafe(lambda: hub.close())
+        handler: Any = previous[signum]
+        if callable(handler):
+            handler(signum, frame)
 
+    for signum in SHUTDOWN_SIGNALS:
+        previous[signum] = signal.signal(signum, handle)
 
-def get_sorted_data(token: str) -> list[ElementData]:
-    sorting: list[ElementData] = db.get_elements_from_token(token)
-    sorting = sort_by_date(sorting)
-    sorting = sort_by_type(sorting)
-    done_data, work_data = sort_by_state(sorting)
-    work_data = if_thre_days_sort_diffrent(work_data)
-    sorted: list[ElementData] = work_data + done_data
-    return sorted
+    def restore() -> None:
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
 
+    return restore
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    static.build()
+    await db.init_database()
+    sync: Optional[asyncio.Task] = (
+        asyncio.create_task(sync_workers()) if WORKERS > 1 else None
+    )
+    restore_signals: Callable[[], None] = end_streams_on_shutdown()
+    yield
+    restore_signals()
+    if sync is not None:
+        sync.cancel()
+    if exchange is not None:
+        exchange.remove()
+    hub.close()
+    db.close()
 
-app: FastAPI = FastAPI()
+
+app: FastAPI = FastAPI(lifespan=lifespan)
 
 
 @app.middleware("http")
 async def no_cache_middleware(request: Request, call_next):
     response: Response = await call_next(request)
+    if "Cache-Control" in response.headers:
+        return response
+    if "ETag" in response.headers:
+        # may be stored, but has to be revalidated with If-None-Match every time
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response
     response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
     response.headers["Pragma"] = "no-cache"
     response.headers["Expires"] = "0"
     return response
 
 
+# added last so it runs first and times the other middleware too
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    request_metrics.started()
+    profile: Optional[Profile] = profiler.begin() if profiler is not None else None
+    start: float = time.perf_counter()
+    status_code: int = status.HTTP_500_INTERNAL_SERVER_ERROR
+    try:
+        response: Response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        # streamed bodies like /events are timed until their headers are sent
+        seconds: float = time.perf_counter() - start
+        # the path template, so ids in urls don't make a series each
+        route: str = getattr(request.scope.get("route"), "path", "unmatched")
+        request_metrics.finished(request.method, route, status_code, seconds)
+        if profile is not None and profiler is not None:
+            path: Optional[str] = profiler.end(profile, request.method, route, seconds)
+            if path is not None:
+                logger.warning(
+                    "%s %s took %.0f ms, profile in %s",
+                    request.method,
+                    route,
+                    seconds * 1000,
+                    path,
+                )
+
+
+def asset_response(
+    request: Request, path: str, vary: str = "Accept-Encoding"
+) -> Response:
+    asset: Optional[Asset] = static.get(path)
+    if asset is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="not found")
+    return send_asset(request, asset, vary)
+
+
+def send_asset(
+    request: Request, asset: Asset, vary: str = "Accept-Encoding"
+) -> Response:
+    headers: dict[str, str] = {
+        "ETag": asset.etag,
+        "Cache-Control": asset.cache_control,
+        "Vary": vary,
+    }
+    if etag_matches(request, asset.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    body, encoding = asset.negotiate(request.headers.get("accept-encoding", ""))
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type=asset.content_type, headers=headers)
+
+
+async def rendered_index(request: Request, token: str) -> Optional[Response]:
+    """index.html with the table of the user in it, None for invalid tokens"""
+    template: Optional[Asset] = static.get("/")
+    if template is None:
+        return None
+    window: tuple[str, str] = three_day_window(datetime.now())
+    try:
+        # the version is read before the data, so the tag is never newer than the page
+        user_id, version = await db.get_data_version(token)
+        etag: str = index_pages.etag(template.body, user_id, version, window)
+        page: Optional[Asset] = index_pages.get(user_id, etag)
+        if page is None:
+            page = index_pages.render(
+                user_id, etag, version, await db.get_elements_json(token, window)
+            )
+    except InvalidTokenError:
+        return None
+    if page is None:
+        return None
+    return send_asset(request, page, "Accept-Encoding, Cookie")
+
+
+@app.get("/metrics")
+async def metrics() -> Response:
+    """metrics of all workers, the others as of their last sync"""
+    snapshots: list[dict] = [metrics_snapshot()]
+    if exchange is not None:
+        snapshots += exchange.collect()
+    return Response(
+        render(snapshots, {"event_streams": "Open /events streams."}),
+        media_type=CONTENT_TYPE,
+    )
+
+
 @app.get("/")
-def index() -> FileResponse:
-    return FileResponse("./frontend/index.html")
+async def index(request: Request, token: Optional[str] = Cookie(None)) -> Response:
+    if not RENDER_INDEX:
+        return asset_response(request, "/")
+    page: Optional[Response] = await rendered_index(request, token) if token else None
+    if page is not None:
+        return page
+    return asset_response(request, "/", "Accept-Encoding, Cookie")
 
 
 @app.get("/script.js")
-def js() -> FileResponse:
-    return FileResponse("./frontend/script.js")
+async def js(request: Request) -> Response:
+    return asset_response(request, "/script.js")
 
 
 @app.get("/style.css")
-def style() -> FileResponse:
-    return FileResponse("./frontend/style.css")
+async def style(request: Request) -> Response:
+    return asset_response(request, "/style.css")
+
+
+@app.get("/static/{name}")
+async def static_file(name: str, request: Request) -> Response:
+    """content hashed urls from index.html, cached for a year"""
+    return asset_response(request, static.prefix + name)
 
 
 @app.post("/login")
-def login(login_credentials: LoginCredentials, response: Response) -> dict[str, str]:
+async def login(
+    login_credentials: LoginCredentials, response: Response
+) -> dict[str, str]:
     """{"message": "Token set"}"""
     try:
-        token: str = db.get_token_from_credentials(
+        token: str = await check_credentials(
             login_credentials["username"], login_credentials["password"]
         )
     except InvalidCredentialsError:
@@ -153,93 +626,289 @@ def login(login_credentials: LoginCredentials, response: Response) -> dict[str,
 
 
 @app.post("/logout")
-def logout(response: Response) -> dict:
+async def logout(response: Response) -> dict:
     response.set_cookie(key="token", value="", httponly=True, samesite="lax", expires=1)
     return {"message": "Token set"}
 
 
 @app.get("/valid")
-def check_token(token: Optional[str] = Cookie(None)) -> bool:
-    return db.is_token_valid(token)
+async def check_token(token: Optional[str] = Cookie(None)) -> bool:
+    return await db.is_token_valid(token)
+
+
+@app.get("/get_data", response_model=list[ElementData])
+async def get_data(
+    request: Request,
+    response: Response,
+    state: Optional[Literal["work", "done"]] = None,
+    lesson: Optional[LessonTypes] = None,
+    type: Optional[Literal["homework", "kartk", "sprawdz"]] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    token: Optional[str] = Cookie(None),
+) -> list[ElementData] | Response:
+    """
+    without parameters returns every element, otherwise only matching ones,
+    `limit` at a time, the X-Next-Cursor header is the `cursor` of the next page.
+    every element comes as an array in X-Element-Fields order when the Accept
+    header has COMPACT_MEDIA_TYPE
+    """
+    cast_token: str = cast(str, token)
+    filters: ElementFilter = ElementFilter(
+        state,
+        lesson,
+        type,
+        date_from.isoformat() if date_from else None,
+        date_to.isoformat() if date_to else None,
+    )
+    try:
+        if filters != ElementFilter() or limit is not None or cursor is not None:
+            return await get_data_page(response, cast_token, filters, limit, cursor)
+
+        now: datetime = datetime.now()
+        compact: bool = COMPACT_MEDIA_TYPE in request.headers.get("accept", "")
+        # the version is read before the data, so the tag is never newer than the body
+        user_id, version = await db.get_data_version(cast_token)
+        etag: str = data_etag(user_id, version, now, compact)
+        headers: dict[str, str] = {
+            "ETag": etag,
+            "X-Data-Version": str(version),
+            "Vary": "Accept",
+        }
+        if etag_matches(request, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        # cached records encoded once each, skips building dicts and response_model
+        body: bytes = await db.get_elements_json(
+            cast_token, three_day_window(now), compact
+        )
+    except InvalidTokenError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="invalid token"
+        )
+
+    if compact:
+        headers["X-Element-Fields"] = ",".join(ELEMENT_FIELDS)
+        return Response(body, media_type=COMPACT_MEDIA_TYPE, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
 
 
-@app.get("/get_data")
-def get_data(token: Optional[str] = Cookie(None)) -> list[ElementData]:
-    if not db.is_token_valid(token):
+async def get_data_page(
+    response: Response,
+    token: str,
+    filters: ElementFilter,
+    limit: Optional[int],
+    cursor: Optional[str],
+) -> list[ElementData]:
+    try:
+        after: Optional[PageCursor] = PageCursor.decode(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="invalid cursor"
+        )
+
+    if after is not None and limit is None:
+        limit = MAX_PAGE_SIZE
+
+    page, next_page = await db.get_elements_page(
+        token, three_day_window(datetime.now()), filters, limit, after
+    )
+    if next_page is not None:
+        response.headers["X-Next-Cursor"] = next_page.encode()
+    return page
+
+
+@app.get("/changes")
+async def changes(
+    since: int = Query(ge=0), token: Optional[str] = Cookie(None)
+) -> Changes:
+    """changes since the X-Data-Version of /get_data or the version of the last call"""
+    try:
+        change_set: ChangeSet = await db.get_changes(cast(str, token), since)
+    except InvalidTokenError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="invalid token"
         )
+    return {**change_set, "window": three_day_window(datetime.now())}
 
-    cast_token: str = cast(str, token)
-    return get_sorted_data(cast_token)
+
+@app.get("/events")
+async def events(token: Optional[str] = Cookie(None)) -> StreamingResponse:
+    """server-sent `version` events, sync with /changes when the version is newer"""
+    try:
+        user_id, version = await db.get_data_version(cast(str, token))
+    except InvalidTokenError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="invalid token"
+        )
+    if hub.closed:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="shutting down"
+        )
+    if hub.is_full(user_id):
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="too many streams"
+        )
+
+    return StreamingResponse(
+        version_events(user_id, version),
+        media_type="text/event-stream",
+        headers={"X-Accel-Buffering": "no"},
+    )
 
 
 @app.post("/add_data")
-def add_data(data: ElementData, token: Optional[str] = Cookie(None)) -> None:
-    if not db.is_token_valid(token):
+async def add_data(data: ElementData, token: Optional[str] = Cookie(None)) -> None:
+    cast_token: str = cast(str, token)
+    check_dates([data])
+    added: bool = await db.add_element(data, cast_token)
+    if not added:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="invalid token"
         )
-    cast_token: str = cast(str, token)
-    db.add_element(data, cast_token)
+    await notify(cast_token)
 
 
-@app.post("/change_state")
-def change_state_endpoint(data: StateChange, token: Optional[str] = Cookie(None)):
-    if not db.is_token_valid(token):
+@app.post("/add_data/bulk")
+async def add_data_bulk(
+    request: Request, token: Optional[str] = Cookie(None)
+) -> dict[str, int]:
+    """takes a JSON array or NDJSON of elements, {"added": 3}"""
+    data: list[ElementData] = parse_bulk_body(
+        await request.body(), request.headers.get("content-type", "")
+    )
+    check_dates(data)
+    try:
+        added: int = await db.add_elements(data, cast(str, token))
+    except InvalidTokenError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="invalid token"
+        )
+    if added:
+        await notify(cast(str, token))
+    return {"added": added}
+
+
+@app.get("/export")
+async def export(
+    format: Literal["ndjson", "csv"] = "ndjson", token: Optional[str] = Cookie(None)
+) -> StreamingResponse:
+    try:
+        elements: Iterator[ElementData] = await db.iter_elements(cast(str, token))
+    except InvalidTokenError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="invalid token"
         )
+
+    if format == "csv":
+        return StreamingResponse(csv_lines(elements), media_type="text/csv")
+    return StreamingResponse(ndjson_lines(elements), media_type="application/x-ndjson")
+
+
+@app.post("/change_state")
+async def change_state_endpoint(data: StateChange, token: Optional[str] = Cookie(None)):
     cast_token: str = cast(str, token)
+    changed: bool = await db.change_state_of_element(
+        data["state"], data["id"], cast_token
+    )
 
-    db.change_state_of_element(data["state"], data["id"], cast_token)
+    # only a miss needs the extra lookup to tell a bad token from a missing element
+    if not changed and not await db.is_token_valid(token):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="invalid token"
+        )
+    if changed:
+        await notify(cast_token)
 
 
 @app.delete("/delete_data")
-def delete_data(id: int, token: Optional[str] = Cookie(None)) -> None:
-    if not db.is_token_valid(token):
+async def delete_data(id: int, token: Optional[str] = Cookie(None)) -> None:
+    cast_token: str = cast(str, token)
+    deleted: bool = await db.delete_element(cast_token, id)
+
+    if not deleted and not await db.is_token_valid(token):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="invalid token"
         )
-    cast_token: str = cast(str, token)
-    db.delete_element(cast_token, id)
+    if deleted:
+        await notify(cast_token)
 
 
 @app.delete("/delete_account")
-def delete_account(
+async def delete_account(
     username: str, password: str, token: Optional[str] = Cookie(None)
 ) -> None:
     if (
-        not db.is_token_valid(token)
-        and db.get_token_from_credentials(username, password) != token
+        not await db.is_token_valid(token)
+        and await check_credentials(username, password) != token
     ):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="invalid token or credentials",
         )
     cast_token: str = cast(str, token)
-    db.delete_user(cast_token)
+    await db.delete_user(cast_token)
 
 
 # @app.post("/debug/add_user")
-# def debug_add_user(username: str, password: str) -> None:
-#     db.add_user(username, password)
+# async def debug_add_user(username: str, password: str) -> None:
+#     await db.add_user(username, password)
 #
 #
 # @app.get("/debug/get_token")
-# def debug_get_token(token: Optional[str] = Cookie(None)) -> str:
+# async def debug_get_token(token: Optional[str] = Cookie(None)) -> str:
 #     return str(token)
 
 
 def run():
+    import argparse
+
     import uvicorn
     from uvicorn.config import LOGGING_CONFIG
 
+    parser: argparse.ArgumentParser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--database", default=DB_PATH)
+    parser.add_argument("--shards", type=int, default=DB_SHARDS)
+    parser.add_argument("--engine", choices=["sqlite", "memory"], default=DB_ENGINE)
+    args: argparse.Namespace = parser.parse_args()
+    if args.engine == "memory" and (args.workers > 1 or args.shards):
+        parser.error("the memory engine runs in one worker without shards")
+
     LOGGING_CONFIG["formatters"]["default"]["fmt"] = (
         "%(asctime)s [%(name)s] %(levelprefix)s %(message)s"
     )
-    PORT: int = 3000
-    uvicorn.run(app, host="0.0.0.0", port=PORT)
+    # migrated once here instead of by every worker starting up at the same time
+    preload: Storage = open_storage(
+        args.database, args.engine, args.shards, pool_size=1
+    )
+    preload.init_database()
+    preload.close()
+
+    os.environ["SERVER_DB_PATH"] = args.database
+    os.environ["SERVER_WORKERS"] = str(args.workers)
+    os.environ["SERVER_DB_SHARDS"] = str(args.shards)
+    os.environ["SERVER_DB_ENGINE"] = args.engine
+    metrics_directory: Optional[str] = None
+    if args.workers > 1:
+        metrics_directory = tempfile.mkdtemp(prefix="server-metrics-")
+        os.environ["SERVER_METRICS_DIRECTORY"] = metrics_directory
+    try:
+        # SIGHUP replaces the workers one by one, SIGTTIN/SIGTTOU add or remove one
+        uvicorn.run(
+            "server:app",
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_SECONDS,
+        )
+    finally:
+        if metrics_directory is not None:
+            shutil.rmtree(metrics_directory, ignore_errors=True)
 
 
 if __name__ == "__main__":
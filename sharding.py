@@ -0,0 +1,589 @@
+"""
+Users spread over several SQLite files so writes of different users don't wait
+for one write lock. A user lives in the shard picked by a hash of their id, a
+small directory file maps usernames and tokens to users and shards.
+
+    python sharding.py database.sqlite --shards 4
+
+moves the users of `database.sqlite` (or of the shards the directory lists)
+into 4 shard files next to it, removes shards that are no longer used and
+rebuilds the directory. Run it with the server stopped.
+"""
+
+import argparse
+import hashlib
+import os
+import uuid
+from sqlite3 import Cursor
+from typing import Iterator, Literal, Optional, cast
+
+from db_stuff import (
+    CHANGE_LOG_SIZE,
+    DEFAULT_PASSWORD_HASHING,
+    DEFAULT_PROFILE,
+    ChangeSet,
+    ConnectionPool,
+    Database,
+    DatabaseStats,
+    Element,
+    ElementData,
+    ElementFilter,
+    GroupCommit,
+    InvalidCredentialsError,
+    PageCursor,
+    PasswordHashing,
+    StorageProfile,
+    TokenCache,
+    hash_password,
+    password_needs_rehash,
+)
+
+
+def shard_for(user_id: int, shards: int) -> int:
+    """shard of a user, stable across processes unlike hash()"""
+    digest: bytes = hashlib.blake2b(str(user_id).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % shards
+
+
+def shard_paths(path: str, shards: int) -> tuple[str, list[str]]:
+    """(directory, shard files) of a sharded database named after `path`"""
+    stem, extension = os.path.splitext(path)
+    return f"{stem}.directory{extension}", [
+        f"{stem}.shard{i}{extension}" for i in range(shards)
+    ]
+
+
+class Directory:
+    """
+    username and token -> (user id, shard), the ids of all shards are given out
+    here so they never collide
+    """
+
+    def __init__(
+        self,
+        dbPath: str,
+        pool_size: int = 5,
+        profile: StorageProfile = DEFAULT_PROFILE,
+        stats: Optional[DatabaseStats] = None,
+        shared: bool = False,
+    ) -> None:
+        self.pool: ConnectionPool = ConnectionPool(dbPath, pool_size, profile, stats)
+        # token -> shard, a token rotated by another process would stay here
+        self.cache: TokenCache = TokenCache(maxsize=0 if shared else 1024)
+        if stats is not None:
+            stats.add_cache("shard", self.cache)
+
+    def close(self) -> None:
+        self.pool.close()
+        self.cache.clear()
+
+    def init(self, shards: int) -> None:
+        """creates the tables, a new directory is of a layout of `shards` files"""
+        with self.pool.connection() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS users (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    username TEXT NOT NULL UNIQUE,
+                    token TEXT NOT NULL UNIQUE,
+                    shard INTEGER NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS layout (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    shards INTEGER NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO layout (id, shards) VALUES (0, ?)", (shards,)
+            )
+
+    def shards(self) -> Optional[int]:
+        """number of shard files the users are spread over"""
+        with self.pool.connection() as conn:
+            row: Optional[tuple[int]] = conn.execute(
+                "SELECT shards FROM layout WHERE id = 0"
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def add(
+        self, username: str, token: str, shards: int, user_id: Optional[int] = None
+    ) -> tuple[int, int]:
+        """registers a user, returns its (id, shard), a new id when none is given"""
+        with self.pool.connection() as conn:
+            cursor: Cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO users (id, username, token, shard) VALUES (?, ?, ?, -1)",
+                (user_id, username, token),
+            )
+            new_id: int = cast(int, cursor.lastrowid)
+            shard: int = shard_for(new_id, shards)
+            cursor.execute("UPDATE users SET shard = ? WHERE id = ?", (shard, new_id))
+        return new_id, shard
+
+    def remove(self, user_id: int) -> None:
+        with self.pool.connection() as conn:
+            token: Optional[tuple[str]] = conn.execute(
+                "DELETE FROM users WHERE id = ? RETURNING token", (user_id,)
+            ).fetchone()
+        if token is not None:
+            self.cache.invalidate(token[0])
+
+    def set_token(self, token: str, new_token: str) -> None:
+        with self.pool.connection() as conn:
+            conn.execute(
+                "UPDATE users SET token = ? WHERE token = ?", (new_token, token)
+            )
+        self.cache.invalidate(token)
+
+    def remove_token(self, token: str) -> None:
+        with self.pool.connection() as conn:
+            conn.execute("DELETE FROM users WHERE token = ?", (token,))
+        self.cache.invalidate(token)
+
+    def shard_of_token(self, token: str) -> Optional[int]:
+        cached: Optional[int] = self.cache.get(token)
+        if cached is not None:
+            return cached
+
+        with self.pool.connection() as conn:
+            row: Optional[tuple[int]] = conn.execute(
+                "SELECT shard FROM users WHERE token = ?", (token,)
+            ).fetchone()
+        if row is None:
+            return None
+        self.cache.put(token, row[0])
+        return row[0]
+
+    def shard_of_username(self, username: str) -> Optional[int]:
+        with self.pool.connection() as conn:
+            row: Optional[tuple[int]] = conn.execute(
+                "SELECT shard FROM users WHERE username = ?", (username,)
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def replace(self, users: Iterator[tuple[int, str, str, int]], shards: int) -> int:
+        """replaces all entries with (id, username, token, shard) rows"""
+        with self.pool.connection() as conn:
+            conn.execute("DELETE FROM users")
+            count: int = conn.executemany(
+                "INSERT INTO users (id, username, token, shard) VALUES (?, ?, ?, ?)",
+                users,
+            ).rowcount
+            conn.execute("UPDATE layout SET shards = ? WHERE id = 0", (shards,))
+        self.cache.clear()
+        return count
+
+
+class ShardedDatabase:
+    """
+    Database over several files, with the same methods, so AsyncDatabase and
+    the server take either. A method with a token runs on the shard of its
+    user, an unknown token goes to the first shard, which answers it the way
+    a single Database would.
+
+    Adding, deleting and rotating the token of a user write to a shard and the
+    directory one after another. A crash in between leaves a user the
+    directory doesn't point to, rebalance rebuilds the directory from the
+    shards.
+    """
+
+    def __init__(
+        self,
+        directory_path: str,
+        shard_paths: list[str],
+        pool_size: int = 5,
+        profile: StorageProfile = DEFAULT_PROFILE,
+        group_commit: Optional[GroupCommit] = None,
+        password_hashing: PasswordHashing = DEFAULT_PASSWORD_HASHING,
+        shared: bool = False,
+    ) -> None:
+        self.password_hashing: PasswordHashing = password_hashing
+        self.shared: bool = shared
+        # one for all files, so the metrics add up like for a single Database
+        self.stats: DatabaseStats = DatabaseStats()
+        self.directory: Directory = Directory(
+            directory_path, pool_size, profile, self.stats, shared
+        )
+        self.shards: list[Database] = [
+            Database(
+                path,
+                pool_size,
+                profile,
+                group_commit=group_commit,
+                password_hashing=password_hashing,
+                shared=shared,
+                stats=self.stats,
+            )
+            for path in shard_paths
+        ]
+
+    @property
+    def dummy_password_hash(self) -> str:
+        return self.shards[0].dummy_password_hash
+
+    @property
+    def writer_threads(self) -> int:
+        """writes AsyncDatabase may run at once, the shards write in parallel"""
+        return sum(shard.writer_threads for shard in self.shards)
+
+    def _shard(self, token: str) -> Database:
+        shard: Optional[int] = self.directory.shard_of_token(token)
+        return self.shards[shard if shard is not None else 0]
+
+    def _user_shard(self, user_id: int) -> Database:
+        return self.shards[shard_for(user_id, len(self.shards))]
+
+    def cached_ordered_elements(
+        self, token: str
+    ) -> Optional[tuple[list[Element], list[Element]]]:
+        shard: Optional[int] = self.directory.cache.probe(token)
+        if shard is None:
+            return None
+        return self.shards[shard].cached_ordered_elements(token)
+
+    def is_token_cached(self, token: str) -> bool:
+        shard: Optional[int] = self.directory.cache.probe(token)
+        return shard is not None and self.shards[shard].is_token_cached(token)
+
+    def close(self) -> None:
+        for shard in self.shards:
+            shard.close()
+        self.directory.close()
+
+    def init_database(self) -> None:
+        self.directory.init(len(self.shards))
+        for shard in self.shards:
+            shard.init_database()
+
+    def get_schema_version(self) -> int:
+        return min(shard.get_schema_version() for shard in self.shards)
+
+    def migrate(self) -> int:
+        return min(shard.migrate() for shard in self.shards)
+
+    def add_user(self, username: str, password: str) -> None:
+        self.add_user_hash(username, hash_password(password, self.password_hashing))
+
+    def add_user_hash(
+        self,
+        username: str,
+        password_hash: str,
+        user_id: Optional[int] = None,
+        token: Optional[str] = None,
+    ) -> None:
+        token = token or str(uuid.uuid4())
+        user_id, shard = self.directory.add(username, token, len(self.shards), user_id)
+        try:
+            self.shards[shard].add_user_hash(username, password_hash, user_id, token)
+        except BaseException:
+            self.directory.remove(user_id)
+            raise
+
+    def get_user_id(self, token: str) -> int:
+        return self._shard(token).get_user_id(token)
+
+    def add_element(self, data: ElementData, token: str) -> bool:
+        return self._shard(token).add_element(data, token)
+
+    def add_elements(self, data: list[ElementData], token: str) -> int:
+        return self._shard(token).add_elements(data, token)
+
+    def change_state_of_element(
+        self, state: Literal["work", "done"], element_id: int, token: str
+    ) -> bool:
+        return self._shard(token).change_state_of_element(state, element_id, token)
+
+    def get_elements_from_token(self, token: str) -> list[ElementData]:
+        return self._shard(token).get_elements_from_token(token)
+
+    def get_element_records(self, token: str) -> list[Element]:
+        return self._shard(token).get_element_records(token)
+
+    def iter_elements(self, token: str, chunk_size: int = 500) -> Iterator[ElementData]:
+        return self._shard(token).iter_elements(token, chunk_size)
+
+    def get_token_from_credentials(self, username: str, password: str) -> str:
+        row: Optional[tuple[str, int, str]] = self.get_credentials(username)
+        if not self.verify_credentials(password, row) or row is None:
+            raise InvalidCredentialsError("user with this credentials  does not exists")
+
+        if password_needs_rehash(row[2], self.password_hashing):
+            self.set_password_hash(
+                row[1], row[2], hash_password(password, self.password_hashing)
+            )
+        return self.accept_credentials(row)
+
+    def get_credentials(self, username: str) -> Optional[tuple[str, int, str]]:
+        shard: Optional[int] = self.directory.shard_of_username(username)
+        if shard is None:
+            return None
+        return self.shards[shard].get_credentials(username)
+
+    def verify_credentials(
+        self, password: str, row: Optional[tuple[str, int, str]]
+    ) -> bool:
+        return self.shards[0].verify_credentials(password, row)
+
+    def accept_credentials(self, row: tuple[str, int, str]) -> str:
+        shard: int = shard_for(row[1], len(self.shards))
+        self.directory.cache.put(row[0], shard)
+        return self.shards[shard].accept_credentials(row)
+
+    def set_password_hash(self, user_id: int, old_hash: str, new_hash: str) -> None:
+        self._user_shard(user_id).set_password_hash(user_id, old_hash, new_hash)
+
+    def delete_element(self, token: str, id: int) -> bool:
+        return self._shard(token).delete_element(token, id)
+
+    def get_elements_page(
+        self,
+        token: str,
+        window: tuple[str, str],
+        filters: ElementFilter = ElementFilter(),
+        limit: Optional[int] = None,
+        after: Optional[PageCursor] = None,
+    ) -> tuple[list[ElementData], Optional[PageCursor]]:
+        return self._shard(token).get_elements_page(
+            token, window, filters, limit, after
+        )
+
+    def get_elements_json(
+        self, token: str, window: tuple[str, str], compact: bool = False
+    ) -> bytes:
+        return self._shard(token).get_elements_json(token, window, compact)
+
+    def get_changes(self, token: str, since: int) -> ChangeSet:
+        return self._shard(token).get_changes(token, since)
+
+    def get_data_version(self, token: str) -> tuple[int, int]:
+        return self._shard(token).get_data_version(token)
+
+    def get_ordered_elements(self, token: str) -> tuple[list[Element], list[Element]]:
+        return self._shard(token).get_ordered_elements(token)
+
+    def get_data_versions(self, user_ids: list[int]) -> dict[int, int]:
+        by_shard: dict[int, list[int]] = {}
+        for user_id in user_ids:
+            by_shard.setdefault(shard_for(user_id, len(self.shards)), []).append(
+                user_id
+            )
+        versions: dict[int, int] = {}
+        for shard, ids in by_shard.items():
+            versions.update(self.shards[shard].get_data_versions(ids))
+        return versions
+
+    def record_login_attempt(
+        self, username: str, attempts: int, period: float, now: Optional[float] = None
+    ) -> float:
+        # counted in one place, the username may not belong to any user
+        return self.shards[0].record_login_attempt(username, attempts, period, now)
+
+    def delete_user(self, token: str) -> None:
+        self._shard(token).delete_user(token)
+        self.directory.remove_token(token)
+
+    def rotate_token(self, token: str) -> str:
+        new_token: str = self._shard(token).rotate_token(token)
+        self.directory.set_token(token, new_token)
+        return new_token
+
+    def is_token_valid(self, token: Optional[str]) -> bool:
+        if token is None:
+            return False
+        return self._shard(token).is_token_valid(token)
+
+
+def move_user(
+    source: Database, target: Database, user: tuple[int, str, str, str]
+) -> int:
+    """
+    moves a user with all its elements from `source` to `target`, returns the
+    number of elements. Elements get new ids in `target`, so its change log of
+    the user is dropped and its data version raised past every version a
+    client may ask for changes since, and /changes answers with a reset.
+    """
+    user_id: int = user[0]
+    with source.pool.connection() as conn:
+        rows: list[tuple[str, str, int, str, int]] = conn.execute(
+            """
+            SELECT type, lesson, date, comment, done FROM data
+            WHERE user_id = ? ORDER BY id
+            """,
+            (user_id,),
+        ).fetchall()
+        version: Optional[tuple[int]] = conn.execute(
+            "SELECT version FROM data_versions WHERE user_id = ?", (user_id,)
+        ).fetchone()
+
+    with target.pool.connection() as conn:
+        cursor: Cursor = conn.cursor()
+        # a run stopped after copying copies again
+        cursor.execute("DELETE FROM data WHERE user_id = ?", (user_id,))
+        cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
+        cursor.execute(
+            "INSERT INTO users (id, username, password, token) VALUES (?, ?, ?, ?)",
+            user,
+        )
+        cursor.executemany(
+            """
+            INSERT INTO data (type, lesson, date, comment, done, user_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            [(*row, user_id) for row in rows],
+        )
+        cursor.execute("DELETE FROM data_changes WHERE user_id = ?", (user_id,))
+        cursor.execute(
+            """
+            INSERT INTO data_versions (user_id, version) VALUES (?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET version = MAX(version, excluded.version)
+            """,
+            (
+                user_id,
+                (version[0] if version is not None else 0) + CHANGE_LOG_SIZE + 1,
+            ),
+        )
+
+    with source.pool.connection() as conn:
+        conn.execute("DELETE FROM data WHERE user_id = ?", (user_id,))
+        conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+        conn.execute("DELETE FROM data_versions WHERE user_id = ?", (user_id,))
+        conn.execute("DELETE FROM data_changes WHERE user_id = ?", (user_id,))
+    return len(rows)
+
+
+def rebalance(
+    sources: list[str], directory_path: str, targets: list[str]
+) -> tuple[int, int]:
+    """
+    moves every user of the `sources` files to its shard in `targets` and
+    rebuilds the directory from the targets, returns (users, elements) moved.
+    Sources that are not one of the targets are left without users.
+    """
+    target_paths: list[str] = [os.path.abspath(path) for path in targets]
+    shards: list[Database] = [Database(path, pool_size=1) for path in targets]
+    moved_users: int = 0
+    moved_elements: int = 0
+    try:
+        for shard in shards:
+            shard.init_database()
+
+        for source_path in sources:
+            source_index: Optional[int] = (
+                target_paths.index(os.path.abspath(source_path))
+                if os.path.abspath(source_path) in target_paths
+                else None
+            )
+            source: Database = (
+                shards[source_index]
+                if source_index is not None
+                else Database(source_path, pool_size=1)
+            )
+            try:
+                source.migrate()
+                with source.pool.connection() as conn:
+                    users: list[tuple[int, str, str, str]] = conn.execute(
+                        "SELECT id, username, password, token FROM users ORDER BY id"
+                    ).fetchall()
+                for user in users:
+                    target_index: int = shard_for(user[0], len(shards))
+                    if target_index == source_index:
+                        continue
+                    moved_elements += move_user(source, shards[target_index], user)
+                    moved_users += 1
+            finally:
+                if source_index is None:
+                    source.close()
+
+        directory: Directory = Directory(directory_path, pool_size=1)
+        try:
+            directory.init(len(shards))
+            directory.replace(
+                (
+                    (user_id, username, token, index)
+                    for index, shard in enumerate(shards)
+                    for user_id, username, token in shard_users(shard)
+                ),
+                len(shards),
+            )
+        finally:
+            directory.close()
+    finally:
+        for shard in shards:
+            shard.close()
+    return moved_users, moved_elements
+
+
+def shard_users(shard: Database) -> list[tuple[int, str, str]]:
+    with shard.pool.connection() as conn:
+        return conn.execute("SELECT id, username, token FROM users").fetchall()
+
+
+def current_sources(database: str) -> list[str]:
+    """
+    the files holding the users now: the shards of the layout in the directory,
+    or the unsharded database before the first run
+    """
+    directory_path, _ = shard_paths(database, 1)
+    if os.path.exists(directory_path):
+        directory: Directory = Directory(directory_path, pool_size=1)
+        try:
+            shards: Optional[int] = directory.shards()
+        finally:
+            directory.close()
+        if shards is not None:
+            return [
+                path
+                for path in shard_paths(database, shards)[1]
+                if os.path.exists(path)
+            ]
+    return [database] if os.path.exists(database) else []
+
+
+def remove_database(path: str) -> None:
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def reshard(
+    database: str, shards: int, sources: Optional[list[str]] = None
+) -> tuple[int, int]:
+    """
+    rebalance into `shards` files named after `database`, from `sources` or
+    else from the files holding the users now, returns (users, elements) moved
+    """
+    directory_path, targets = shard_paths(database, shards)
+    current: list[str] = sources or current_sources(database)
+    moved: tuple[int, int] = rebalance(current, directory_path, targets)
+    if not sources:
+        # shards dropped by shrinking are empty now, the unsharded database is kept
+        for path in current:
+            if path != database and path not in targets:
+                remove_database(path)
+    return moved
+
+
+def main() -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(
+        description="moves the users of a database into shard files"
+    )
+    parser.add_argument("database", help="path the server is given with --database")
+    parser.add_argument("--shards", type=int, required=True)
+    parser.add_argument(
+        "--source",
+        nargs="+",
+        help="files to take users from, the existing shards or else the database",
+    )
+    args: argparse.Namespace = parser.parse_args()
+
+    users, elements = reshard(args.database, args.shards, args.source)
+    print(f"moved {users} users with {elements} elements into {args.shards} shards")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import gzip
+import os
+import shutil
+import tempfile
+
+from assets import (
+    IMMUTABLE,
+    REVALIDATE,
+    StaticAssets,
+    choose_encoding,
+    hashed_name,
+    rewrite_references,
+)
+
+
+def make_frontend() -> str:
+    directory: str = tempfile.mkdtemp()
+    files: dict[str, str] = {
+        "index.html": '<link rel="stylesheet" href="/style.css">\n'
+        '<script src="/script.js"></script>\n'
+        '<a href="https://example.com/other.js">x</a>',
+        "script.js": "console.log('hello')\n" * 50,
+        "style.css": "body { color: red; }\n" * 50,
+    }
+    for name, content in files.items():
+        with open(os.path.join(directory, name), "w") as file:
+            file.write(content)
+    return directory
+
+
+def test_choose_encoding() -> None:
+    available: list[str] = ["br", "gzip"]
+    assert choose_encoding("gzip, deflate, br", available) == "br"
+    assert choose_encoding("gzip, deflate, br", ["gzip"]) == "gzip"
+    assert choose_encoding("br;q=0.5, gzip", available) == "gzip"
+    assert choose_encoding("gzip;q=0, br;q=0", available) is None
+    assert choose_encoding("*", ["gzip"]) == "gzip"
+    assert choose_encoding("identity", available) is None
+    assert choose_encoding("", available) is None
+
+
+def test_rewrite_references() -> None:
+    html: bytes = b'<script src="/script.js"></script><img src="/logo.png">'
+    rewritten: bytes = rewrite_references(html, {"script.js": "/static/script.1.js"})
+    assert (
+        rewritten == b'<script src="/static/script.1.js"></script><img src="/logo.png">'
+    )
+
+
+def test_static_assets_build() -> None:
+    directory: str = make_frontend()
+    try:
+        static: StaticAssets = StaticAssets(directory)
+        static.build()
+
+        with open(os.path.join(directory, "script.js"), "rb") as file:
+            script: bytes = file.read()
+        url: str = "/static/" + hashed_name("script.js", script)
+        assert static.urls["script.js"] == url
+
+        hashed = static.get(url)
+        assert hashed is not None
+        assert hashed.cache_control == IMMUTABLE
+        assert hashed.content_type.startswith("text/javascript")
+        body, encoding = hashed.negotiate("gzip")
+        assert encoding == "gzip"
+        assert gzip.decompress(body) == script
+        assert hashed.negotiate("") == (script, None)
+
+        plain = static.get("/script.js")
+        assert plain is not None
+        assert plain.cache_control == REVALIDATE
+        assert plain.etag == hashed.etag
+
+        index = static.get("/")
+        assert index is not None
+        assert index.cache_control == REVALIDATE
+        assert url.encode() in index.body
+        assert static.urls["style.css"].encode() in index.body
+        assert b"https://example.com/other.js" in index.body
+        assert b'"/script.js"' not in index.body
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_static_assets_hash_changes_with_content() -> None:
+    directory: str = make_frontend()
+    try:
+        static: StaticAssets = StaticAssets(directory)
+        static.build()
+        before: str = static.urls["style.css"]
+
+        with open(os.path.join(directory, "style.css"), "a") as file:
+            file.write("p { color: blue; }\n")
+        static.build()
+
+        assert static.urls["style.css"] != before
+        assert static.get(before) is None
+        index = static.get("/")
+        assert index is not None
+        assert static.urls["style.css"].encode() in index.body
+    finally:
+        shutil.rmtree(directory)
@@ -1,17 +1,54 @@
+import asyncio
+import base64
+import json
 import os
 import sqlite3
+import random
+import threading
+from datetime import date, datetime
 from sqlite3 import Connection, Cursor
-from typing import Any, Literal
-
-from db_stuff import Database, ElementData, LessonTypes, InvalidCredentialsError
+from typing import Any, Callable, Iterator, Literal, Optional, cast
+
+from db_stuff import (
+    AsyncDatabase,
+    CHANGE_LOG_SIZE,
+    ChangeSet,
+    Database,
+    Element,
+    ELEMENT_FIELDS,
+    ElementFilter,
+    GroupCommit,
+    ElementData,
+    LessonTypes,
+    InvalidCredentialsError,
+    InvalidTokenError,
+    MIGRATIONS,
+    NO_DATE,
+    OrderedElements,
+    OrderingCache,
+    PageCursor,
+    ROLLBACK_PROFILE,
+    StorageProfile,
+    TokenCache,
+    PasswordHashing,
+    hash_password,
+    password_needs_rehash,
+    verify_password,
+)
+from ordering import arrange, three_day_window
 
 
 class Utils:
     testDBPath: str = "test_db.sqlite"
 
     def delete_db(self) -> None:
-        if self.check_file_exists(self.testDBPath):
-            os.remove(self.testDBPath)
+        for path in (
+            self.testDBPath,
+            self.testDBPath + "-wal",
+            self.testDBPath + "-shm",
+        ):
+            if self.check_file_exists(path):
+                os.remove(path)
 
     def check_file_exists(self, path: str) -> bool:
         exists: bool = os.path.exists(path)
@@ -103,9 +140,9 @@ def test_database_initial_table_data_structure() -> None:
         (0, "id", "INTEGER", 0, None, 1),
         (1, "type", "TEXT", 1, None, 0),
         (2, "lesson", "TEXT", 1, None, 0),
-        (3, "date", "TEXT", 1, None, 0),
+        (3, "date", "INTEGER", 1, None, 0),
         (4, "comment", "TEXT", 0, None, 0),
-        (5, "state", "BOOLEAN", 1, None, 0),
+        (5, "done", "BOOLEAN", 1, None, 0),
         (6, "user_id", "INTEGER", 1, None, 0),
     ]
 
@@ -146,18 +183,22 @@ def test_database_add_user_correct_data() -> None:
     correct_id: int = 1
     correct_username: str = "rys"
     correct_password: str = "kowalski"
-    correct_data_witchout_token: list[tuple[int, str, str]] = [
-        (correct_id, correct_username, correct_password)
+    correct_data_witchout_token: list[tuple[int, str]] = [
+        (correct_id, correct_username)
     ]
 
     db.add_user(correct_username, correct_password)
-    cursor.execute("SELECT id, username, password FROM users")
+    cursor.execute("SELECT id, username FROM users")
     row = cursor.fetchall()
-    cursor.execute("SELECT token FROM users WHERE username=?", (correct_username,))
-    token = cursor.fetchone()[0]
+    cursor.execute(
+        "SELECT token, password FROM users WHERE username=?", (correct_username,)
+    )
+    token, password_hash = cursor.fetchone()
 
     assert row == correct_data_witchout_token
     assert type(token) is str
+    assert correct_password not in password_hash
+    assert verify_password(correct_password, password_hash)
     utils.delete_db()
 
 
@@ -199,9 +240,9 @@ def test_database_add_element() -> None:
             correctID,
             correctType,
             correctLesson,
-            correctDate,
+            date(1232, 12, 31).toordinal(),
             correctComment,
-            correctState,
+            0,
             correctUserID,
         )
     ]
@@ -250,6 +291,100 @@ def test_database_get_token_from_credentials_throws_error() -> None:
     utils.delete_db()
 
 
+def test_hash_password() -> None:
+    cost: PasswordHashing = PasswordHashing(n=2**10)
+    password_hash: str = hash_password("kowalski", cost)
+
+    assert password_hash.startswith("scrypt$1024$8$1$")
+    assert hash_password("kowalski", cost) != password_hash  # salted
+    assert verify_password("kowalski", password_hash)
+    assert not verify_password("Kowalski", password_hash)
+    assert not verify_password("kowalski", "kowalski")
+    assert verify_password("kowalski", "plain$kowalski")
+    assert not verify_password("Kowalski", "plain$kowalski")
+    assert password_needs_rehash("plain$kowalski", cost)
+    assert not password_needs_rehash(password_hash, cost)
+    assert password_needs_rehash(password_hash, PasswordHashing(n=2**11))
+    assert password_needs_rehash("kowalski", cost)
+
+
+def test_database_rehashes_password_with_new_cost() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath, password_hashing=PasswordHashing(n=2**10))
+    db.init_database()
+    db.add_user("username", "password")
+    db.close()
+
+    db = Database(utils.testDBPath, password_hashing=PasswordHashing(n=2**11))
+    token: str = db.get_token_from_credentials("username", "password")
+
+    password_hash: str = cast(tuple[str, int, str], db.get_credentials("username"))[2]
+    assert password_hash.startswith("scrypt$2048$")
+    assert db.get_token_from_credentials("username", "password") == token
+    db.close()
+    utils.delete_db()
+
+
+def test_database_migrate_marks_plaintext_passwords() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath)
+    db.init_database()
+    with db.pool.connection() as conn:
+        conn.execute(
+            "INSERT INTO users (username, password, token) VALUES ('old', 'secret', 't')"
+        )
+        # schema version 7 marks the passwords, they are hashed on login
+        conn.execute("PRAGMA user_version = 6")
+
+    db.migrate()
+
+    row: tuple[str, int, str] = cast(tuple[str, int, str], db.get_credentials("old"))
+    assert row[2] == "plain$secret"
+    gotError: bool = False
+    try:
+        db.get_token_from_credentials("old", "wrong")
+    except InvalidCredentialsError:
+        gotError = True
+    assert gotError
+    assert cast(tuple[str, int, str], db.get_credentials("old"))[2] == "plain$secret"
+
+    assert db.get_token_from_credentials("old", "secret") == "t"
+    password_hash: str = cast(tuple[str, int, str], db.get_credentials("old"))[2]
+    assert password_hash.startswith("scrypt$")
+    assert verify_password("secret", password_hash)
+    db.close()
+    utils.delete_db()
+
+
+def test_async_database_logs_in_on_hasher_threads() -> None:
+    utils.delete_db()
+    db: AsyncDatabase = AsyncDatabase(
+        Database(utils.testDBPath, password_hashing=PasswordHashing(n=2**10)),
+        hashers=2,
+    )
+
+    async def scenario() -> tuple[list[str], int]:
+        await db.init_database()
+        await db.add_user("username", "password")
+        tokens: list[str] = await asyncio.gather(
+            *(db.get_token_from_credentials("username", "password") for _ in range(4))
+        )
+        rejected: int = 0
+        for username, password in (("username", "wrong"), ("nobody", "password")):
+            try:
+                await db.get_token_from_credentials(username, password)
+            except InvalidCredentialsError:
+                rejected += 1
+        return tokens, rejected
+
+    tokens, rejected = asyncio.run(scenario())
+
+    assert len(set(tokens)) == 1
+    assert rejected == 2
+    db.close()
+    utils.delete_db()
+
+
 def test_database_get_elements_from_token() -> None:
     utils.delete_db()
     db: Database = Database(utils.testDBPath)
@@ -270,7 +405,7 @@ def test_database_get_elements_from_token() -> None:
         "id": 2,
         "lesson": "angielski",
         "state": "work",
-        "date": "2026-15-16",
+        "date": "2026-12-16",
         "type": "kartk",
         "comment": "epickier comment",
     }
@@ -289,7 +424,7 @@ def test_database_get_elements_from_token() -> None:
             "id": 2,
             "lesson": "angielski",
             "state": "work",
-            "date": "2026-15-16",
+            "date": "2026-12-16",
             "type": "kartk",
             "comment": "epickier comment",
         },
@@ -383,3 +518,1173 @@ def test_database_is_token_valid() -> None:
     assert db.is_token_valid(validToken)
     assert not db.is_token_valid(invalidToken)
     utils.delete_db()
+
+
+def test_database_reuses_pooled_connection() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath, pool_size=2)
+    db.init_database()
+
+    with db.pool.connection() as first:
+        pass
+    with db.pool.connection() as second:
+        pass
+
+    assert first is second
+    db.close()
+    utils.delete_db()
+
+
+def test_database_pool_is_bounded() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath, pool_size=2)
+    db.init_database()
+
+    first: Connection = db.pool.acquire()
+    second: Connection = db.pool.acquire()
+    db.pool.release(first)
+    third: Connection = db.pool.acquire()
+
+    assert first is third
+    assert first is not second
+    db.pool.release(second)
+    db.pool.release(third)
+    db.close()
+    utils.delete_db()
+
+
+def test_database_close_closes_connections() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath)
+    db.init_database()
+    with db.pool.connection() as conn:
+        pass
+
+    db.close()
+
+    closed: bool = False
+    try:
+        conn.execute("SELECT 1")
+    except sqlite3.ProgrammingError:
+        closed = True
+
+    assert closed
+    assert db.is_token_valid("token") is False
+    db.close()
+    utils.delete_db()
+
+
+def test_database_applies_storage_profile() -> None:
+    utils.delete_db()
+    profile: StorageProfile = StorageProfile(busy_timeout=1234, cache_size=-4096)
+    db: Database = Database(utils.testDBPath, profile=profile)
+    db.init_database()
+
+    with db.pool.connection() as conn:
+        journal_mode: str = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        synchronous: int = conn.execute("PRAGMA synchronous").fetchone()[0]
+        busy_timeout: int = conn.execute("PRAGMA busy_timeout").fetchone()[0]
+        cache_size: int = conn.execute("PRAGMA cache_size").fetchone()[0]
+
+    assert journal_mode == "wal"
+    assert synchronous == 1  # NORMAL
+    assert busy_timeout == 1234
+    assert cache_size == -4096
+    db.close()
+    utils.delete_db()
+
+
+def test_database_rollback_profile() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath, profile=ROLLBACK_PROFILE)
+    db.init_database()
+
+    with db.pool.connection() as conn:
+        journal_mode: str = conn.execute("PRAGMA journal_mode").fetchone()[0]
+
+    assert journal_mode == "delete"
+    db.close()
+    utils.delete_db()
+
+
+def test_storage_profile_rejects_unknown_mode() -> None:
+    gotError: bool = False
+    try:
+        StorageProfile(journal_mode="WAL; DROP TABLE users")  # type: ignore
+    except ValueError:
+        gotError = True
+
+    assert gotError
+
+
+def test_database_reader_not_blocked_by_writer() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath)
+    db.init_database()
+    db.add_user("username", "password")
+    token: str = db.get_token_from_credentials("username", "password")
+
+    with db.pool.connection() as writer:
+        writer.execute("BEGIN IMMEDIATE")
+        writer.execute("DELETE FROM users")
+        # the pending write is invisible to, and does not block, readers
+        valid: bool = db.is_token_valid(token)
+        writer.rollback()
+
+    assert valid
+    db.close()
+    utils.delete_db()
+
+
+def test_database_init_applies_migrations() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath)
+
+    db.init_database()
+
+    assert db.get_schema_version() == len(MIGRATIONS)
+    db.close()
+    utils.delete_db()
+
+
+def test_database_migrate_is_idempotent() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath)
+    db.init_database()
+
+    version: int = db.migrate()
+
+    assert version == len(MIGRATIONS)
+    db.close()
+    utils.delete_db()
+
+
+def test_database_migrate_upgrades_old_schema() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath)
+    db.init_database()
+    with db.pool.connection() as conn:
+        conn.execute("DROP INDEX users_username")
+        conn.execute("PRAGMA user_version = 2")
+
+    db.migrate()
+
+    with db.pool.connection() as conn:
+        cursor: Cursor = conn.cursor()
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type='index' AND name='users_username'"
+        )
+        row = cursor.fetchone()
+    assert row is not None
+    assert db.get_schema_version() == len(MIGRATIONS)
+    db.close()
+    utils.delete_db()
+
+
+def test_database_migrate_stores_days_and_done() -> None:
+    utils.delete_db()
+    conn: Connection = sqlite3.connect(utils.testDBPath)
+    cursor: Cursor = conn.cursor()
+    # the data table as it was before dates became day numbers
+    cursor.execute(
+        """
+        CREATE TABLE users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL,
+            password TEXT NOT NULL,
+            token TEXT NOT NULL
+        )
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE data (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            type TEXT NOT NULL,
+            lesson TEXT NOT NULL,
+            date TEXT NOT NULL,
+            comment TEXT,
+            state BOOLEAN NOT NULL,
+            user_id INTEGER NOT NULL,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+        """
+    )
+    for migration in MIGRATIONS[:5]:
+        migration(cursor)
+    cursor.execute("PRAGMA user_version = 5")
+    cursor.execute("INSERT INTO users VALUES (1, 'username', 'password', 'token')")
+    cursor.executemany(
+        "INSERT INTO data VALUES (?, 'homework', 'polski', ?, '', ?, 1)",
+        [(1, "2026-03-02", "work"), (2, "", "done"), (3, "1232-12-31", "done")],
+    )
+    cursor.execute("DELETE FROM data WHERE id = 3")
+    conn.commit()
+    conn.close()
+
+    db: Database = Database(utils.testDBPath)
+    db.init_database()
+
+    assert [
+        (e["id"], e["date"], e["state"]) for e in db.get_elements_from_token("token")
+    ] == [
+        (1, "2026-03-02", "work"),
+        (2, "", "done"),
+    ]
+    version: int = db.get_data_version("token")[1]
+    db.add_element(make_element(0, "2026-03-03"), "token")
+    # the change triggers came back and ids of deleted elements are not reused
+    assert db.get_data_version("token")[1] == version + 1
+    assert [e["id"] for e in db.get_elements_from_token("token")] == [1, 2, 4]
+    with db.pool.connection() as conn:
+        plan: str = str(
+            conn.execute(
+                """
+                EXPLAIN QUERY PLAN SELECT 1 FROM data
+                WHERE user_id = ? AND done = 0 AND date BETWEEN ? AND ?
+                """,
+                (1, 1, 2),
+            ).fetchall()
+        )
+    assert "data_user_done_date (user_id=? AND done=? AND date>? AND date<?)" in plan
+    db.close()
+    utils.delete_db()
+
+
+def test_database_add_element_rejects_invalid_date() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath)
+    db.init_database()
+    db.add_user("username", "password")
+    token: str = db.get_token_from_credentials("username", "password")
+
+    for add in (
+        lambda: db.add_element(make_element(0, "2026-15-16"), token),
+        lambda: db.add_elements(
+            [make_element(0, "2026-01-01"), make_element(0, "2026-02-30")], token
+        ),
+    ):
+        gotError: bool = False
+        try:
+            add()
+        except ValueError:
+            gotError = True
+        assert gotError
+
+    assert db.get_elements_from_token(token) == []
+    db.close()
+    utils.delete_db()
+
+
+def test_database_token_lookup_uses_index() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath)
+    db.init_database()
+
+    with db.pool.connection() as conn:
+        token_plan: str = str(
+            conn.execute(
+                "EXPLAIN QUERY PLAN SELECT id FROM users WHERE token = ?", ("t",)
+            ).fetchall()
+        )
+        data_plan: str = str(
+            conn.execute(
+                "EXPLAIN QUERY PLAN SELECT id FROM data WHERE user_id = ?", (1,)
+            ).fetchall()
+        )
+
+    assert "users_token" in token_plan
+    assert "data_user_done_date" in data_plan
+    db.close()
+    utils.delete_db()
+
+
+def test_database_add_user_rejects_duplicate_username() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath)
+    db.init_database()
+    db.add_user("username", "password")
+
+    gotError: bool = False
+    try:
+        db.add_user("username", "other password")
+    except sqlite3.IntegrityError:
+        gotError = True
+
+    assert gotError
+    db.close()
+    utils.delete_db()
+
+
+def test_database_add_element_invalid_token() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath)
+    db.init_database()
+    db.add_user("username", "password")
+    token: str = db.get_token_from_credentials("username", "password")
+    element: ElementData = {
+        "id": 1,
+        "lesson": "biznes i zarządzanie",
+        "state": "work",
+        "date": "1232-12-31",
+        "type": "homework",
+        "comment": "epic comment",
+    }
+
+    assert db.add_element(element, token)
+    assert not db.add_element(element, "invalid token")
+    assert len(db.get_elements_from_token(token)) == 1
+    db.close()
+    utils.delete_db()
+
+
+def test_database_element_of_other_user_is_not_changed() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath)
+    db.init_database()
+    db.add_user("owner", "password")
+    db.add_user("other", "password")
+    ownerToken: str = db.get_token_from_credentials("owner", "password")
+    otherToken: str = db.get_token_from_credentials("other", "password")
+    db.add_element(
+        {
+            "id": 1,
+            "lesson": "biznes i zarządzanie",
+            "state": "work",
+            "date": "1232-12-31",
+            "type": "homework",
+            "comment": "epic comment",
+        },
+        ownerToken,
+    )
+    elementID: int = db.get_elements_from_token(ownerToken)[0]["id"]
+
+    assert not db.change_state_of_element("done", elementID, otherToken)
+    assert not db.delete_element(otherToken, elementID)
+    assert db.get_elements_from_token(ownerToken)[0]["state"] == "work"
+    assert db.change_state_of_element("done", elementID, ownerToken)
+    assert db.delete_element(ownerToken, elementID)
+    db.close()
+    utils.delete_db()
+
+
+def test_database_get_elements_from_invalid_token() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath)
+    db.init_database()
+    db.add_user("username", "password")
+    token: str = db.get_token_from_credentials("username", "password")
+
+    gotError: bool = False
+    try:
+        db.get_elements_from_token("invalid token")
+    except InvalidTokenError:
+        gotError = True
+
+    assert gotError
+    assert db.get_elements_from_token(token) == []
+    db.close()
+    utils.delete_db()
+
+
+def test_token_cache_counts_hits_and_misses() -> None:
+    cache: TokenCache = TokenCache()
+
+    assert cache.get("token") is None
+    cache.put("token", 7)
+    assert cache.get("token") == 7
+
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    assert cache.probe("other") is None
+    assert cache.probe("token") == 7
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_token_cache_expires_entries() -> None:
+    now: list[float] = [0.0]
+    cache: TokenCache = TokenCache(ttl=10, clock=lambda: now[0])
+    cache.put("token", 7)
+
+    now[0] = 9.0
+    assert cache.get("token") == 7
+    now[0] = 10.0
+    assert cache.get("token") is None
+
+
+def test_token_cache_is_bounded() -> None:
+    cache: TokenCache = TokenCache(maxsize=2)
+    cache.put("first", 1)
+    cache.put("second", 2)
+    cache.get("first")
+
+    cache.put("third", 3)
+
+    assert cache.get("second") is None
+    assert cache.get("first") == 1
+    assert cache.get("third") == 3
+
+
+def test_database_serves_token_from_cache() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath)
+    db.init_database()
+    db.add_user("username", "password")
+    token: str = db.get_token_from_credentials("username", "password")
+
+    assert db.is_token_valid(token)
+    assert db.get_user_id(token) == 1
+    assert db.token_cache.hits == 2
+    assert db.token_cache.misses == 0
+    db.close()
+    utils.delete_db()
+
+
+def test_async_database_counts_a_token_miss_once() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath)
+    db.init_database()
+    db.add_user("username", "password")
+    token: str = db.get_token_from_credentials("username", "password")
+    db.token_cache.clear()
+    database: AsyncDatabase = AsyncDatabase(db, readers=1)
+
+    async def use() -> None:
+        assert await database.is_token_valid(token)
+        assert await database.is_token_valid(token)
+
+    asyncio.run(use())
+    assert db.stats.snapshot()["cache_misses"] == {"token": 1}
+    assert db.stats.snapshot()["cache_hits"] == {"token": 1}
+    assert db.stats.snapshot()["cache_entries"] == {"token": 1}
+    database.close()
+    utils.delete_db()
+
+
+def test_database_delete_user_invalidates_cached_token() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath)
+    db.init_database()
+    db.add_user("username", "password")
+    token: str = db.get_token_from_credentials("username", "password")
+    assert db.is_token_valid(token)
+
+    db.delete_user(token)
+
+    assert not db.is_token_valid(token)
+    db.close()
+    utils.delete_db()
+
+
+def test_database_rotate_token() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath)
+    db.init_database()
+    db.add_user("username", "password")
+    oldToken: str = db.get_token_from_credentials("username", "password")
+    assert db.is_token_valid(oldToken)
+
+    newToken: str = db.rotate_token(oldToken)
+
+    assert newToken != oldToken
+    assert not db.is_token_valid(oldToken)
+    assert db.is_token_valid(newToken)
+    assert db.get_token_from_credentials("username", "password") == newToken
+    db.close()
+    utils.delete_db()
+
+
+def make_element(
+    id: int,
+    date: str,
+    type: Literal["homework", "kartk", "sprawdz"] = "homework",
+    state: Literal["work", "done"] = "work",
+) -> ElementData:
+    return {
+        "id": id,
+        "type": type,
+        "lesson": "polski",
+        "date": date,
+        "comment": "",
+        "state": state,
+    }
+
+
+def make_record(
+    id: int,
+    date: str,
+    type: Literal["homework", "kartk", "sprawdz"] = "homework",
+    state: Literal["work", "done"] = "work",
+) -> Element:
+    return Element.from_data(make_element(id, date, type, state))
+
+
+def display(elements: list[ElementData], now: datetime) -> list[ElementData]:
+    """the elements in the order ordering.arrange shows them"""
+    ordered: OrderedElements = OrderedElements(
+        [Element.from_data(element) for element in elements]
+    )
+    return [element.to_data() for element in arrange(ordered.work, ordered.done, now)]
+
+
+def test_element_round_trips_element_data() -> None:
+    data: ElementData = {
+        "id": 7,
+        "type": "kartk",
+        "lesson": "biznes i zarządzanie",
+        "date": "1232-12-31",
+        "comment": "epic comment",
+        "state": "done",
+    }
+    element: Element = Element.from_data(data)
+
+    assert element.type == 1
+    assert element.done
+    assert element.to_data() == data
+    assert element == Element.from_data(data)
+    assert element.with_state(False).to_data() == {**data, "state": "work"}
+    assert json.loads(element.to_json()) == data
+    assert json.loads(element.to_json(compact=True)) == list(data.values())
+    assert element.to_json() is element.to_json()  # encoded once per record
+    assert element.with_state(False).to_json() != element.to_json()
+    assert element == Element.from_data(data)
+    undated: ElementData = {**data, "date": ""}
+    assert Element.from_data(undated).date == NO_DATE
+    assert Element.from_data(undated).to_data() == undated
+    gotError: bool = False
+    try:
+        element.extra = 1  # type: ignore[attr-defined]
+    except AttributeError:
+        gotError = True
+    assert gotError
+
+
+def test_ordered_elements_sorts_by_date_and_type() -> None:
+    ordered: OrderedElements = OrderedElements(
+        [
+            make_record(1, "2026-01-02"),
+            make_record(2, "2026-01-01", "homework", "done"),
+            make_record(3, "2026-01-02", "sprawdz"),
+            make_record(4, "2026-01-02", "kartk"),
+            make_record(5, "2026-01-01"),
+        ]
+    )
+
+    assert [e.id for e in ordered.work] == [5, 3, 4, 1]
+    assert [e.id for e in ordered.done] == [2]
+
+
+def test_ordered_elements_incremental_updates() -> None:
+    ordered: OrderedElements = OrderedElements(
+        [make_record(1, "2026-01-01"), make_record(2, "2026-01-03")]
+    )
+
+    ordered.insert(make_record(3, "2026-01-02"))
+    ordered.set_state(1, "done")
+    ordered.remove(2)
+
+    assert [e.id for e in ordered.work] == [3]
+    assert [e.id for e in ordered.done] == [1]
+    assert ordered.done[0].done
+    assert len(ordered) == 2
+
+
+def test_database_get_ordered_elements_follows_writes() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath)
+    db.init_database()
+    db.add_user("username", "password")
+    token: str = db.get_token_from_credentials("username", "password")
+    db.add_element(make_element(0, "2026-01-03"), token)
+    db.add_element(make_element(0, "2026-01-01"), token)
+    assert [e.id for e in db.get_ordered_elements(token)[0]] == [2, 1]
+
+    db.add_element(make_element(0, "2026-01-02", "sprawdz"), token)
+    db.change_state_of_element("done", 2, token)
+    db.delete_element(token, 1)
+
+    work, done = db.get_ordered_elements(token)
+    assert [e.id for e in work] == [3]
+    assert [e.id for e in done] == [2]
+    # the cached ordering matches a fresh one built from the table
+    assert (work, done) == (
+        OrderedElements(db.get_element_records(token)).work,
+        OrderedElements(db.get_element_records(token)).done,
+    )
+    db.close()
+    utils.delete_db()
+
+
+def test_database_ordering_cache_with_a_read_before_the_update() -> None:
+    utils.delete_db()
+    db: Database
+
+    class ReadFirst(OrderingCache):
+        """loads the entry after a write is committed, before it is applied"""
+
+        def update(self, token: str, change: Callable[[OrderedElements], None]) -> None:
+            db.get_ordered_elements(token)
+            super().update(token, change)
+
+    db = Database(utils.testDBPath, ordering_cache=ReadFirst())
+    db.init_database()
+    db.add_user("username", "password")
+    token: str = db.get_token_from_credentials("username", "password")
+
+    db.add_element(make_element(0, "2026-01-01"), token)
+    assert [e.id for e in db.get_ordered_elements(token)[0]] == [1]
+    db.change_state_of_element("done", 1, token)
+    assert [e.id for e in db.get_ordered_elements(token)[1]] == [1]
+    db.delete_element(token, 1)
+    assert db.get_ordered_elements(token) == ([], [])
+    db.close()
+    utils.delete_db()
+
+
+def test_database_ordering_cache_is_bounded() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath)
+    db.ordering_cache.maxsize = 1
+    db.init_database()
+    db.add_user("first", "password")
+    db.add_user("second", "password")
+    firstToken: str = db.get_token_from_credentials("first", "password")
+    secondToken: str = db.get_token_from_credentials("second", "password")
+
+    db.get_ordered_elements(firstToken)
+    db.get_ordered_elements(secondToken)
+
+    assert db.ordering_cache.partitions(firstToken) is None
+    assert db.ordering_cache.partitions(secondToken) == ([], [])
+    db.close()
+    utils.delete_db()
+
+
+def test_shared_database_sees_writes_of_other_processes() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath, shared=True)
+    other: Database = Database(utils.testDBPath)  # another worker
+    db.init_database()
+    db.add_user("username", "password")
+    token: str = db.get_token_from_credentials("username", "password")
+    db.add_element(make_element(0, "2026-01-01"), token)
+
+    work, _ = db.get_ordered_elements(token)
+    assert len(work) == 1
+    other.add_element(make_element(0, "2026-01-02"), token)
+    work, _ = db.get_ordered_elements(token)
+    assert [element.to_data()["date"] for element in work] == [
+        "2026-01-01",
+        "2026-01-02",
+    ]
+    # unchanged data is still served from the cache
+    assert db.ordering_cache.partitions(token, db.get_data_version(token)[1])
+
+    new_token: str = other.rotate_token(token)
+    assert not db.is_token_valid(token)
+    assert db.is_token_valid(new_token)
+    other.close()
+    db.close()
+    utils.delete_db()
+
+
+def test_database_get_data_versions() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath)
+    db.init_database()
+    db.add_user("first", "password")
+    db.add_user("second", "password")
+    token: str = db.get_token_from_credentials("first", "password")
+    db.add_elements([make_element(0, "2026-01-01")] * 2, token)
+    user_id: int = db.get_user_id(token)
+
+    assert db.get_data_versions([]) == {}
+    assert db.get_data_versions([user_id, user_id + 1]) == {
+        user_id: db.get_data_version(token)[1]
+    }
+    db.close()
+    utils.delete_db()
+
+
+def test_database_record_login_attempt() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath)
+    other: Database = Database(utils.testDBPath)
+    db.init_database()
+
+    assert db.record_login_attempt("username", 2, 60, now=100) == 0
+    assert other.record_login_attempt("username", 2, 60, now=110) == 0
+    assert db.record_login_attempt("username", 2, 60, now=120) == 40
+    assert other.record_login_attempt("someone else", 2, 60, now=120) == 0
+    assert db.record_login_attempt("username", 2, 60, now=160) == 0
+    assert db.record_login_attempt("username", 2, 60, now=161) == 9
+    other.close()
+    db.close()
+    utils.delete_db()
+
+
+def test_async_database_runs_methods_off_the_event_loop() -> None:
+    utils.delete_db()
+    db: AsyncDatabase = AsyncDatabase(Database(utils.testDBPath), readers=2)
+
+    async def scenario() -> tuple[bool, list[Element], bool]:
+        await db.init_database()
+        await db.add_user("username", "password")
+        token: str = await db.get_token_from_credentials("username", "password")
+        added: list[bool] = await asyncio.gather(
+            *(
+                db.add_element(make_element(0, f"2026-01-{day:02}"), token)
+                for day in range(1, 11)
+            )
+        )
+        work, _ = await db.get_ordered_elements(token)
+        return all(added), work, await db.is_token_valid("invalid token")
+
+    added, work, invalidValid = asyncio.run(scenario())
+
+    assert added
+    assert [e.to_data()["date"] for e in work] == [
+        f"2026-01-{day:02}" for day in range(1, 11)
+    ]
+    assert not invalidValid
+    db.close()
+    utils.delete_db()
+
+
+def test_database_group_commit_batches_concurrent_writes() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath, group_commit=GroupCommit(max_delay=0.05))
+    db.init_database()
+    db.add_user("username", "password")
+    token: str = db.get_token_from_credentials("username", "password")
+    assert db.writer is not None
+    batchesBefore: int = db.writer.batches
+
+    threads: list[threading.Thread] = [
+        threading.Thread(
+            target=db.add_element, args=(make_element(0, "2026-01-01"), token)
+        )
+        for _ in range(20)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(db.get_elements_from_token(token)) == 20
+    assert db.writer.batches - batchesBefore < 20
+    db.close()
+    utils.delete_db()
+
+
+def test_database_group_commit_isolates_failing_write() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath, group_commit=GroupCommit(max_delay=0.05))
+    db.init_database()
+    errors: list[Exception] = []
+
+    def add_user(username: str) -> None:
+        try:
+            db.add_user(username, "password")
+        except sqlite3.IntegrityError as error:
+            errors.append(error)
+
+    threads: list[threading.Thread] = [
+        threading.Thread(target=add_user, args=(username,))
+        for username in ["first", "taken", "taken", "second"]
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(errors) == 1
+    for username in ["first", "taken", "second"]:
+        assert db.get_token_from_credentials(username, "password")
+    db.close()
+    utils.delete_db()
+
+
+def test_database_group_commit_restarts_after_close() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath, group_commit=GroupCommit())
+    db.init_database()
+    db.add_user("first", "password")
+
+    db.close()
+    db.add_user("second", "password")
+
+    assert db.get_token_from_credentials("second", "password")
+    db.close()
+    utils.delete_db()
+
+
+def test_database_add_elements() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath)
+    db.init_database()
+    db.add_user("username", "password")
+    token: str = db.get_token_from_credentials("username", "password")
+    db.get_ordered_elements(token)
+
+    added: int = db.add_elements(
+        [make_element(0, f"2026-01-{day:02}") for day in range(1, 6)], token
+    )
+
+    assert added == 5
+    assert [e.id for e in db.get_ordered_elements(token)[0]] == [1, 2, 3, 4, 5]
+    db.close()
+    utils.delete_db()
+
+
+def test_database_add_elements_invalid_token() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath)
+    db.init_database()
+
+    gotError: bool = False
+    try:
+        db.add_elements([make_element(0, "2026-01-01")], "invalid token")
+    except InvalidTokenError:
+        gotError = True
+
+    assert gotError
+    db.close()
+    utils.delete_db()
+
+
+def test_database_iter_elements() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath)
+    db.init_database()
+    db.add_user("username", "password")
+    token: str = db.get_token_from_credentials("username", "password")
+    db.add_elements([make_element(0, "2026-01-01") for _ in range(7)], token)
+
+    elements: list[ElementData] = list(db.iter_elements(token, chunk_size=3))
+
+    assert elements == db.get_elements_from_token(token)
+    gotError: bool = False
+    try:
+        db.iter_elements("invalid token")
+    except InvalidTokenError:
+        gotError = True
+    assert gotError
+    db.close()
+    utils.delete_db()
+
+
+def test_database_iter_elements_does_not_hold_a_connection() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath, pool_size=1)
+    db.init_database()
+    db.add_user("username", "password")
+    token: str = db.get_token_from_credentials("username", "password")
+    db.add_elements([make_element(0, "2026-01-01") for _ in range(7)], token)
+
+    # slow downloads between chunks leave the only connection to other calls
+    exports: list[Iterator[ElementData]] = [
+        db.iter_elements(token, chunk_size=3) for _ in range(2)
+    ]
+    for export in exports:
+        assert next(export)["id"] == 1
+    assert db.get_data_version(token) == (1, 7)
+
+    db.delete_element(token, 5)
+    db.add_element(make_element(0, "2026-01-02"), token)
+    assert [element["id"] for element in exports[0]] == [2, 3, 4, 6, 7, 8]
+    db.close()
+    utils.delete_db()
+
+
+def test_database_data_version_grows_with_changes() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath)
+    db.init_database()
+    db.add_user("username", "password")
+    db.add_user("other", "password")
+    token: str = db.get_token_from_credentials("username", "password")
+    otherToken: str = db.get_token_from_credentials("other", "password")
+    versions: list[int] = [db.get_data_version(token)[1]]
+
+    db.add_element(make_element(0, "2026-01-01"), token)
+    versions.append(db.get_data_version(token)[1])
+    db.change_state_of_element("done", 1, token)
+    versions.append(db.get_data_version(token)[1])
+    db.add_elements([make_element(0, "2026-01-02")], token)
+    versions.append(db.get_data_version(token)[1])
+    db.delete_element(token, 1)
+    versions.append(db.get_data_version(token)[1])
+
+    assert versions == sorted(set(versions))
+    assert versions[0] == 0
+    assert db.get_data_version(otherToken) == (2, 0)
+    db.close()
+    utils.delete_db()
+
+
+def test_database_data_version_unchanged_by_failed_write() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath)
+    db.init_database()
+    db.add_user("username", "password")
+    token: str = db.get_token_from_credentials("username", "password")
+    db.add_element(make_element(0, "2026-01-01"), token)
+    version: tuple[int, int] = db.get_data_version(token)
+
+    db.change_state_of_element("done", 2, token)
+    db.delete_element(token, 2)
+
+    assert db.get_data_version(token) == version
+    gotError: bool = False
+    try:
+        db.get_data_version("invalid token")
+    except InvalidTokenError:
+        gotError = True
+    assert gotError
+    db.close()
+    utils.delete_db()
+
+
+def read_all_pages(
+    db: Database,
+    token: str,
+    window: tuple[str, str],
+    filters: ElementFilter,
+    limit: int,
+) -> list[ElementData]:
+    elements: list[ElementData] = []
+    after: Optional[PageCursor] = None
+    while True:
+        page, after = db.get_elements_page(token, window, filters, limit, after)
+        assert len(page) <= limit
+        elements.extend(page)
+        if after is None:
+            return elements
+        after = PageCursor.decode(after.encode())
+
+
+def test_database_get_elements_page_matches_display_order() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath)
+    db.init_database()
+    db.add_user("username", "password")
+    token: str = db.get_token_from_credentials("username", "password")
+    rng: random.Random = random.Random(7)
+    db.add_elements(
+        [
+            make_element(
+                0,
+                f"2026-03-{rng.randint(1, 20):02}",
+                rng.choice(["homework", "kartk", "sprawdz"]),
+                rng.choice(["work", "done"]),
+            )
+            for _ in range(60)
+        ],
+        token,
+    )
+    elements: list[ElementData] = db.get_elements_from_token(token)
+
+    for now in (datetime(2026, 3, 5, 12), datetime(2026, 5, 1, 12)):
+        window: tuple[str, str] = three_day_window(now)
+        expected: list[ElementData] = display(elements, now)
+
+        for limit in (1, 7, 100):
+            assert read_all_pages(db, token, window, ElementFilter(), limit) == expected
+    db.close()
+    utils.delete_db()
+
+
+def test_database_get_elements_page_filters() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath)
+    db.init_database()
+    db.add_user("username", "password")
+    token: str = db.get_token_from_credentials("username", "password")
+    db.add_elements(
+        [
+            make_element(0, "2026-03-01", "kartk", "work"),
+            make_element(0, "2026-03-02", "homework", "work"),
+            make_element(0, "2026-03-03", "kartk", "done"),
+            make_element(0, "2026-03-09", "kartk", "work"),
+        ],
+        token,
+    )
+    window: tuple[str, str] = three_day_window(datetime(2026, 3, 1, 12))
+
+    page, after = db.get_elements_page(
+        token,
+        window,
+        ElementFilter(state="work", type="kartk", date_to="2026-03-05"),
+    )
+
+    assert [e["id"] for e in page] == [1]
+    assert after is None
+    page, _ = db.get_elements_page(
+        token, window, ElementFilter(date_from="2026-03-02", date_to="2026-03-03")
+    )
+    assert [e["id"] for e in page] == [2, 3]
+    db.close()
+    utils.delete_db()
+
+
+def test_database_get_elements_json_matches_display_order() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath)
+    db.init_database()
+    db.add_user("username", "password")
+    token: str = db.get_token_from_credentials("username", "password")
+    rng: random.Random = random.Random(11)
+    elements: list[ElementData] = [
+        make_element(
+            0,
+            f"2026-03-{rng.randint(1, 20):02}",
+            rng.choice(["homework", "kartk", "sprawdz"]),
+            rng.choice(["work", "done"]),
+        )
+        for _ in range(40)
+    ]
+    elements[0]["comment"] = 'zadanie "3" \\ żółw\n'
+    db.add_elements(elements, token)
+    elements = db.get_elements_from_token(token)
+
+    for now in (datetime(2026, 3, 5, 12), datetime(2026, 5, 1, 12)):
+        window: tuple[str, str] = three_day_window(now)
+        expected: list[ElementData] = display(elements, now)
+
+        assert json.loads(db.get_elements_json(token, window)) == expected
+        assert json.loads(db.get_elements_json(token, window, compact=True)) == [
+            [element[field] for field in ELEMENT_FIELDS] for element in expected
+        ]
+
+    gotError: bool = False
+    try:
+        db.get_elements_json("invalid token", three_day_window(datetime.now()))
+    except InvalidTokenError:
+        gotError = True
+    assert gotError
+    db.close()
+    utils.delete_db()
+
+
+def test_page_cursor_rejects_garbage() -> None:
+    gotError: bool = False
+    try:
+        PageCursor.decode("not a cursor")
+    except ValueError:
+        gotError = True
+
+    assert gotError
+
+    for values in (
+        [1, 0, 0, 1e30, 0, 1],
+        [1, 0, 0, 739000, 0, 2**63],
+        [1, 0, 0, 739000, 3, 1],
+        [1, 0, 0, -1, 0, 1],
+        [1, 0, 0, float("inf"), 0, 1],
+        [1, 0, 0, 739000, 0],
+    ):
+        cursor: str = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+        gotError = False
+        try:
+            PageCursor.decode(cursor)
+        except ValueError:
+            gotError = True
+        assert gotError, values
+
+
+def test_database_get_changes() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath)
+    db.init_database()
+    db.add_user("username", "password")
+    token: str = db.get_token_from_credentials("username", "password")
+    db.add_elements([make_element(0, "2026-01-01") for _ in range(3)], token)
+    since: int = db.get_data_version(token)[1]
+
+    db.change_state_of_element("done", 1, token)
+    db.delete_element(token, 2)
+    db.add_element(make_element(0, "2026-01-02"), token)
+    db.add_element(make_element(0, "2026-01-03"), token)
+    db.delete_element(token, 5)
+    changes: ChangeSet = db.get_changes(token, since)
+
+    assert changes["version"] == db.get_data_version(token)[1]
+    assert not changes["reset"]
+    assert [(e["id"], e["state"]) for e in changes["changed"]] == [
+        (1, "done"),
+        (4, "work"),
+    ]
+    assert changes["deleted"] == [2, 5]
+    assert db.get_changes(token, changes["version"]) == {
+        "version": changes["version"],
+        "reset": False,
+        "changed": [],
+        "deleted": [],
+    }
+    db.close()
+    utils.delete_db()
+
+
+def test_database_get_changes_resets_when_log_is_pruned() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath)
+    db.init_database()
+    db.add_user("username", "password")
+    token: str = db.get_token_from_credentials("username", "password")
+    db.add_elements(
+        [make_element(0, "2026-01-01") for _ in range(CHANGE_LOG_SIZE + 5)], token
+    )
+    version: int = db.get_data_version(token)[1]
+
+    assert db.get_changes(token, 0)["reset"]
+    assert db.get_changes(token, version + 1)["reset"]
+    assert len(db.get_changes(token, version - CHANGE_LOG_SIZE)["changed"]) == (
+        CHANGE_LOG_SIZE
+    )
+    with db.pool.connection() as conn:
+        logged: int = conn.execute("SELECT COUNT(*) FROM data_changes").fetchone()[0]
+    assert logged == CHANGE_LOG_SIZE
+    db.close()
+    utils.delete_db()
+
+
+def test_database_stats() -> None:
+    utils.delete_db()
+    db: Database = Database(utils.testDBPath)
+    db.init_database()
+    db.add_user("username", "password")
+    token: str = db.get_token_from_credentials("username", "password")
+    db.add_element(make_element(0, "2026-01-01"), token)
+    db.get_elements_from_token(token)
+
+    gotError: bool = False
+    try:
+        db.get_elements_from_token("not a token")
+    except InvalidTokenError:
+        gotError = True
+    assert gotError
+
+    stats: dict[str, dict[str, float]] = db.stats.snapshot()
+    assert stats["calls"]["get_elements_from_token"] == 2
+    assert stats["errors"] == {"get_elements_from_token": 1}
+    assert stats["calls"]["add_user"] == stats["calls"]["add_user_hash"] == 1
+    assert stats["calls"]["verify_credentials"] == 1
+    assert stats["calls"]["accept_credentials"] == 1
+    assert stats["seconds"]["init_database"] > 0
+    assert stats["statements"]["INSERT"] >= 2
+    assert stats["statements"]["SELECT"] >= 2
+    assert set(stats["statement_seconds"]) == set(stats["statements"])
+
+    list(db.iter_elements(token))
+    assert db.stats.snapshot()["calls"]["iter_elements"] == 1
+    stats = db.stats.snapshot()
+
+    with db.pool.connection() as conn:
+        conn.execute("SELECT 1")
+        conn.cursor().execute("SELECT 2")
+    assert (
+        db.stats.snapshot()["statements"]["SELECT"] == stats["statements"]["SELECT"] + 2
+    )
+    db.close()
+    utils.delete_db()
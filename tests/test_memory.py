@@ -0,0 +1,213 @@
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+from typing import Any, Callable, Literal, Optional
+
+from db_stuff import (
+    CHANGE_LOG_SIZE,
+    Database,
+    ElementData,
+    ElementFilter,
+    InvalidTokenError,
+    LESSONS,
+    PageCursor,
+    PasswordHashing,
+    Storage,
+    hash_password,
+)
+from memory import MemoryDatabase
+
+FAST_HASHING: PasswordHashing = PasswordHashing(n=2**4)
+WINDOW: tuple[str, str] = ("2026-03-10", "2026-03-12")
+
+
+def random_element(rng: random.Random) -> ElementData:
+    return {
+        "id": 0,
+        "type": rng.choice(["homework", "kartk", "sprawdz"]),
+        "lesson": rng.choice(LESSONS[:3]),  # type: ignore[typeddict-item]
+        "date": f"2026-03-{rng.randint(1, 20):02}",
+        "comment": rng.choice(["", "zadanie 5", 'cytat "ą"']),
+        "state": rng.choice(["work", "work", "done"]),
+    }
+
+
+def outcome(call: Callable[[], Any]) -> Any:
+    """the result of a call, or the type of the error it raised"""
+    try:
+        return call()
+    except (LookupError, sqlite3.IntegrityError) as error:
+        return type(error)
+
+
+def all_pages(
+    db: Storage, token: str, filters: ElementFilter, limit: int
+) -> list[list[ElementData]]:
+    pages: list[list[ElementData]] = []
+    after: Optional[PageCursor] = None
+    while True:
+        page, after = db.get_elements_page(token, WINDOW, filters, limit, after)
+        pages.append(page)
+        if after is None:
+            return pages
+
+
+def test_memory_database_answers_like_sqlite() -> None:
+    directory: str = tempfile.mkdtemp()
+    try:
+        sqlite: Database = Database(
+            os.path.join(directory, "db.sqlite"), password_hashing=FAST_HASHING
+        )
+        sqlite.init_database()
+        memory: MemoryDatabase = MemoryDatabase(password_hashing=FAST_HASHING)
+        memory.init_database()
+        engines: list[Storage] = [sqlite, memory]
+        rng: random.Random = random.Random(7)
+
+        def same(call: Callable[[Storage], Any]) -> Any:
+            results: list[Any] = [outcome(lambda: call(db)) for db in engines]
+            assert results[0] == results[1]
+            return results[0]
+
+        password_hash: str = hash_password("password", FAST_HASHING)
+        for user in range(3):
+            same(
+                lambda db: db.add_user_hash(
+                    f"user{user}", password_hash, token=f"token{user}"
+                )
+            )
+        same(lambda db: db.add_user("user0", "again"))
+        tokens: list[str] = [
+            same(lambda db: db.get_token_from_credentials(f"user{user}", "password"))
+            for user in range(3)
+        ]
+        tokens.append("not a token")
+        assert same(lambda db: db.get_token_from_credentials("nobody", "password"))
+
+        versions: dict[str, int] = {token: 0 for token in tokens}
+        for step in range(400):
+            token: str = rng.choice(tokens)
+            action: int = rng.randrange(5)
+            if action == 0:
+                element: ElementData = random_element(rng)
+                same(lambda db: db.add_element(element, token))
+            elif action == 1:
+                elements: list[ElementData] = [random_element(rng) for _ in range(3)]
+                same(lambda db: db.add_elements(elements, token))
+            elif action == 2:
+                state: Literal["work", "done"] = rng.choice(["work", "done"])
+                element_id: int = rng.randint(1, step + 1)
+                same(lambda db: db.change_state_of_element(state, element_id, token))
+            elif action == 3:
+                element_id = rng.randint(1, step + 1)
+                same(lambda db: db.delete_element(token, element_id))
+            else:
+                version = same(lambda db: db.get_data_version(token))
+                if isinstance(version, tuple):
+                    since: int = versions[token]
+                    same(lambda db: db.get_changes(token, since))
+                    versions[token] = version[1]
+
+        filters: list[ElementFilter] = [
+            ElementFilter(),
+            ElementFilter(state="work", type="homework"),
+            ElementFilter(lesson=LESSONS[0], date_from="2026-03-05"),  # type: ignore
+            ElementFilter(date_to="2026-03-11"),
+        ]
+        for token in tokens:
+            same(lambda db: db.get_elements_from_token(token))
+            same(lambda db: db.get_element_records(token))
+            same(lambda db: db.get_ordered_elements(token))
+            same(lambda db: db.get_elements_json(token, WINDOW))
+            same(lambda db: db.get_elements_json(token, WINDOW, True))
+            same(lambda db: db.get_elements_json(token, ("2026-05-01", "2026-05-03")))
+            same(lambda db: db.get_changes(token, 0))
+            same(lambda db: db.get_changes(token, 10**6))
+            same(lambda db: list(db.iter_elements(token)))
+            for element_filter in filters:
+                for limit in (1, 7):
+                    same(lambda db: all_pages(db, token, element_filter, limit))
+        same(lambda db: db.get_data_versions([1, 2, 3, 4]))
+
+        same(lambda db: db.record_login_attempt("user0", 2, 60, now=100))
+        same(lambda db: db.record_login_attempt("user0", 2, 60, now=110))
+        same(lambda db: db.record_login_attempt("user0", 2, 60, now=120))
+
+        for db in engines:
+            new_token: str = db.rotate_token(tokens[0])
+            assert not db.is_token_valid(tokens[0])
+            assert db.get_user_id(new_token) == 1
+            db.delete_user(new_token)
+            assert not db.is_token_valid(new_token)
+        same(lambda db: db.rotate_token("not a token"))
+        sqlite.close()
+        memory.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_memory_database_change_log() -> None:
+    db: MemoryDatabase = MemoryDatabase(password_hashing=FAST_HASHING)
+    db.add_user("username", "password")
+    token: str = db.get_token_from_credentials("username", "password")
+    element: ElementData = random_element(random.Random(1))
+    db.add_elements([element] * (CHANGE_LOG_SIZE + 5), token)
+
+    assert db.get_changes(token, 4)["reset"]
+    changes = db.get_changes(token, 5)
+    assert not changes["reset"]
+    assert len(changes["changed"]) == CHANGE_LOG_SIZE
+
+    gotError: bool = False
+    try:
+        db.get_changes("not a token", 0)
+    except InvalidTokenError:
+        gotError = True
+    assert gotError
+
+
+def test_memory_database_snapshot() -> None:
+    directory: str = tempfile.mkdtemp()
+    try:
+        path: str = os.path.join(directory, "db.json")
+        db: MemoryDatabase = MemoryDatabase(path, password_hashing=FAST_HASHING)
+        assert not db.snapshot()  # nothing changed yet
+        db.add_user("username", "password")
+        token: str = db.get_token_from_credentials("username", "password")
+        db.add_elements([random_element(random.Random(i)) for i in range(5)], token)
+        db.delete_element(token, 2)
+        db.close()
+
+        reopened: MemoryDatabase = MemoryDatabase(path, password_hashing=FAST_HASHING)
+        assert reopened.get_token_from_credentials("username", "password") == token
+        assert reopened.get_elements_json(token, WINDOW) == db.get_elements_json(
+            token, WINDOW
+        )
+        assert reopened.get_changes(token, 3) == db.get_changes(token, 3)
+        reopened.add_user("second", "password")
+        second: str = reopened.get_token_from_credentials("second", "password")
+        assert reopened.get_user_id(second) == 2
+        reopened.add_element(random_element(random.Random(9)), second)
+        assert reopened.get_element_records(second)[0].id == 6
+        reopened.close()
+        assert os.listdir(directory) == ["db.json"]
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_memory_database_snapshots_in_the_background() -> None:
+    directory: str = tempfile.mkdtemp()
+    try:
+        path: str = os.path.join(directory, "db.json")
+        db: MemoryDatabase = MemoryDatabase(path, 0.01, password_hashing=FAST_HASHING)
+        db.add_user("username", "password")
+        for _ in range(100):
+            if os.path.exists(path):
+                break
+            db._stop.wait(0.01)
+        assert MemoryDatabase(path).get_credentials("username") is not None
+        db.close()
+    finally:
+        shutil.rmtree(directory)
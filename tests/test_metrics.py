@@ -0,0 +1,187 @@
+import os
+import pstats
+import shutil
+import tempfile
+import threading
+import time
+
+from metrics import (
+    Histogram,
+    MetricsExchange,
+    RequestMetrics,
+    SlowRequestProfiler,
+    StackSampler,
+    database_lines,
+    format_labels,
+    render,
+)
+
+
+def test_format_labels() -> None:
+    assert format_labels({}) == ""
+    assert format_labels({"method": "GET", "route": "/"}) == '{method="GET",route="/"}'
+    assert format_labels({"a": 'say "hi"\\\n'}) == '{a="say \\"hi\\"\\\\\\n"}'
+
+
+def test_histogram() -> None:
+    histogram: Histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value)
+
+    assert histogram.lines("latency", {"route": "/"}) == [
+        'latency_bucket{route="/",le="0.1"} 2',
+        'latency_bucket{route="/",le="1"} 3',
+        'latency_bucket{route="/",le="+Inf"} 4',
+        'latency_sum{route="/"} 3.65',
+        'latency_count{route="/"} 4',
+    ]
+
+
+def test_request_metrics() -> None:
+    metrics: RequestMetrics = RequestMetrics((0.1,))
+    metrics.started()
+    metrics.started()
+    metrics.finished("GET", "/get_data", 200, 0.01)
+    lines: list[str] = metrics.lines()
+
+    assert "http_requests_in_flight 1" in lines
+    assert (
+        'http_request_duration_seconds_count{method="GET",route="/get_data"} 1' in lines
+    )
+    assert (
+        'http_responses_total{method="GET",route="/get_data",status="200"} 1' in lines
+    )
+    assert "# TYPE http_request_duration_seconds histogram" in lines
+
+
+def test_database_lines() -> None:
+    lines: list[str] = database_lines(
+        {
+            "calls": {"add_user": 2},
+            "errors": {},
+            "seconds": {"add_user": 0.5},
+            "statements": {"INSERT": 3},
+            "statement_seconds": {"INSERT": 0.25},
+            "cache_hits": {"token": 4},
+            "cache_misses": {"token": 1},
+            "cache_entries": {"token": 1},
+        }
+    )
+    assert 'db_calls_total{method="add_user"} 2' in lines
+    assert 'db_call_seconds_total{method="add_user"} 0.5' in lines
+    assert 'db_statements_total{kind="INSERT"} 3' in lines
+    assert "# TYPE db_call_errors_total counter" in lines
+    assert 'db_cache_hits_total{cache="token"} 4' in lines
+    assert 'db_cache_misses_total{cache="token"} 1' in lines
+    assert "# TYPE db_cache_entries gauge" in lines
+
+
+def test_request_metrics_merge() -> None:
+    first: RequestMetrics = RequestMetrics((0.1,))
+    second: RequestMetrics = RequestMetrics((0.1,))
+    first.started()
+    first.finished("GET", "/get_data", 200, 0.01)
+    second.started()
+    second.started()
+    second.finished("GET", "/get_data", 200, 0.5)
+
+    merged: RequestMetrics = RequestMetrics((0.1,))
+    merged.merge(first.snapshot())
+    merged.merge(second.snapshot())
+    lines: list[str] = merged.lines()
+
+    assert "http_requests_in_flight 1" in lines
+    assert (
+        'http_request_duration_seconds_bucket{method="GET",route="/get_data",le="0.1"}'
+        " 1" in lines
+    )
+    assert (
+        'http_request_duration_seconds_count{method="GET",route="/get_data"} 2' in lines
+    )
+    assert (
+        'http_responses_total{method="GET",route="/get_data",status="200"} 2' in lines
+    )
+
+
+def test_render_adds_up_workers() -> None:
+    snapshot: dict = {
+        "requests": RequestMetrics().snapshot(),
+        "database": {"calls": {"add_user": 1}, "statements": {"INSERT": 2}},
+        "gauges": {"event_streams": 3},
+    }
+    page: str = render([snapshot, snapshot], {"event_streams": "Open streams."})
+
+    assert 'db_calls_total{method="add_user"} 2\n' in page
+    assert 'db_statements_total{kind="INSERT"} 4\n' in page
+    assert "# TYPE event_streams gauge\nevent_streams 6\n" in page
+
+
+def test_metrics_exchange() -> None:
+    directory: str = tempfile.mkdtemp()
+    try:
+        exchange: MetricsExchange = MetricsExchange(directory)
+        exchange.publish({"gauges": {"event_streams": 1}})
+        assert exchange.collect() == []  # only other workers
+
+        # the parent of this process stands in for another worker
+        other: str = os.path.join(directory, f"{os.getppid()}.json")
+        shutil.copy(exchange.path, other)
+        # no process has a pid this large, its worker is gone
+        gone: str = os.path.join(directory, f"{2**22 + 1}.json")
+        shutil.copy(exchange.path, gone)
+
+        assert exchange.collect() == [{"gauges": {"event_streams": 1}}]
+        assert not os.path.exists(gone)
+
+        exchange.remove()
+        assert os.listdir(directory) == [os.path.basename(other)]
+    finally:
+        shutil.rmtree(directory)
+
+
+def sleep_in_thread(seconds: float) -> None:
+    time.sleep(seconds)
+
+
+def test_stack_sampler_sees_other_threads() -> None:
+    worker: threading.Thread = threading.Thread(
+        target=sleep_in_thread, args=(0.2,), name="worker"
+    )
+    sampler: StackSampler = StackSampler(0.01)
+    sampler.start()
+    worker.start()
+    worker.join()
+    stacks: dict[str, int] = sampler.stop()
+
+    sleeping: list[str] = [stack for stack in stacks if stack.startswith("worker;")]
+    assert sleeping
+    assert "sleep_in_thread (test_metrics.py:" in sleeping[0]
+    assert not any(stack.startswith("stack-sampler;") for stack in stacks)
+
+
+def test_slow_request_profiler() -> None:
+    directory: str = tempfile.mkdtemp()
+    try:
+        for mode in ("sample", "cprofile"):
+            profiler: SlowRequestProfiler = SlowRequestProfiler(
+                0.05, directory, mode, 0.001
+            )
+            fast = profiler.begin()
+            assert fast is not None
+            assert profiler.begin() is None  # one request at a time
+            assert profiler.end(fast, "GET", "/valid", 0.01) is None
+
+            slow = profiler.begin()
+            assert slow is not None
+            time.sleep(0.02)
+            path = profiler.end(slow, "GET", "/get_data", 0.1)
+            assert path is not None
+            assert os.path.basename(path).endswith(
+                "-GET_get_data-100ms." + ("folded" if mode == "sample" else "prof")
+            )
+            if mode == "cprofile":
+                pstats.Stats(path)
+
+        assert len(os.listdir(directory)) == 2
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,182 @@
+import json
+import random
+from datetime import datetime, timedelta
+from typing import Literal, get_args
+
+from db_stuff import (
+    Element,
+    ElementData,
+    LessonTypes,
+    OrderedElements,
+    display_key,
+    display_order,
+    elements_json,
+)
+from ordering import arrange, three_day_window
+
+
+# the chained helpers get_sorted_data used before ordering.py, kept as the reference
+def legacy_sort_by_date(data: list[ElementData]) -> list[ElementData]:
+    return sorted(data, key=lambda x: x["date"])
+
+
+def legacy_sort_by_state(
+    data: list[ElementData],
+) -> tuple[list[ElementData], list[ElementData]]:
+    done_data: list[ElementData] = []
+    work_data: list[ElementData] = []
+    for element in data:
+        if element["state"] == "done":
+            work_data.append(element)
+        else:
+            done_data.append(element)
+    return work_data, done_data
+
+
+def legacy_sort_by_type(data: list[ElementData]) -> list[ElementData]:
+    sorted_data: list[ElementData] = []
+    same_day: dict[str, list[ElementData]] = {}
+    for element in data:
+        if element["date"] in same_day:
+            same_day[element["date"]].append(element)
+        else:
+            same_day[element["date"]] = [element]
+
+    for key in same_day.keys():
+        if len(same_day[key]) < 2:
+            sorted_data.append(same_day[key][0])
+            continue
+
+        sprawdz: list[ElementData] = []
+        kartk: list[ElementData] = []
+        homework: list[ElementData] = []
+        for element in same_day[key]:
+            if element["type"] == "sprawdz":
+                sprawdz.append(element)
+            elif element["type"] == "kartk":
+                kartk.append(element)
+            else:
+                homework.append(element)
+
+        sorted_data.extend(sprawdz)
+        sorted_data.extend(kartk)
+        sorted_data.extend(homework)
+
+    return sorted_data
+
+
+def legacy_check_three_days(data: list[ElementData], now: datetime) -> bool:
+    limit: datetime = now + timedelta(days=3)
+
+    for element in data:
+        dt: datetime = datetime.strptime(element["date"], "%Y-%m-%d")
+        if now <= dt <= limit:
+            return True
+    return False
+
+
+def legacy_if_thre_days_sort_diffrent(data: list[ElementData], now: datetime):
+    if legacy_check_three_days(data, now):
+        return data
+
+    homeworks: list[ElementData] = []
+    others: list[ElementData] = []
+    for element in data:
+        if element["type"] == "homework":
+            homeworks.append(element)
+        else:
+            others.append(element)
+
+    return homeworks + others
+
+
+def legacy_order(data: list[ElementData], now: datetime) -> list[ElementData]:
+    sorting: list[ElementData] = legacy_sort_by_date(data)
+    sorting = legacy_sort_by_type(sorting)
+    done_data, work_data = legacy_sort_by_state(sorting)
+    work_data = legacy_if_thre_days_sort_diffrent(work_data, now)
+    return work_data + done_data
+
+
+ElementType = Literal["homework", "kartk", "sprawdz"]
+
+
+def random_elements(rng: random.Random, now: datetime) -> list[ElementData]:
+    """elements in id order, like the database returns them, dates close to now"""
+    spread: int = rng.choice([2, 5, 30])
+    elements: list[ElementData] = []
+    for id in range(1, rng.randint(0, 40) + 1):
+        date: datetime = now + timedelta(days=rng.randint(-spread, spread))
+        elements.append(
+            {
+                "id": id,
+                "type": rng.choice(get_args(ElementType)),
+                "lesson": rng.choice(get_args(LessonTypes)),
+                "date": date.strftime("%Y-%m-%d"),
+                "comment": "",
+                "state": rng.choice(["work", "done"]),
+            }
+        )
+    return elements
+
+
+def random_now(rng: random.Random) -> datetime:
+    day: datetime = datetime(2026, 1, 1) + timedelta(days=rng.randint(0, 365))
+    if rng.random() < 0.2:
+        return day  # exactly midnight is an edge of the three day window
+    return day + timedelta(seconds=rng.randint(1, 86399))
+
+
+def test_elements_json_matches_legacy_pipeline() -> None:
+    """the body of /get_data, which Database and MemoryDatabase both serve"""
+    rng: random.Random = random.Random(2137)
+    for _ in range(2000):
+        now: datetime = random_now(rng)
+        elements: list[ElementData] = random_elements(rng, now)
+        ordered: OrderedElements = OrderedElements(
+            [Element.from_data(element) for element in elements]
+        )
+
+        body: bytes = elements_json(
+            ordered.work, ordered.done, three_day_window(now), compact=False
+        )
+        assert json.loads(body) == legacy_order(elements, now)
+
+
+def test_arrange_matches_legacy_pipeline() -> None:
+    rng: random.Random = random.Random(420)
+    for _ in range(2000):
+        now: datetime = random_now(rng)
+        elements: list[ElementData] = random_elements(rng, now)
+        ordered: OrderedElements = OrderedElements(
+            [Element.from_data(element) for element in elements]
+        )
+
+        assert [
+            element.to_data() for element in arrange(ordered.work, ordered.done, now)
+        ] == legacy_order(elements, now)
+
+
+def test_display_order_is_sorted_by_display_key() -> None:
+    """pages are cut by display_key, so it has to agree with display_order"""
+    rng: random.Random = random.Random(7)
+    for _ in range(500):
+        now: datetime = random_now(rng)
+        ordered: OrderedElements = OrderedElements(
+            [Element.from_data(element) for element in random_elements(rng, now)]
+        )
+        for upcoming in (False, True):
+            elements: list[Element] = display_order(
+                ordered.work, ordered.done, upcoming
+            )
+            assert elements == sorted(
+                elements, key=lambda element: display_key(element, upcoming)
+            )
+
+
+def test_three_day_window() -> None:
+    assert three_day_window(datetime(2026, 3, 10, 12, 30)) == (
+        "2026-03-11",
+        "2026-03-13",
+    )
+    assert three_day_window(datetime(2026, 3, 10)) == ("2026-03-10", "2026-03-13")
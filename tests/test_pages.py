@@ -0,0 +1,87 @@
+import json
+from typing import Optional
+
+from assets import Asset
+from db_stuff import ElementData
+from pages import IndexPages, fill, row_html
+
+TEMPLATE: bytes = b"""<body>
+  <div id="login-container">login</div>
+  <div id="main" class="hidden">
+    <table><tbody id="table-body"></tbody></table>
+  </div>
+  <script src="/static/script.0123456789.js"></script>
+</body>"""
+WINDOW: tuple[str, str] = ("2026-03-10", "2026-03-12")
+
+
+def make_element(id: int, comment: str) -> ElementData:
+    return {
+        "id": id,
+        "type": "kartk",
+        "lesson": "polski",
+        "date": "2026-03-09",
+        "comment": comment,
+        "state": "done",
+    }
+
+
+def test_row_html() -> None:
+    assert row_html(make_element(7, "<b>str. 5</b>")) == (
+        '<tr class="done kartk" data-id="7"><td>polski</td><td>kartk</td>'
+        "<td>09.03.2026</td><td><t>&lt;b&gt;str. 5&lt;/b&gt;</t></td>"
+        '<td><button onclick="action(7, \'done\')" class="switch_button'
+        ' action_button">switch</button></td></tr>'
+    )
+
+
+def test_fill() -> None:
+    elements: bytes = json.dumps(
+        [
+            make_element(1, "a"),
+            make_element(2, "</script>"),
+            make_element(3, "<!--<script>"),
+        ],
+        ensure_ascii=False,
+    ).encode()
+    page: Optional[bytes] = fill(TEMPLATE, 12, elements)
+    assert page is not None
+
+    assert b'<div id="login-container" class="hidden">' in page
+    assert b'<div id="main">' in page
+    assert b'<tbody id="table-body" data-version="12"><tr class="done kartk"' in page
+    assert page.count(b"</script>") == 2  # the one in the comment is escaped
+    start: int = page.index(b'type="application/json">') + 24
+    data: bytes = page[start : page.index(b"</script>", start)]
+    # "<!--" or "<script" in the data would change how the page is tokenized
+    assert b"<" not in data
+    assert json.loads(data) == json.loads(elements)
+    assert page.index(b'id="initial-data"') < page.index(b"<script src=")
+
+    assert fill(b"<body></body>", 12, elements) is None
+
+
+def test_index_pages() -> None:
+    pages: IndexPages = IndexPages(maxsize=2)
+    etag: str = pages.etag(TEMPLATE, 1, 3, WINDOW)
+    assert pages.get(1, etag) is None
+    page: Optional[Asset] = pages.render(1, etag, 3, b"[]")
+    assert page is not None
+    assert page.etag == etag
+    assert page.cache_control == "private, no-cache"
+    assert pages.get(1, etag) is page
+
+    # a change of the data or the window makes another tag
+    assert pages.get(1, pages.etag(TEMPLATE, 1, 4, WINDOW)) is None
+    assert pages.etag(TEMPLATE, 1, 3, ("2026-03-11", "2026-03-13")) != etag
+
+    for user_id in (2, 3):
+        pages.render(user_id, pages.etag(TEMPLATE, user_id, 1, WINDOW), 1, b"[]")
+    assert len(pages) == 2
+    assert pages.get(1, etag) is None
+
+    # a new template after a deploy drops every page
+    other: bytes = TEMPLATE.replace(b">login<", b">zaloguj<")
+    assert pages.etag(other, 1, 3, WINDOW) != etag
+    assert len(pages) == 0
+    assert pages.render(1, etag, 3, b"[]") is not None
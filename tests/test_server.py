@@ -0,0 +1,315 @@
+import asyncio
+import json
+import os
+import shutil
+import signal
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterator, Optional
+
+from fastapi.testclient import TestClient
+
+import server
+from db_stuff import AsyncDatabase, Database, ElementData, PasswordHashing
+from server import ChangeHub, TooManyStreamsError
+
+FAST_HASHING: PasswordHashing = PasswordHashing(n=2**4)
+
+
+def make_element(date: str, comment: str = "comment") -> ElementData:
+    return {
+        "id": 0,
+        "type": "homework",
+        "lesson": "polski",
+        "date": date,
+        "comment": comment,
+        "state": "work",
+    }
+
+
+@contextmanager
+def serve() -> Iterator[TestClient]:
+    """the app on a database of its own, logged in as "username" """
+    directory: str = tempfile.mkdtemp()
+    database, streams = server.db, server.hub
+    server.db = AsyncDatabase(
+        Database(os.path.join(directory, "db.sqlite"), password_hashing=FAST_HASHING),
+        readers=2,
+    )
+    server.hub = ChangeHub(server.MAX_EVENT_STREAMS_PER_USER)
+    try:
+        with TestClient(server.app) as client:
+            server.db.database.add_user("username", "password")
+            response = client.post(
+                "/login", json={"username": "username", "password": "password"}
+            )
+            assert response.status_code == 200
+            yield client
+    finally:
+        server.db, server.hub = database, streams
+        shutil.rmtree(directory)
+
+
+def test_add_data_bulk() -> None:
+    with serve() as client:
+        elements: list[ElementData] = [
+            make_element("2026-01-01"),
+            make_element("2026-01-02"),
+        ]
+        response = client.post("/add_data/bulk", json=elements)
+        assert response.json() == {"added": 2}
+
+        ndjson: str = "".join(json.dumps(element) + "\n" for element in elements)
+        response = client.post(
+            "/add_data/bulk",
+            content=ndjson,
+            headers={"Content-Type": "application/x-ndjson"},
+        )
+        assert response.json() == {"added": 2}
+        assert len(client.get("/get_data").json()) == 4
+
+        response = client.post("/add_data/bulk", content=b"[{", headers={})
+        assert response.status_code == 422
+        response = client.post("/add_data/bulk", json=[{"id": 0}])
+        assert response.status_code == 422
+        response = client.post("/add_data/bulk", json=[make_element("2026-02-30")])
+        assert response.status_code == 422
+        response = client.post("/add_data", json=make_element("2026-1-1"))
+        assert response.status_code == 422
+        assert len(client.get("/get_data").json()) == 4
+
+        # an empty date input is an element without a date
+        client.post("/add_data", json=make_element(""))
+        assert client.get("/get_data").json()[0]["date"] == ""
+        assert json.loads(client.get("/export").text.splitlines()[-1])["date"] == ""
+
+        client.cookies.clear()
+        response = client.post("/add_data/bulk", json=elements)
+        assert response.status_code == 401
+
+
+def test_export() -> None:
+    with serve() as client:
+        elements: list[ElementData] = [
+            make_element(f"2026-01-{day:02}", f'"{day}", ą') for day in range(1, 8)
+        ]
+        client.post("/add_data/bulk", json=elements)
+        expected: list[ElementData] = [
+            {**element, "id": id} for id, element in enumerate(elements, 1)
+        ]
+
+        response = client.get("/export")
+        assert response.headers["content-type"] == "application/x-ndjson"
+        lines: list[str] = response.text.splitlines()
+        assert [json.loads(line) for line in lines] == expected
+
+        response = client.get("/export", params={"format": "csv"})
+        assert response.headers["content-type"].startswith("text/csv")
+        lines = response.text.splitlines()
+        assert lines[0] == "id,type,lesson,date,comment,state"
+        assert lines[1] == '1,homework,polski,2026-01-01,"""1"", ą",work'
+        assert len(lines) == 8
+
+        client.cookies.clear()
+        assert client.get("/export").status_code == 401
+
+
+def test_change_hub_caps_streams_per_user() -> None:
+    hub: ChangeHub = ChangeHub(max_streams_per_user=2)
+    first: asyncio.Queue[Optional[int]] = hub.subscribe(1)
+    hub.subscribe(1)
+    assert hub.is_full(1)
+    gotError: bool = False
+    try:
+        hub.subscribe(1)
+    except TooManyStreamsError:
+        gotError = True
+    assert gotError
+    hub.subscribe(2)  # other users have their own limit
+    assert len(hub) == 3
+
+    hub.unsubscribe(1, first)
+    assert not hub.is_full(1)
+    hub.unsubscribe(1, first)  # twice, like a stream ended by close and cancelled
+    assert len(hub) == 2
+
+
+def test_change_hub_keeps_only_the_newest_version() -> None:
+    hub: ChangeHub = ChangeHub(max_streams_per_user=2)
+    slow: asyncio.Queue[Optional[int]] = hub.subscribe(1, version=3)
+    other: asyncio.Queue[Optional[int]] = hub.subscribe(2)
+
+    hub.publish(1, 3)  # the version the stream started with
+    assert slow.empty()
+    hub.publish(1, 4)
+    hub.publish(1, 6)
+    hub.publish(1, 5)  # polled by another worker after a newer write
+    hub.publish(1, 6)
+    assert slow.get_nowait() == 6
+    assert slow.empty()
+    assert other.empty()
+
+    hub.publish(1, 6)  # sent already
+    assert slow.empty()
+    hub.publish(1, 7)
+    assert slow.get_nowait() == 7
+
+
+def test_change_hub_publishes_to_every_stream_of_the_user() -> None:
+    hub: ChangeHub = ChangeHub(max_streams_per_user=2)
+    full: asyncio.Queue[Optional[int]] = hub.subscribe(1)
+    hub.publish(1, 4)
+    # the queue is full when the second stream joins
+    late: asyncio.Queue[Optional[int]] = hub.subscribe(1, version=2)
+
+    hub.publish(1, 3)
+    assert full.get_nowait() == 4
+    assert late.get_nowait() == 3
+    hub.publish(1, 5)
+    assert full.get_nowait() == 5
+    assert late.get_nowait() == 5
+
+
+def test_change_hub_close_ends_every_stream() -> None:
+    hub: ChangeHub = ChangeHub(max_streams_per_user=2)
+    full: asyncio.Queue[Optional[int]] = hub.subscribe(1)
+    idle: asyncio.Queue[Optional[int]] = hub.subscribe(2)
+    hub.publish(1, 1)
+
+    hub.close()
+    assert hub.closed
+    assert full.get_nowait() is None
+    assert idle.get_nowait() is None
+    assert len(hub) == 0
+
+
+def test_version_events() -> None:
+    streams: ChangeHub = server.hub
+    server.hub = ChangeHub(max_streams_per_user=2)
+
+    async def use() -> None:
+        events = server.version_events(1, 3)
+        assert await anext(events) == "event: version\ndata: 3\n\n"
+        server.hub.publish(1, 4)
+        assert await anext(events) == "event: version\ndata: 4\n\n"
+        # a client going away closes the generator
+        await events.aclose()
+        assert len(server.hub) == 0
+
+        events = server.version_events(1, 4)
+        await anext(events)
+        server.hub.close()
+        gotEnd: bool = False
+        try:
+            await anext(events)
+        except StopAsyncIteration:
+            gotEnd = True
+        assert gotEnd
+        assert len(server.hub) == 0
+
+    try:
+        asyncio.run(use())
+    finally:
+        server.hub = streams
+
+
+def test_shutdown_signal_ends_streams() -> None:
+    handled: list[int] = []
+    # stands in for the handler of uvicorn
+    original = signal.signal(
+        signal.SIGTERM, lambda signum, frame: handled.append(signum)
+    )
+    streams: ChangeHub = server.hub
+    server.hub = ChangeHub(max_streams_per_user=2)
+
+    async def use() -> None:
+        queue: asyncio.Queue[Optional[int]] = server.hub.subscribe(1)
+        restore = server.end_streams_on_shutdown()
+        signal.getsignal(signal.SIGTERM)(signal.SIGTERM, None)
+        assert await asyncio.wait_for(queue.get(), 1) is None
+        restore()
+
+    try:
+        asyncio.run(use())
+        assert server.hub.closed
+        # the handler that was set before runs as well and is set again
+        assert handled == [signal.SIGTERM]
+        signal.getsignal(signal.SIGTERM)(signal.SIGTERM, None)
+        assert handled == [signal.SIGTERM] * 2
+    finally:
+        signal.signal(signal.SIGTERM, original)
+        server.hub = streams
+
+
+def test_events_endpoint_refuses_streams() -> None:
+    with serve() as client:
+        for _ in range(server.MAX_EVENT_STREAMS_PER_USER):
+            server.hub.subscribe(1)
+        assert client.get("/events").status_code == 429
+
+        server.hub.close()
+        assert client.get("/events").status_code == 503
+
+        client.cookies.clear()
+        assert client.get("/events").status_code == 401
+
+
+def test_get_data_conditional_requests() -> None:
+    with serve() as client:
+        client.post("/add_data", json=make_element("2026-01-01"))
+        response = client.get("/get_data")
+        etag: str = response.headers["etag"]
+        assert response.status_code == 200
+        assert response.headers["x-data-version"] == "1"
+        assert response.headers["cache-control"] == "private, no-cache"
+        assert response.headers["vary"] == "Accept"
+
+        response = client.get("/get_data", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+        assert response.headers["cache-control"] == "private, no-cache"
+        response = client.get(
+            "/get_data", headers={"If-None-Match": f'W/"other", {etag}'}
+        )
+        assert response.status_code == 304
+
+        # compact rows are another representation with a tag of their own
+        response = client.get(
+            "/get_data",
+            headers={"If-None-Match": etag, "Accept": server.COMPACT_MEDIA_TYPE},
+        )
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+
+        client.post("/change_state", json={"state": "done", "id": 1})
+        response = client.get("/get_data", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+        assert response.headers["x-data-version"] == "2"
+        assert response.json()[0]["state"] == "done"
+
+        # answers without a tag are not stored at all
+        for path in ("/valid", "/changes?since=0"):
+            response = client.get(path)
+            assert response.headers["cache-control"] == (
+                "no-store, no-cache, must-revalidate, max-age=0"
+            )
+            assert "etag" not in response.headers
+
+        client.cookies.clear()
+        response = client.get("/get_data", headers={"If-None-Match": etag})
+        assert response.status_code == 401
+
+
+def test_data_etag_changes_with_the_window() -> None:
+    morning: datetime = datetime(2026, 3, 10, 8)
+    assert server.data_etag(1, 5, morning) == server.data_etag(
+        1, 5, datetime(2026, 3, 10, 20)
+    )
+    assert server.data_etag(1, 5, morning) != server.data_etag(
+        1, 5, datetime(2026, 3, 11, 8)
+    )
+    assert server.data_etag(1, 5, morning) != server.data_etag(2, 5, morning)
+    assert server.data_etag(1, 5, morning) != server.data_etag(1, 5, morning, True)
@@ -0,0 +1,196 @@
+import asyncio
+import os
+import shutil
+import sqlite3
+import tempfile
+from typing import Literal
+
+from db_stuff import AsyncDatabase, Database, ElementData, PasswordHashing
+from sharding import ShardedDatabase, rebalance, reshard, shard_for, shard_paths
+
+FAST_HASHING: PasswordHashing = PasswordHashing(n=2**4)
+
+
+def make_element(date: str, state: Literal["work", "done"] = "work") -> ElementData:
+    return {
+        "id": 0,
+        "type": "homework",
+        "lesson": "matematyka",
+        "date": date,
+        "comment": "comment",
+        "state": state,
+    }
+
+
+def open_sharded(path: str, shards: int) -> ShardedDatabase:
+    directory, files = shard_paths(path, shards)
+    return ShardedDatabase(directory, files, password_hashing=FAST_HASHING)
+
+
+def test_shard_paths() -> None:
+    assert shard_paths("data/database.sqlite", 2) == (
+        "data/database.directory.sqlite",
+        ["data/database.shard0.sqlite", "data/database.shard1.sqlite"],
+    )
+    assert {shard_for(user_id, 4) for user_id in range(1, 100)} == {0, 1, 2, 3}
+
+
+def test_sharded_database_routes_users_to_their_shard() -> None:
+    directory: str = tempfile.mkdtemp()
+    try:
+        db: ShardedDatabase = open_sharded(os.path.join(directory, "db.sqlite"), 3)
+        db.init_database()
+        tokens: dict[int, str] = {}
+        for user in range(12):
+            db.add_user(f"user{user}", "password")
+            token: str = db.get_token_from_credentials(f"user{user}", "password")
+            tokens[db.get_user_id(token)] = token
+            db.add_element(make_element("2026-01-01"), token)
+
+        assert sorted(tokens) == list(range(1, 13))
+        for user_id, token in tokens.items():
+            shard: Database = db.shards[shard_for(user_id, 3)]
+            assert shard.get_user_id(token) == user_id
+            assert len(shard.get_elements_from_token(token)) == 1
+        assert db.get_data_versions(list(tokens)) == {user_id: 1 for user_id in tokens}
+        # the directory and every shard report their caches in the shared stats
+        entries: dict[str, float] = db.stats.snapshot()["cache_entries"]
+        assert entries == {"shard": 12, "token": 12}
+
+        token = tokens[1]
+        element_id: int = db.get_element_records(token)[0].id
+        assert db.change_state_of_element("done", element_id, token)
+        assert db.get_ordered_elements(token)[1][0].id == element_id
+        assert db.get_data_version(token) == (1, 2)
+
+        new_token: str = db.rotate_token(token)
+        assert not db.is_token_valid(token)
+        assert db.get_user_id(new_token) == 1
+        db.delete_user(new_token)
+        assert not db.is_token_valid(new_token)
+        assert db.get_credentials("user0") is None
+
+        assert not db.is_token_valid("not a token")
+        assert not db.add_element(make_element("2026-01-01"), "not a token")
+
+        gotError: bool = False
+        try:
+            db.add_user("user1", "password")  # taken in the directory
+        except sqlite3.IntegrityError:
+            gotError = True
+        assert gotError
+        db.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_async_database_over_shards() -> None:
+    directory: str = tempfile.mkdtemp()
+    try:
+        sharded: ShardedDatabase = open_sharded(os.path.join(directory, "db.sqlite"), 2)
+        db: AsyncDatabase = AsyncDatabase(sharded)  # type: ignore[arg-type]
+        assert db._writer._max_workers == 2
+
+        async def use() -> list[int]:
+            await db.init_database()
+            await asyncio.gather(*(db.add_user(f"user{i}", "pass") for i in range(6)))
+            tokens: list[str] = [
+                await db.get_token_from_credentials(f"user{i}", "pass")
+                for i in range(6)
+            ]
+            await asyncio.gather(
+                *(db.add_element(make_element("2026-01-01"), t) for t in tokens)
+            )
+            return [len((await db.get_ordered_elements(t))[0]) for t in tokens]
+
+        assert asyncio.run(use()) == [1] * 6
+        db.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_rebalance() -> None:
+    directory: str = tempfile.mkdtemp()
+    try:
+        path: str = os.path.join(directory, "db.sqlite")
+        single: Database = Database(path, password_hashing=FAST_HASHING)
+        single.init_database()
+        tokens: list[str] = []
+        for user in range(8):
+            single.add_user(f"user{user}", "password")
+            tokens.append(single.get_token_from_credentials(f"user{user}", "password"))
+            single.add_elements([make_element("2026-01-01")] * (user + 1), tokens[-1])
+        old_version: int = single.get_data_version(tokens[0])[1]
+        single.close()
+
+        directory_path, targets = shard_paths(path, 2)
+        assert rebalance([path], directory_path, targets) == (8, 36)
+
+        db: ShardedDatabase = open_sharded(path, 2)
+        for user, token in enumerate(tokens):
+            assert len(db.get_elements_from_token(token)) == user + 1
+            assert db.get_token_from_credentials(f"user{user}", "password") == token
+        assert db.get_data_version(tokens[0])[1] > old_version
+        # the elements got new ids, so a page asking for changes loads them again
+        assert db.get_changes(tokens[0], old_version)["reset"]
+        db.add_user("new", "password")
+        assert db.get_user_id(db.get_token_from_credentials("new", "password")) == 9
+        db.close()
+
+        # growing moves only the users whose shard changed, out of the old shards
+        directory_path, more = shard_paths(path, 4)
+        moved, _ = rebalance(targets, directory_path, more)
+        assert moved == sum(
+            shard_for(user_id, 4) != shard_for(user_id, 2) for user_id in range(1, 10)
+        )
+        db = open_sharded(path, 4)
+        for user, token in enumerate(tokens):
+            assert len(db.get_elements_from_token(token)) == user + 1
+        for index, shard in enumerate(db.shards):
+            with shard.pool.connection() as conn:
+                ids: list[tuple[int]] = conn.execute("SELECT id FROM users").fetchall()
+            assert all(shard_for(user_id, 4) == index for (user_id,) in ids)
+        db.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_reshard_twice() -> None:
+    directory: str = tempfile.mkdtemp()
+    try:
+        path: str = os.path.join(directory, "db.sqlite")
+        db: ShardedDatabase = open_sharded(path, 4)
+        db.init_database()
+        tokens: list[str] = []
+        for user in range(12):
+            db.add_user(f"user{user}", "password")
+            tokens.append(db.get_token_from_credentials(f"user{user}", "password"))
+            db.add_element(make_element("2026-01-01"), tokens[-1])
+        db.close()
+
+        # shrinking removes the shards that are not used any more
+        reshard(path, 2)
+        assert sorted(os.listdir(directory)) == [
+            "db.directory.sqlite",
+            "db.shard0.sqlite",
+            "db.shard1.sqlite",
+        ]
+        db = open_sharded(path, 2)
+        for token in tokens:
+            db.add_element(make_element("2026-01-02"), token)
+        db.delete_user(tokens[0])
+        db.close()
+
+        for shards in (3, 4):
+            reshard(path, shards)
+            db = open_sharded(path, shards)
+            assert not db.is_token_valid(tokens[0])
+            assert db.get_credentials("user0") is None
+            for token in tokens[1:]:
+                dates: list[str] = [
+                    element["date"] for element in db.get_elements_from_token(token)
+                ]
+                assert sorted(dates) == ["2026-01-01", "2026-01-02"]
+            db.close()
+    finally:
+        shutil.rmtree(directory)